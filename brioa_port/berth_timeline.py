@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from typing import Dict
+
+from brioa_port.log_keeper import LogKeeper
+
+
+class BerthTimeline:
+    """
+    Finds which ships are berthed at any date/time of a span of days, from a single query.
+
+    A ship is berthed after it arrived and berthed, until it sails, as get_ship_status decides.
+    Those dates split the span into intervals, in which the same ships are berthed.
+    The intervals are found with a binary search, and the ships of each one are only selected once.
+
+    Attributes:
+        start: The start of the first day in the span.
+        end: The end of the last day in the span, exclusive.
+        ships: The ships at the port at some point of the span, as read by LogKeeper.read_ships_at_port.
+    """
+
+    def __init__(self, log_keeper: LogKeeper, first_date: datetime, last_date: datetime) -> None:
+        """
+        Reads the ships at the port in the days from the first to the last date, inclusive.
+        """
+        self.start = first_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        self.end = last_date.replace(hour=0, minute=0, second=0, microsecond=0) + relativedelta(days=1)
+        # A ship berthed at some date of a day is among the ships at the port in that day.
+        # So the ships at the port in the whole span include those of each day.
+        self.ships = log_keeper.read_ships_at_port(self.end, self.start)
+
+        # Berthed from the latest of these, exclusive, to the sailing date, inclusive.
+        # As in get_ship_status, missing dates don't delay the berthing, and a missing sailing date
+        # means it's not berthed. Both follow from missing dates becoming the smallest integer.
+        self._berthed_from = self.ships[['TA', 'TB']].max(axis=1).values.astype('datetime64[ns]').astype(np.int64)
+        self._berthed_to = self.ships['TS'].values.astype('datetime64[ns]').astype(np.int64)
+
+        self._bounds = np.unique(np.concatenate([self._berthed_from, self._berthed_to]))
+        self._berthed_ships_by_interval: Dict[int, pd.DataFrame] = {}
+
+    def covers(self, date: datetime) -> bool:
+        """
+        Whether the given date/time is within the span.
+        """
+        return self.start <= date < self.end
+
+    def get_berthed_ships(self, date: datetime) -> pd.DataFrame:
+        """
+        Selects the ships berthed at the given date/time, which must be within the span.
+        The same as filtering the ships at the port in its day with get_ship_status,
+        in the same order. The data frame is shared by all the dates in the same interval,
+        so it must not be modified.
+        """
+        encoded_date = np.datetime64(date, 'ns').astype(np.int64)
+        # Within an interval, the dates are after the same bounds, and not after the others.
+        interval = int(np.searchsorted(self._bounds, encoded_date, side='left'))
+
+        berthed_ships = self._berthed_ships_by_interval.get(interval, None)
+        if berthed_ships is None:
+            is_berthed = (self._berthed_from < encoded_date) & (self._berthed_to >= encoded_date)
+            berthed_ships = self.ships[is_berthed].reset_index(drop=True)
+            self._berthed_ships_by_interval[interval] = berthed_ships
+        return berthed_ships
+
+    def get_ships_berthed_between(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """
+        Selects the ships berthed at some date/time from the start, inclusive, to the end, exclusive,
+        which must be within the span. These include all the ships that get_berthed_ships selects
+        for the dates in between, in the same order.
+        """
+        encoded_start = np.datetime64(start, 'ns').astype(np.int64)
+        encoded_end = np.datetime64(end, 'ns').astype(np.int64)
+        is_berthed = (
+            (self._berthed_from < encoded_end)
+            & (self._berthed_to >= encoded_start)
+            & (self._berthed_from < self._berthed_to)
+        )
+        return self.ships[is_berthed].reset_index(drop=True)
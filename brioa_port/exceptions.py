@@ -8,3 +8,15 @@ class InvalidWebcamImageException(BRIOAException):
 
 class FileHasInvalidLastModifiedDateException(BRIOAException):
     pass
+
+
+class UnsupportedDatabaseVersionException(BRIOAException):
+    pass
+
+
+class StorageMismatchException(BRIOAException):
+    pass
+
+
+class VideoEncodingException(BRIOAException):
+    pass
@@ -0,0 +1,153 @@
+import logging
+import numpy as np
+import os
+
+from PIL import Image
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Changing how the hashes are computed must change this, so that the old ones are discarded.
+HASH_VERSION = 1
+
+# Each bit of a hash compares two neighboring pixels in a row of a grayscale thumbnail of this size.
+HASH_THUMBNAIL_SIZE = (9, 8)
+HASH_BITS = (HASH_THUMBNAIL_SIZE[0] - 1) * HASH_THUMBNAIL_SIZE[1]
+
+
+def compute_image_hash(image_path: str) -> Optional[int]:
+    """
+    Computes a 64-bit perceptual hash of an image, which barely changes when the image barely changes:
+    each bit is whether a pixel of a tiny grayscale thumbnail is brighter than the next one in its row.
+    Returns None if the image can't be read.
+    """
+    try:
+        with Image.open(image_path) as image:
+            # A JPEG only has to be decoded at 1/8 of its size, and only its brightness.
+            image.draft('L', (HASH_THUMBNAIL_SIZE[0] * 4, HASH_THUMBNAIL_SIZE[1] * 4))
+            thumbnail = np.asarray(image.convert('L').resize(HASH_THUMBNAIL_SIZE, Image.BOX), dtype=np.int16)
+    except OSError:
+        return None
+
+    bits = thumbnail[:, 1:] > thumbnail[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def get_hash_distance(a: int, b: int) -> int:
+    """
+    In how many bits two hashes differ.
+    """
+    return bin(a ^ b).count('1')
+
+
+def skip_duplicate_images(
+    image_paths: Iterable[str],
+    max_distance: int,
+    get_hash: Callable[[str], Optional[int]] = compute_image_hash
+) -> Iterator[str]:
+    """
+    Leaves out the images that look the same as the last image that was kept before them,
+    so that each run of (nearly) identical images is collapsed into its first image.
+    Comparing to the last image kept, instead of the previous one, keeps slow changes from being left out.
+    Images that can't be hashed are kept, for whatever reads them next to report.
+
+    Args:
+        image_paths: The images, in order.
+        max_distance: In how many bits, at most, the hashes of images that look the same differ.
+                      With 0, only the images with the exact same hash are left out.
+        get_hash: How to hash each image, e.g. from an ImageHashIndex.
+
+    Returns:
+        The images that were kept, in order.
+    """
+    last_kept_hash: Optional[int] = None
+    for image_path in image_paths:
+        image_hash = get_hash(image_path)
+        if image_hash is not None:
+            if last_kept_hash is not None and get_hash_distance(image_hash, last_kept_hash) <= max_distance:
+                continue
+            last_kept_hash = image_hash
+        yield image_path
+
+
+class ImageHashIndex:
+    """
+    Keeps the perceptual hashes of images in a file, so that each image is only hashed once.
+    An image is hashed again if its size or modification time changed.
+    The hashes computed by another version are discarded when the index is opened.
+
+    Attributes:
+        index_path: The file where the hashes are kept.
+        hits: How many images had their hash found in the index, in this process.
+        misses: How many images had to be hashed, in this process.
+    """
+
+    def __init__(self, index_path: Path) -> None:
+        self.index_path = index_path
+        self.hits = 0
+        self.misses = 0
+        # By absolute path: the size, the modification time in nanoseconds, and the hash.
+        self._hashes: Dict[str, Tuple[int, int, int]] = {}
+        self._changed = False
+
+        try:
+            with open(self.index_path, 'rt') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return
+
+        if len(lines) == 0 or lines[0] != self._header:
+            logger.info(f"Discarding the image hashes in '{self.index_path}', computed by another version")
+            self._changed = True
+            return
+
+        for line in lines[1:]:
+            try:
+                hash_str, size_str, mtime_str, path = line.split('\t', 3)
+                self._hashes[path] = (int(size_str), int(mtime_str), int(hash_str, 16))
+            except ValueError:
+                logger.warning(f"Ignoring invalid line in the image hash index: '{line}'")
+
+    @property
+    def _header(self) -> str:
+        return f'v{HASH_VERSION}'
+
+    def get_hash(self, image_path: str) -> Optional[int]:
+        """
+        Returns the same as compute_image_hash, from the index if possible.
+        Images that are hashed are added to the index, which must be saved afterwards.
+        """
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+        key = os.path.abspath(image_path)
+
+        entry = self._hashes.get(key, None)
+        if entry is not None and entry[:2] == (stat.st_size, stat.st_mtime_ns):
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        image_hash = compute_image_hash(image_path)
+        if image_hash is not None:
+            self._hashes[key] = (stat.st_size, stat.st_mtime_ns, image_hash)
+            self._changed = True
+        return image_hash
+
+    def save(self) -> None:
+        """
+        Writes the index, if any image was hashed since it was opened.
+        The file is replaced only once the new one is complete.
+        """
+        if not self._changed:
+            return
+
+        lines = [self._header]
+        lines += [f'{h:016x}\t{size}\t{mtime}\t{path}' for path, (size, mtime, h) in self._hashes.items()]
+        temporary_path = self.index_path.with_name(f'{self.index_path.name}.{os.getpid()}.tmp')
+        with open(temporary_path, 'wt') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(str(temporary_path), str(self.index_path))
+        self._changed = False
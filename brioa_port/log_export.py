@@ -0,0 +1,178 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from brioa_port.log_keeper import LogKeeper
+
+# Which months were exported, and with how many entries, so that only the changed ones are written again.
+EXPORT_MANIFEST_FILENAME = '_export.json'
+PARTITION_FILENAME = 'entries.parquet'
+# Repeated strings, stored as dictionaries.
+CATEGORICAL_COLUMNS = ['Navio', 'Viagem', 'Armador']
+# The row groups are the unit of the date based pruning when reading.
+ROW_GROUP_SIZE = 50000
+
+
+def get_partition_path(export_dir_path: Path, month: str) -> Path:
+    """
+    Where the entries retrieved in a month are exported to.
+
+    Args:
+        export_dir_path: The base directory of the export.
+        month: e.g. '2019-01'
+    """
+    return export_dir_path / f'month={month}' / PARTITION_FILENAME
+
+
+def get_month_range(month: str) -> Tuple[datetime, datetime]:
+    """
+    Returns the first moment of the given month (e.g. '2019-01'), and of the next one.
+    """
+    start = datetime.strptime(month, '%Y-%m')
+    return start, start + relativedelta(months=1)
+
+
+def read_export_manifest(export_dir_path: Path) -> Dict[str, int]:
+    """
+    Reads the number of entries in each exported month, or nothing if there's no export yet.
+    """
+    try:
+        with open(export_dir_path / EXPORT_MANIFEST_FILENAME, 'rt') as f:
+            manifest: Dict[str, int] = json.load(f)
+            return manifest
+    except FileNotFoundError:
+        return {}
+
+
+def write_export_manifest(export_dir_path: Path, manifest: Dict[str, int]) -> None:
+    """
+    Replaces the manifest of an export, in a way that it is never left half written.
+    """
+    temporary_path = export_dir_path / (EXPORT_MANIFEST_FILENAME + '.tmp')
+    with open(temporary_path, 'wt') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary_path, export_dir_path / EXPORT_MANIFEST_FILENAME)
+
+
+def write_partition(partition_path: Path, entries: pd.DataFrame) -> None:
+    """
+    Writes the entries of one month as a Parquet file, with the repeated strings as dictionaries,
+    and the dates with millisecond precision. The file is replaced only once it's complete.
+    """
+    df = entries.copy()
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+
+    partition_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_path = partition_path.with_name(partition_path.name + '.tmp')
+    pq.write_table(
+        pa.Table.from_pandas(df, preserve_index=False),
+        str(temporary_path),
+        row_group_size=ROW_GROUP_SIZE,
+        coerce_timestamps='ms'
+    )
+    os.replace(temporary_path, partition_path)
+
+
+def export_logs(log_keeper: LogKeeper, export_dir_path: Path) -> List[str]:
+    """
+    Exports the schedule logs as Parquet files, partitioned by the month the entries were retrieved in.
+    The entries are sorted by retrieval date, so that the reads can skip the row groups outside of a range.
+    Months which are already exported, with the same number of entries, are not written again.
+
+    Args:
+        log_keeper: Where to read the logs from.
+        export_dir_path: Where to write the files. Created if needed.
+
+    Returns:
+        The months that were written, e.g. ['2019-01', '2019-02']
+    """
+    export_dir_path.mkdir(parents=True, exist_ok=True)
+    manifest = read_export_manifest(export_dir_path)
+
+    exported_months = []
+    for month, n_entries in sorted(log_keeper.count_entries_by_month().items()):
+        if manifest.get(month) == n_entries and get_partition_path(export_dir_path, month).exists():
+            continue
+
+        write_partition(
+            get_partition_path(export_dir_path, month),
+            log_keeper.read_entries_retrieved_between(*get_month_range(month))
+        )
+        manifest[month] = n_entries
+        write_export_manifest(export_dir_path, manifest)
+        exported_months.append(month)
+
+    return exported_months
+
+
+def read_exported_logs(
+    export_dir_path: Path,
+    columns: Optional[Sequence[str]] = None,
+    retrieved_from: Optional[datetime] = None,
+    retrieved_until: Optional[datetime] = None
+) -> pd.DataFrame:
+    """
+    Reads the entries from an export made by export_logs.
+    The files are memory mapped, and only the needed columns, months, and row groups are read.
+
+    Args:
+        export_dir_path: Where the export is.
+        columns: Which columns to read. All of them if None.
+        retrieved_from: Only the entries retrieved from this date/time, inclusive.
+        retrieved_until: Only the entries retrieved up to this date/time, exclusive.
+
+    Returns:
+        The entries, ordered by retrieval date, with the repeated strings as categoricals.
+    """
+    read_columns = None if columns is None else list(columns)
+    if read_columns is not None and 'date_retrieved' not in read_columns:
+        read_columns.append('date_retrieved')
+
+    # Dates are stored as milliseconds, which is also how the row group statistics are compared.
+    def to_milliseconds(date: datetime) -> int:
+        return int(pd.Timestamp(date).value // 1000000)
+
+    frames = []
+    for month in sorted(read_export_manifest(export_dir_path)):
+        month_start, month_end = get_month_range(month)
+        if (retrieved_from is not None and month_end <= retrieved_from) \
+                or (retrieved_until is not None and month_start >= retrieved_until):
+            continue
+
+        parquet_file = pq.ParquetFile(str(get_partition_path(export_dir_path, month)), memory_map=True)
+        date_retrieved_id = parquet_file.schema.names.index('date_retrieved')
+        for i in range(parquet_file.num_row_groups):
+            statistics = parquet_file.metadata.row_group(i).column(date_retrieved_id).statistics
+            if statistics is not None and statistics.has_min_max:
+                if (retrieved_from is not None and statistics.max < to_milliseconds(retrieved_from)) \
+                        or (retrieved_until is not None and statistics.min >= to_milliseconds(retrieved_until)):
+                    continue
+            frames.append(
+                parquet_file.read_row_group(i, columns=read_columns, use_pandas_metadata=True).to_pandas()
+            )
+
+    if len(frames) == 0:
+        return pd.DataFrame(columns=read_columns)
+
+    df = pd.concat(frames, ignore_index=True)
+    if retrieved_from is not None:
+        df = df[df['date_retrieved'] >= retrieved_from]
+    if retrieved_until is not None:
+        df = df[df['date_retrieved'] < retrieved_until]
+    if columns is not None:
+        df = df[list(columns)]
+
+    # Each row group has its own dictionary, so the categories are only put together in the end.
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df.reset_index(drop=True)
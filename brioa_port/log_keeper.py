@@ -1,31 +1,569 @@
+import functools
+import itertools
+import numpy as np
 import pandas as pd
 
 from datetime import datetime
-from sqlalchemy.engine import Engine
-from typing import Optional
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_float_dtype, is_integer_dtype
+from sqlalchemy.engine import Connectable, Connection, Engine
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Sequence, Tuple, Type, TypeVar
 
-from brioa_port.util.database import DATABASE_DATETIME_FORMAT
+from brioa_port.exceptions import UnsupportedDatabaseVersionException, StorageMismatchException
+from brioa_port.util.cache import LRUCache
+from brioa_port.util.database import (
+    DATABASE_DATETIME_FORMAT, DATABASE_STORED_DATETIME_FORMAT, DatetimeStorage, LogsLayout
+)
+from brioa_port.util.datetime import get_epoch_seconds_from_naive_datetime
+from brioa_port.util.revisions import apply_deltas, find_deltas, to_sql_value, values_are_equal
 from brioa_port.schedule_parser import SCHEDULE_DATE_COLUMNS
 
 
+ENTRY_DATE_COLUMNS = SCHEDULE_DATE_COLUMNS + ['date_retrieved']
+
+# The times of arrival, berthing, and sailing, taken from the first of the two columns that is set.
+# They're stored along with the entries when using the epoch datetime storage, so they can be indexed.
+DERIVED_DATE_COLUMNS = {
+    'TA': ('ETA', 'ATA'),
+    'TB': ('ATB', 'ETB'),
+    'TS': ('ATS', 'ETS'),
+}
+
+# SQLite types for the columns that are used in queries.
+LOGS_COLUMN_TYPES = {
+    'date_retrieved': 'TIMESTAMP NOT NULL',
+    'Berço': 'REAL',
+    'Navio': 'TEXT',
+    'Viagem': 'TEXT NOT NULL',
+    **{x: 'TIMESTAMP' for x in SCHEDULE_DATE_COLUMNS},
+}
+
+StorageSetting = TypeVar('StorageSetting', DatetimeStorage, LogsLayout)
+ReadMethod = TypeVar('ReadMethod', bound=Callable[..., Any])
+
+
+def get_column_sql_type(
+    column_name: str,
+    dtype: np.dtype,
+    datetime_storage: DatetimeStorage = DatetimeStorage.TEXT
+) -> str:
+    """
+    Chooses the SQLite type for a column of the logs.
+    The columns used in queries have fixed types,
+    the other ones get a type according to their pandas dtype.
+    """
+    if datetime_storage == DatetimeStorage.EPOCH and column_name in ENTRY_DATE_COLUMNS:
+        return 'INTEGER NOT NULL' if column_name == 'date_retrieved' else 'INTEGER'
+    if column_name in LOGS_COLUMN_TYPES:
+        return LOGS_COLUMN_TYPES[column_name]
+    if is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    if is_bool_dtype(dtype) or is_integer_dtype(dtype):
+        return 'INTEGER'
+    if is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def encode_epoch_dates(dates: pd.Series) -> pd.Series:
+    """
+    Converts dates to integer seconds since 1970-01-01 00:00:00, ignoring timezones.
+
+    Returns:
+        A series of python integers, with None in place of the missing dates.
+    """
+    dates = pd.to_datetime(dates)
+    seconds = dates.values.astype('datetime64[s]').astype(np.int64).astype(object)
+    seconds[dates.isnull().values] = None
+    return pd.Series(seconds, index=dates.index, name=dates.name)
+
+
+def find_new_entries(date_retrieved: datetime, entries: pd.DataFrame, latest_entries: pd.DataFrame) -> np.ndarray:
+    """
+    Determines which entries have new information. For that, each one must either:
+        a. Be a new trip (trip name not in the latest entries).
+        b. Have at least one different value from the latest entry for that trip,
+           and have a more recent date_retrieved than the existing one.
+
+    Args:
+        date_retrieved: When the entries were retrieved.
+        entries: The entries to be compared, without the date_retrieved column.
+        latest_entries: The latest existing entry for (at least) each trip in the entries,
+                        including the date_retrieved column.
+
+    Returns:
+        A boolean mask, aligned with the entries, marking the new ones.
+    """
+    # Line up the existing entry for each incoming one, by trip name.
+    # Trips that aren't in the database get a row of nulls.
+    existing = latest_entries.drop_duplicates('Viagem') \
+                             .set_index('Viagem', drop=False) \
+                             .reindex(entries['Viagem'].values)
+    is_new_trip = existing['date_retrieved'].isnull().values
+
+    # Compare the values the same way Series.equals would compare two entries:
+    # as python objects, with nulls being equal to each other,
+    # and with the columns being exactly the same and in the same order.
+    unchanged = np.full(len(entries), list(existing.columns.drop('date_retrieved')) == list(entries.columns))
+    if unchanged.any():
+        for column in entries.columns:
+            incoming_values = entries[column].astype(object).values
+            existing_values = existing[column].astype(object).values
+            unchanged &= (incoming_values == existing_values) \
+                | (pd.isnull(incoming_values) & pd.isnull(existing_values))
+
+    is_more_recent = (existing['date_retrieved'] < date_retrieved).values
+
+    return is_new_trip | (~unchanged & is_more_recent)
+
+
+def make_cache_key(method_name: str, args: Sequence[Any], kwargs: Dict[str, Any]) -> Hashable:
+    """
+    Builds a key for the read cache from a method call.
+    Sequences of trip names are turned into tuples, so they can be hashed.
+    """
+    def make_hashable(value: Any) -> Hashable:
+        if isinstance(value, (list, np.ndarray, pd.Series, pd.Index)):
+            return tuple(value)
+        return value
+
+    return (
+        method_name,
+        tuple(make_hashable(x) for x in args),
+        tuple(sorted((name, make_hashable(value)) for name, value in kwargs.items()))
+    )
+
+
+def cached_read(method: ReadMethod) -> ReadMethod:
+    """
+    Makes a LogKeeper read method go through the read cache, when it's enabled.
+    """
+    @functools.wraps(method)
+    def wrapper(self: 'LogKeeper', *args: Any, **kwargs: Any) -> Any:
+        if self.read_cache is None:
+            return method(self, *args, **kwargs)
+        return self._read_through_cache(
+            make_cache_key(method.__name__, args, kwargs),
+            lambda: method(self, *args, **kwargs)
+        )
+    return wrapper  # type: ignore
+
+
 class LogKeeper:
     """
     Interacts with a database of schedule logs,
     writing and reading to pandas dataframes originating from the ScheduleParser.
 
+    Besides the full history of entries, a table with only the latest entry
+    for each trip is kept up to date, so that the current state can be read
+    without going through the whole history.
+
+    The tables are created on the first write, with the columns of the first entries.
+    Existing databases are migrated to the current schema version when opened.
+
+    With the delta logs layout, the logs table only has the first entry of each trip,
+    and the following ones are kept in the deltas table, one row per changed column.
+    Reading the entries of a trip puts the full rows back together.
+
+    The reads can be cached in memory, for when the same queries are repeated.
+    Every write increments a counter in the database, the write generation,
+    and the cache is discarded when it changes, even if the write came from another process.
+
     Attributes:
         engine: The database engine that pandas will connect to.
+        read_engine: The database engine used for the reads. The same as the engine, unless another one is given.
+        datetime_storage: How the dates are stored. Chosen when the database is created,
+                          changed with convert_datetime_storage.
+        logs_layout: How the revisions of each trip are stored. Chosen when the database is created,
+                     changed with convert_logs_layout.
+        read_cache: The cached results of the reads, with hit/miss counters. None if disabled.
     """
     LOGS_TABLE = 'logs'
+    LATEST_TABLE = 'trips_latest'
+    DELTAS_TABLE = 'log_deltas'
+    AS_OF_TABLE = 'entries_as_of'
+    SETTINGS_TABLE = 'settings'
+    # Stay well below SQLITE_MAX_VARIABLE_NUMBER, which defaults to 999 in older versions.
+    MAX_QUERY_PARAMETERS = 500
+    SCHEMA_VERSION = 4
 
-    def __init__(self, engine: Engine) -> None:
+    def __init__(
+        self,
+        engine: Engine,
+        datetime_storage: Optional[DatetimeStorage] = None,
+        logs_layout: Optional[LogsLayout] = None,
+        cache_size: int = 0,
+        read_engine: Optional[Engine] = None
+    ) -> None:
+        """
+        Args:
+            engine: The database engine that pandas will connect to.
+            datetime_storage: How to store the dates, if the database is new. Defaults to text.
+                              For an existing database, it must match the one in use, if given.
+            logs_layout: How to store the revisions, if the database is new. Defaults to full.
+                         For an existing database, it must match the one in use, if given.
+            cache_size: How many read results to keep in memory. Disabled with 0, the default.
+            read_engine: The database engine to use for the reads, e.g. a read-only one,
+                         so that they never wait for the writes. Defaults to the engine.
+        """
         self.engine = engine
+        self.read_engine = engine if read_engine is None else read_engine
+        self.read_cache: Optional[LRUCache] = LRUCache(cache_size) if cache_size > 0 else None
+        self._cache_write_generation: Optional[int] = None
+        self.migrate()
+
+        self.datetime_storage = self._resolve_storage_setting(
+            'datetime_storage', DatetimeStorage, datetime_storage, DatetimeStorage.TEXT
+        )
+        self.logs_layout = self._resolve_storage_setting(
+            'logs_layout', LogsLayout, logs_layout, LogsLayout.FULL
+        )
+
+    def _resolve_storage_setting(
+        self,
+        name: str,
+        setting_type: Type[StorageSetting],
+        requested: Optional[StorageSetting],
+        default: StorageSetting
+    ) -> StorageSetting:
+        """
+        Determines a storage setting from the one in the database, if it's set,
+        or else from the requested one, falling back to the default.
 
+        Raises:
+            StorageMismatchException: If the requested setting is different from the one in the database.
+        """
+        stored = self._read_setting(self.engine, name)
+        if stored is None:
+            return default if requested is None else requested
+
+        value = setting_type(stored)
+        if requested is not None and requested != value:
+            raise StorageMismatchException(
+                f"The database uses '{value.value}' for its {name.replace('_', ' ')}, "
+                f"not '{requested.value}'. Use 'brioa_schedule convert' to change it."
+            )
+        return value
+
+    def _read_through_cache(self, key: Hashable, read: Callable[[], Any]) -> Any:
+        """
+        Returns the cached result of a read, running it if needed.
+        The cache is discarded first if there were writes since it was filled.
+        Dataframes are copied, so that changes made by the caller don't reach the cache.
+        """
+        assert self.read_cache is not None
+        write_generation = self._read_write_generation(self.read_engine)
+        if write_generation != self._cache_write_generation:
+            self.read_cache.clear()
+            self._cache_write_generation = write_generation
+
+        result = self.read_cache.get_or_compute(key, read)
+        if isinstance(result, (pd.DataFrame, pd.Series)):
+            return result.copy()
+        return result
+
+    def _read_write_generation(self, connectable: Connectable) -> int:
+        """
+        Reads how many times the database has been written to.
+        """
+        return int(self._read_setting(connectable, 'write_generation') or 0)
+
+    def _increment_write_generation(self, connection: Connection) -> None:
+        """
+        Marks the database as written to, which invalidates the read caches.
+        Must be called in the same transaction as the write.
+        """
+        connection.execute((
+            f"insert or replace into {self.SETTINGS_TABLE} (name, value) "
+            f"select 'write_generation', ifnull(max(cast(value as integer)), 0) + 1 "
+            f"from {self.SETTINGS_TABLE} where name = 'write_generation'"
+        ))
+
+    @cached_read
     def has_entries(self) -> bool:
         """
         Checks if the database has been initialized.
         """
-        return bool(self.engine.dialect.has_table(self.engine, self.LOGS_TABLE))
+        return bool(self.read_engine.dialect.has_table(self.read_engine, self.LOGS_TABLE))
+
+    def migrate(self) -> None:
+        """
+        Brings the schema of an existing database up to the current version, in place.
+        The version is kept in SQLite's user_version, databases without one are considered
+        to be from before the schema was managed, i.e. version 0.
+        """
+        migrations = {
+            1: self._migrate_to_version_1,
+            2: self._migrate_to_version_2,
+            3: self._migrate_to_version_3,
+            4: self._migrate_to_version_4,
+        }
+
+        # Checked outside of a transaction first, so that opening an up to date database doesn't lock it.
+        if self.engine.execute('pragma user_version').scalar() == self.SCHEMA_VERSION:
+            return
+
+        with self.engine.begin() as connection:
+            version = connection.execute('pragma user_version').scalar()
+            if version > self.SCHEMA_VERSION:
+                raise UnsupportedDatabaseVersionException(
+                    f'The database is at schema version {version}, '
+                    f'but only up to version {self.SCHEMA_VERSION} is supported.'
+                )
+
+            for target_version in range(version + 1, self.SCHEMA_VERSION + 1):
+                migrations[target_version](connection)
+                connection.execute(f'pragma user_version = {target_version}')
+
+    def _migrate_to_version_1(self, connection: Connection) -> None:
+        """
+        Replaces the logs table created by pandas with one with explicit types and indexes,
+        and (re)builds the table with the latest entry for each trip.
+        """
+        if not self.engine.dialect.has_table(connection, self.LOGS_TABLE):
+            # Nothing to migrate, the tables will be created on the first write.
+            return
+
+        old_table = self.LOGS_TABLE + '_version_0'
+        columns = [
+            (name, LOGS_COLUMN_TYPES.get(name, sql_type))
+            for name, sql_type in self._set_tables_aside(connection, old_table)
+        ]
+        self._create_tables(connection, columns, DatetimeStorage.TEXT)
+        connection.execute(f'insert into {self.LOGS_TABLE} select * from {old_table}')
+        connection.execute(f'drop table {old_table}')
+        self._build_latest_table(connection, LogsLayout.FULL)
+
+    def _migrate_to_version_2(self, connection: Connection) -> None:
+        """
+        Adds a table for settings that apply to the whole database.
+        Existing logs were all stored with text dates.
+        """
+        connection.execute(f'create table {self.SETTINGS_TABLE} (name TEXT PRIMARY KEY, value TEXT)')
+        if self.engine.dialect.has_table(connection, self.LOGS_TABLE):
+            self._write_setting(connection, 'datetime_storage', DatetimeStorage.TEXT.value)
+
+    def _migrate_to_version_3(self, connection: Connection) -> None:
+        """
+        Records the layout of the logs, which can now be changed.
+        Existing logs were all stored as full rows.
+        """
+        if self.engine.dialect.has_table(connection, self.LOGS_TABLE):
+            self._write_setting(connection, 'logs_layout', LogsLayout.FULL.value)
+
+    def _migrate_to_version_4(self, connection: Connection) -> None:
+        """
+        Indexes the latest entries by retrieval date, for the point-in-time reads.
+        """
+        if self.engine.dialect.has_table(connection, self.LATEST_TABLE):
+            self._create_latest_date_retrieved_index(connection)
+
+    def _read_setting(self, connectable: Connectable, name: str) -> Optional[str]:
+        """
+        Reads a value from the settings table, or None if it's not set.
+        """
+        return connectable.execute(f'select value from {self.SETTINGS_TABLE} where name = ?', (name,)).scalar()
+
+    def _write_setting(self, connection: Connection, name: str, value: str) -> None:
+        """
+        Writes a value to the settings table.
+        """
+        connection.execute(f'insert or replace into {self.SETTINGS_TABLE} (name, value) values (?, ?)', (name, value))
+
+    def _set_tables_aside(self, connection: Connection, new_logs_table_name: str) -> List[Tuple[str, str]]:
+        """
+        Renames the logs table, so that a new one can be created in its place and filled from it.
+        Drops the table with the latest entries, which can be rebuilt from the logs.
+
+        Returns:
+            The name and SQLite type of each column in the logs.
+        """
+        columns = [
+            (row['name'], row['type'])
+            for row in connection.execute(f'pragma table_info({self.LOGS_TABLE})')
+        ]
+        connection.execute(f'alter table {self.LOGS_TABLE} rename to {new_logs_table_name}')
+        # The old indexes would clash with the names of the new ones.
+        old_indexes = connection.execute(
+            "select name from sqlite_master where type = 'index' and tbl_name = ? and sql is not null",
+            (new_logs_table_name,)
+        ).fetchall()
+        for (index_name,) in old_indexes:
+            connection.execute(f'drop index "{index_name}"')
+        connection.execute(f'drop table if exists {self.LATEST_TABLE}')
+        return columns
+
+    def _create_tables(
+        self,
+        connection: Connection,
+        columns: Sequence[Tuple[str, str]],
+        datetime_storage: DatetimeStorage,
+        logs_layout: LogsLayout = LogsLayout.FULL
+    ) -> None:
+        """
+        Creates the logs table and the table with the latest entry for each trip,
+        along with their indexes.
+
+        Args:
+            connection: Where to create the tables.
+            columns: The name and SQLite type of each column, date_retrieved included.
+            datetime_storage: With epoch dates, the derived date columns are added to the tables.
+            logs_layout: With the delta layout, the table for the changes is created too.
+        """
+        if datetime_storage == DatetimeStorage.EPOCH:
+            columns = list(columns) + [(x, 'INTEGER') for x in DERIVED_DATE_COLUMNS]
+        column_definitions = ', '.join(f'"{name}" {sql_type}' for name, sql_type in columns)
+        connection.execute(f'create table {self.LOGS_TABLE} ({column_definitions})')
+        connection.execute(f'create table {self.LATEST_TABLE} ({column_definitions})')
+
+        # Time based reads (e.g. for a specific retrieval) and per trip history reads.
+        connection.execute(f'create index ix_{self.LOGS_TABLE}_date_retrieved on {self.LOGS_TABLE} (date_retrieved)')
+        connection.execute((
+            f'create index ix_{self.LOGS_TABLE}_Viagem_date_retrieved '
+            f'on {self.LOGS_TABLE} (Viagem, date_retrieved)'
+        ))
+
+        # Latest entry lookups by trip, and the time range filter for the ships at port.
+        # With text dates, the expressions must be the same ones used in the queries.
+        connection.execute(f'create unique index ix_{self.LATEST_TABLE}_Viagem on {self.LATEST_TABLE} (Viagem)')
+        self._create_latest_date_retrieved_index(connection)
+        for derived_column in ['TA', 'TS']:
+            if datetime_storage == DatetimeStorage.EPOCH:
+                indexed_expression = derived_column
+            else:
+                indexed_expression = 'ifnull({}, {})'.format(*DERIVED_DATE_COLUMNS[derived_column])
+            connection.execute((
+                f'create index ix_{self.LATEST_TABLE}_{derived_column} '
+                f'on {self.LATEST_TABLE} ({indexed_expression})'
+            ))
+
+        if logs_layout == LogsLayout.DELTA:
+            # column_id is the position of the column in the logs table.
+            connection.execute((
+                f'create table {self.DELTAS_TABLE} ('
+                'Viagem TEXT NOT NULL, revision INTEGER NOT NULL, column_id INTEGER NOT NULL, value, '
+                'PRIMARY KEY (Viagem, revision, column_id)'
+                ') WITHOUT ROWID'
+            ))
+
+    def _create_latest_date_retrieved_index(self, connection: Connection) -> None:
+        """
+        Separates the trips whose latest entry was retrieved before a date from the ones that were
+        still being updated, for the point-in-time reads.
+        """
+        connection.execute((
+            f'create index if not exists ix_{self.LATEST_TABLE}_date_retrieved '
+            f'on {self.LATEST_TABLE} (date_retrieved)'
+        ))
+
+    def convert_datetime_storage(self, datetime_storage: DatetimeStorage) -> None:
+        """
+        Converts the dates in an existing database to another kind of storage, in place.
+        Logs in the delta layout are converted to full rows and back around it.
+        """
+        if datetime_storage == self.datetime_storage:
+            return
+
+        if self.logs_layout == LogsLayout.DELTA:
+            self.convert_logs_layout(LogsLayout.FULL)
+            self.convert_datetime_storage(datetime_storage)
+            self.convert_logs_layout(LogsLayout.DELTA)
+            return
+
+        with self.engine.begin() as connection:
+            if self.engine.dialect.has_table(connection, self.LOGS_TABLE):
+                old_table = self.LOGS_TABLE + '_converting'
+                columns = [
+                    (name, get_column_sql_type(name, np.dtype('datetime64[ns]'), datetime_storage))
+                    if name in ENTRY_DATE_COLUMNS else (name, sql_type)
+                    for name, sql_type in self._set_tables_aside(connection, old_table)
+                    if name not in DERIVED_DATE_COLUMNS
+                ]
+                self._create_tables(connection, columns, datetime_storage)
+
+                if datetime_storage == DatetimeStorage.EPOCH:
+                    converted_date = "cast(strftime('%s', \"{}\") as integer)"
+                else:
+                    converted_date = "strftime('%Y-%m-%d %H:%M:%S', \"{}\", 'unixepoch') || '.000000'"
+
+                column_names = [f'"{name}"' for name, _ in columns]
+                column_values = [
+                    converted_date.format(name) if name in ENTRY_DATE_COLUMNS else f'"{name}"'
+                    for name, _ in columns
+                ]
+                if datetime_storage == DatetimeStorage.EPOCH:
+                    for derived_column, (first_column, second_column) in DERIVED_DATE_COLUMNS.items():
+                        column_names.append(derived_column)
+                        column_values.append(
+                            f'ifnull({converted_date.format(first_column)}, {converted_date.format(second_column)})'
+                        )
+
+                connection.execute((
+                    f'insert into {self.LOGS_TABLE} ({", ".join(column_names)}) '
+                    f'select {", ".join(column_values)} from {old_table}'
+                ))
+                connection.execute(f'drop table {old_table}')
+                self._build_latest_table(connection, self.logs_layout)
+
+            self._write_setting(connection, 'datetime_storage', datetime_storage.value)
+            self._increment_write_generation(connection)
+
+        self.datetime_storage = datetime_storage
+
+    def convert_logs_layout(self, logs_layout: LogsLayout) -> None:
+        """
+        Converts the logs in an existing database to another layout, in place.
+        """
+        if logs_layout == self.logs_layout:
+            return
+
+        with self.engine.begin() as connection:
+            if self.engine.dialect.has_table(connection, self.LOGS_TABLE):
+                old_table = self.LOGS_TABLE + '_converting'
+                columns = [
+                    (name, sql_type)
+                    for name, sql_type in self._set_tables_aside(connection, old_table)
+                    if name not in DERIVED_DATE_COLUMNS
+                ]
+                self._create_tables(connection, columns, self.datetime_storage, logs_layout)
+                column_names = [row['name'] for row in connection.execute(f'pragma table_info({old_table})')]
+                placeholders = ', '.join('?' * len(column_names))
+
+                if logs_layout == LogsLayout.DELTA:
+                    connection.execute(f'create index ix_{old_table}_Viagem on {old_table} (Viagem)')
+                    trip_names = [x for (x,) in connection.execute(f'select distinct Viagem from {old_table}')]
+                    for chunk in self._chunk_trip_names(trip_names):
+                        rows = connection.execute((
+                            f'select * from {old_table} where Viagem in ({", ".join("?" * len(chunk))}) '
+                            'order by Viagem, date_retrieved, rowid'
+                        ), tuple(chunk)).fetchall()
+                        base_rows, deltas = find_deltas(
+                            [tuple(x) for x in rows],
+                            trip_column_id=column_names.index('Viagem'),
+                            always_included_column_ids={column_names.index('date_retrieved')},
+                            excluded_column_ids={column_names.index(x) for x in DERIVED_DATE_COLUMNS
+                                                 if x in column_names}
+                        )
+                        connection.execute(f'insert into {self.LOGS_TABLE} values ({placeholders})', base_rows)
+                        if len(deltas) > 0:
+                            connection.execute(f'insert into {self.DELTAS_TABLE} values (?, ?, ?, ?)', deltas)
+                else:
+                    trip_names = [x for (x,) in connection.execute(f'select Viagem from {old_table}')]
+                    for chunk in self._chunk_trip_names(trip_names):
+                        rows_by_trip = self._reconstruct_rows(connection, chunk, old_table)
+                        connection.execute(
+                            f'insert into {self.LOGS_TABLE} values ({placeholders})',
+                            [row for rows in rows_by_trip.values() for row in rows]
+                        )
+                    connection.execute(f'drop table {self.DELTAS_TABLE}')
+                    self._update_derived_columns(connection, self.LOGS_TABLE)
+
+                connection.execute(f'drop table {old_table}')
+                self._build_latest_table(connection, logs_layout)
+
+            self._write_setting(connection, 'logs_layout', logs_layout.value)
+            self._increment_write_generation(connection)
+
+        self.logs_layout = logs_layout
 
     def write_entries(self, date_retrieved: datetime, entries: pd.DataFrame) -> int:
         """
@@ -40,48 +578,300 @@ class LogKeeper:
             The number of new entries which were inserted.
         """
 
+        # Do the comparison and the insertion in a single transaction,
+        # so that the novelty check can't be invalidated by a concurrent write.
+        with self.engine.begin() as connection:
+            return self._write_entries(connection, date_retrieved, entries)
+
+    def write_entries_in_bulk(
+        self,
+        entries_by_date: Iterable[Tuple[datetime, pd.DataFrame]],
+        batch_size: int = 100
+    ) -> int:
+        """
+        Inserts several sets of log entries into the database, one after the other,
+        with the same results as calling write_entries for each of them.
+        The sets are written in transactions of batch_size sets each.
+
+        Args:
+            entries_by_date: The date each set of entries was retrieved, and the entries themselves.
+                             Should be ordered by date, as older information is not inserted.
+            batch_size: How many sets of entries to write per transaction.
+
+        Returns:
+            The total number of new entries which were inserted.
+        """
+        n_new_entries = 0
+        entries_by_date = iter(entries_by_date)
+        while True:
+            batch = list(itertools.islice(entries_by_date, batch_size))
+            if len(batch) == 0:
+                return n_new_entries
+
+            with self.engine.begin() as connection:
+                for date_retrieved, entries in batch:
+                    n_new_entries += self._write_entries(connection, date_retrieved, entries)
+
+    def _write_entries(self, connection: Connection, date_retrieved: datetime, entries: pd.DataFrame) -> int:
+        """
+        Inserts new log entries into the database, within the given transaction.
+        See write_entries.
+        """
         # Add the date_retrieved timestamp to the entries as an index,
         # so it can be differentiated from earlier entries in the database.
         indexed_entries = entries.copy()
         indexed_entries['date_retrieved'] = date_retrieved
         indexed_entries = indexed_entries.set_index('date_retrieved')
 
-        def is_entry_new(entry: pd.Series) -> bool:
-            """
-            Determines if an entry has new information. For that, it must either:
-                a. Be a new trip (trip name not in the database).
-                b. Have at least one different value from the latest entry for that trip,
-                   and Have a more recent date_retrieved than the existing one.
-
-            Args:
-                entry: The log entry to be compared.
-
-            Returns:
-                Whether it's new or not.
-            """
-            existing_entry = self.read_latest_entry_for_trip(entry['Viagem'])
-            if existing_entry is not None:
-                no_changes = entry.equals(existing_entry.drop('date_retrieved'))
-                if no_changes:
-                    return False
-                existing_date_retrieved = existing_entry['date_retrieved'].to_pydatetime()
-                if existing_date_retrieved >= date_retrieved:
-                    return False
-            return True
-
-        if self.has_entries():
-            # Database has existing entries.
-            # Insert only new entries, aka the ones with new information.
-            new_entries = indexed_entries[indexed_entries.apply(is_entry_new, axis=1)]
-        else:
-            # Database is empty. Insert everything.
-            new_entries = indexed_entries
+        if not self.engine.dialect.has_table(connection, self.LOGS_TABLE):
+            # Database is empty. Create the tables according to the entries.
+            self._create_tables(connection, [
+                (name, get_column_sql_type(name, dtype, self.datetime_storage))
+                for name, dtype in indexed_entries.reset_index().dtypes.items()
+            ], self.datetime_storage, self.logs_layout)
+            self._write_setting(connection, 'datetime_storage', self.datetime_storage.value)
+            self._write_setting(connection, 'logs_layout', self.logs_layout.value)
+
+        # Insert only new entries, aka the ones with new information.
+        latest_entries = self._read_latest_entries_for_trips(connection, entries['Viagem'].unique())
+        new_entries = indexed_entries[find_new_entries(date_retrieved, entries, latest_entries)]
 
         if not new_entries.empty:
-            new_entries.to_sql(self.LOGS_TABLE, con=self.engine, if_exists='append')
+            stored_entries = self._encode_entries(new_entries)
+            if self.logs_layout == LogsLayout.DELTA:
+                self._write_revisions(connection, new_entries, stored_entries, latest_entries)
+            else:
+                stored_entries.to_sql(self.LOGS_TABLE, con=connection, if_exists='append')
+            self._update_latest_table(connection, stored_entries)
+            self._increment_write_generation(connection)
 
         return len(new_entries)
 
+    def _write_revisions(
+        self,
+        connection: Connection,
+        new_entries: pd.DataFrame,
+        stored_entries: pd.DataFrame,
+        latest_entries: pd.DataFrame
+    ) -> None:
+        """
+        Inserts new log entries in the delta layout: trips seen for the first time get a full row
+        in the logs, the others get a revision with the columns that changed since their latest entry.
+
+        Args:
+            connection: Where to write, inside a transaction.
+            new_entries: The entries to insert, indexed by date_retrieved.
+            stored_entries: The same entries, as prepared by _encode_entries.
+            latest_entries: The latest existing entry for (at least) each trip in the new entries.
+        """
+        entries = new_entries.reset_index()
+        stored_rows = stored_entries.reset_index()
+        column_ids = {row['name']: row['cid'] for row in connection.execute(f'pragma table_info({self.LOGS_TABLE})')}
+        previous_entries = {entry['Viagem']: entry for _, entry in latest_entries.iterrows()}
+        revisions = self._read_latest_revisions(connection, list(previous_entries))
+
+        is_first_entry = np.zeros(len(entries), dtype=bool)
+        deltas = []
+        for i, entry in entries.iterrows():
+            trip_name = entry['Viagem']
+            previous_entry = previous_entries.get(trip_name)
+            if previous_entry is None:
+                is_first_entry[i] = True
+                revisions[trip_name] = 0
+            else:
+                revisions[trip_name] = revisions.get(trip_name, 0) + 1
+                for column in entries.columns:
+                    # date_retrieved is always included, so every revision has at least one row.
+                    if column == 'date_retrieved' or not values_are_equal(entry[column], previous_entry[column]):
+                        value = to_sql_value(stored_rows.at[i, column])
+                        deltas.append((trip_name, revisions[trip_name], column_ids[column], value))
+            previous_entries[trip_name] = entry
+
+        if is_first_entry.any():
+            stored_entries[is_first_entry].to_sql(self.LOGS_TABLE, con=connection, if_exists='append')
+        if len(deltas) > 0:
+            connection.execute(f'insert into {self.DELTAS_TABLE} values (?, ?, ?, ?)', deltas)
+
+    def _read_latest_revisions(self, connectable: Connectable, trip_names: Sequence[str]) -> Dict[str, int]:
+        """
+        Queries the number of the latest revision of each of the given trips, in the delta layout.
+        Trips which only have their first entry are left out.
+        """
+        revisions: Dict[str, int] = {}
+        for chunk in self._chunk_trip_names(trip_names):
+            revisions.update(connectable.execute((
+                f'select Viagem, max(revision) from {self.DELTAS_TABLE} '
+                f'where Viagem in ({", ".join("?" * len(chunk))}) group by Viagem'
+            ), tuple(chunk)).fetchall())
+        return revisions
+
+    def _reconstruct_rows(
+        self,
+        connectable: Connectable,
+        trip_names: Sequence[str],
+        logs_table: Optional[str] = None
+    ) -> Dict[str, List[Tuple]]:
+        """
+        Puts the full rows of the given trips back together, in the delta layout.
+        The values are the stored ones, and the derived date columns are only set in the first row.
+
+        Args:
+            connectable: Where to run the queries.
+            trip_names: At most MAX_QUERY_PARAMETERS trip names.
+            logs_table: Where the first entries are, if not in the logs table.
+
+        Returns:
+            The rows of each trip that is found, from the first to the latest one,
+            with the columns in the same order as in the logs table.
+        """
+        logs_table = logs_table or self.LOGS_TABLE
+        placeholders = ', '.join('?' * len(trip_names))
+        base_rows = connectable.execute(
+            f'select * from {logs_table} where Viagem in ({placeholders})',
+            tuple(trip_names)
+        ).fetchall()
+        deltas = connectable.execute((
+            f'select Viagem, revision, column_id, value from {self.DELTAS_TABLE} '
+            f'where Viagem in ({placeholders}) order by Viagem, revision'
+        ), tuple(trip_names)).fetchall()
+
+        deltas_by_trip = {
+            trip_name: [(revision, column_id, value) for _, revision, column_id, value in trip_deltas]
+            for trip_name, trip_deltas in itertools.groupby(deltas, key=lambda x: x[0])
+        }
+        return {
+            base_row['Viagem']: apply_deltas(tuple(base_row), deltas_by_trip.get(base_row['Viagem'], []))
+            for base_row in base_rows
+        }
+
+    def _chunk_trip_names(self, trip_names: Sequence[str]) -> Iterator[List[str]]:
+        """
+        Splits the trip names into lists that fit in the parameters of a query.
+        """
+        for chunk_start in range(0, len(trip_names), self.MAX_QUERY_PARAMETERS):
+            yield list(trip_names[chunk_start:chunk_start + self.MAX_QUERY_PARAMETERS])
+
+    def rebuild_latest_entries(self) -> None:
+        """
+        Recreates the table with the latest entry for each trip from the full logs.
+        """
+        with self.engine.begin() as connection:
+            if self.engine.dialect.has_table(connection, self.LOGS_TABLE):
+                self._build_latest_table(connection, self.logs_layout)
+                self._increment_write_generation(connection)
+
+    def _build_latest_table(self, connection: Connection, logs_layout: LogsLayout) -> None:
+        """
+        Fills the table with the latest entry for each trip from the full logs.
+        """
+        connection.execute(f'delete from {self.LATEST_TABLE}')
+        if logs_layout == LogsLayout.FULL:
+            connection.execute((
+                f'insert into {self.LATEST_TABLE} '
+                f'select * from {self.LOGS_TABLE} group by Viagem having date_retrieved = max(date_retrieved)'
+            ))
+            return
+
+        trip_names = [x for (x,) in connection.execute(f'select Viagem from {self.LOGS_TABLE}')]
+        for chunk in self._chunk_trip_names(trip_names):
+            latest_rows = [rows[-1] for rows in self._reconstruct_rows(connection, chunk).values()]
+            connection.execute(
+                f'insert into {self.LATEST_TABLE} values ({", ".join("?" * len(latest_rows[0]))})',
+                latest_rows
+            )
+        self._update_derived_columns(connection, self.LATEST_TABLE)
+
+    def _update_derived_columns(self, connection: Connection, table_name: str) -> None:
+        """
+        Recomputes the derived date columns of a table from the dates they come from,
+        when using the epoch datetime storage.
+        """
+        if self.datetime_storage == DatetimeStorage.EPOCH:
+            connection.execute('update {} set {}'.format(table_name, ', '.join(
+                f'{derived_column} = ifnull({first_column}, {second_column})'
+                for derived_column, (first_column, second_column) in DERIVED_DATE_COLUMNS.items()
+            )))
+
+    def _encode_entries(self, indexed_entries: pd.DataFrame) -> pd.DataFrame:
+        """
+        Prepares entries (indexed by date_retrieved) to be written according to the datetime storage.
+        Text dates are handled by pandas.
+        """
+        if self.datetime_storage == DatetimeStorage.TEXT:
+            return indexed_entries
+
+        df = indexed_entries.reset_index()
+        for column in ENTRY_DATE_COLUMNS:
+            df[column] = encode_epoch_dates(df[column])
+        for derived_column, (first_column, second_column) in DERIVED_DATE_COLUMNS.items():
+            df[derived_column] = df[first_column].where(df[first_column].notnull(), df[second_column])
+        return df.set_index('date_retrieved')
+
+    def _read_sql(self, connectable: Connectable, query: str, params: Sequence = ()) -> pd.DataFrame:
+        """
+        Runs a query with pandas, turning the date columns in the result into datetimes,
+        according to the datetime storage.
+        """
+        return self._decode_dates(pd.read_sql(query, con=connectable, params=params))
+
+    def _decode_dates(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Turns the date columns of stored values into datetimes, according to the datetime storage.
+        """
+        for column in ENTRY_DATE_COLUMNS + list(DERIVED_DATE_COLUMNS):
+            if column not in df.columns:
+                continue
+            if self.datetime_storage == DatetimeStorage.EPOCH:
+                df[column] = pd.to_datetime(df[column], unit='s')
+            else:
+                # The same as pandas' parse_dates option, which doesn't accept missing columns.
+                df[column] = pd.to_datetime(df[column], errors='coerce', format=DATABASE_DATETIME_FORMAT)
+        return df
+
+    def _read_entries(self, connectable: Connectable, query: str, params: Sequence = ()) -> pd.DataFrame:
+        """
+        Runs a query for full entries, leaving out the columns which only exist for storage purposes.
+        """
+        df = self._read_sql(connectable, query, params)
+        return df.drop(columns=[x for x in DERIVED_DATE_COLUMNS if x in df.columns])
+
+    def _update_latest_table(self, connection: Connection, new_entries: pd.DataFrame) -> None:
+        """
+        Replaces the latest entry of each trip with the given entries, which must be more recent.
+        """
+        # If a trip shows up more than once, the last one wins.
+        new_latest_entries = new_entries[~new_entries['Viagem'].duplicated(keep='last')]
+        for chunk in self._chunk_trip_names(list(new_latest_entries['Viagem'])):
+            placeholders = ', '.join('?' * len(chunk))
+            connection.execute(f'delete from {self.LATEST_TABLE} where Viagem in ({placeholders})', tuple(chunk))
+        new_latest_entries.to_sql(self.LATEST_TABLE, con=connection, if_exists='append')
+
+    def _read_latest_entries_for_trips(self, connectable: Connectable, trip_names: Sequence[str]) -> pd.DataFrame:
+        """
+        Queries the latest log entry for each of the given trip names,
+        in as few queries as the SQLite parameter limit allows.
+
+        Args:
+            connectable: Where to run the queries, e.g. a connection inside a transaction.
+            trip_names: e.g. ['MCBF124', 'MCBF125']
+
+        Returns:
+            A dataframe with at most one entry per trip. Trips that are not found are left out.
+        """
+        chunks = []
+        for chunk in self._chunk_trip_names(trip_names):
+            placeholders = ', '.join('?' * len(chunk))
+            chunks.append(self._read_entries(
+                connectable,
+                f'select * from {self.LATEST_TABLE} where Viagem in ({placeholders})',
+                chunk
+            ))
+
+        if len(chunks) == 0:
+            return self._read_entries(connectable, f'select * from {self.LATEST_TABLE} where 0')
+        return pd.concat(chunks, ignore_index=True)
+
+    @cached_read
     def read_entries_for_trip(self, trip_name: str) -> Optional[pd.DataFrame]:
         """
         Queries the log entries for the given trip name, ordered from most to least recent.
@@ -92,15 +882,142 @@ class LogKeeper:
         Returns:
             A dataframe with the log entries, or None if the trip is not found.
         """
-        date_dict = {x: DATABASE_DATETIME_FORMAT for x in SCHEDULE_DATE_COLUMNS + ['date_retrieved']}
-        df = pd.read_sql(
-            f'select * from {self.LOGS_TABLE} where Viagem = ? order by date_retrieved desc',
-            con=self.engine,
-            params=(trip_name,),
-            parse_dates=date_dict
-        )
+        df = self._read_entries_for_trips([trip_name])
         return None if df.empty else df
 
+    @cached_read
+    def read_entries_for_trips(self, trip_names: Sequence[str]) -> pd.DataFrame:
+        """
+        Queries the log entries for each of the given trip names,
+        in as few queries as the SQLite parameter limit allows.
+
+        Args:
+            trip_names: e.g. ['MCBF124', 'MCBF125']
+
+        Returns:
+            A dataframe with the entries of each trip together, in the order the trips were given,
+            and each trip's entries ordered from most to least recent. Trips that are not found are left out.
+        """
+        return self._read_entries_for_trips(trip_names)
+
+    def _read_entries_for_trips(self, trip_names: Sequence[str]) -> pd.DataFrame:
+        """
+        Does the work of read_entries_for_trips, without going through the read cache.
+        """
+        trip_names = list(dict.fromkeys(trip_names))
+
+        if self.logs_layout == LogsLayout.DELTA:
+            rows = []
+            with self.read_engine.connect() as connection:
+                column_names = [row['name'] for row in connection.execute(f'pragma table_info({self.LOGS_TABLE})')]
+                for chunk in self._chunk_trip_names(trip_names):
+                    rows_by_trip = self._reconstruct_rows(connection, chunk)
+                    for trip_name in chunk:
+                        rows.extend(rows_by_trip.get(trip_name, [])[::-1])
+            df = self._decode_dates(pd.DataFrame.from_records(rows, columns=column_names, coerce_float=True))
+            return df.drop(columns=[x for x in DERIVED_DATE_COLUMNS if x in df.columns])
+
+        with self.read_engine.connect() as connection:
+            chunks = [
+                self._read_entries(
+                    connection,
+                    f'select * from {self.LOGS_TABLE} where Viagem in ({", ".join("?" * len(chunk))})',
+                    chunk
+                )
+                for chunk in self._chunk_trip_names(trip_names)
+            ]
+            if len(chunks) == 0:
+                return self._read_entries(connection, f'select * from {self.LOGS_TABLE} where 0')
+
+        df = pd.concat(chunks, ignore_index=True)
+        trip_order = df['Viagem'].map({trip_name: i for i, trip_name in enumerate(trip_names)})
+        order = np.lexsort((-df['date_retrieved'].values.astype(np.int64), trip_order.values))
+        return df.iloc[order].reset_index(drop=True)
+
+    def count_entries_by_month(self) -> Dict[str, int]:
+        """
+        Counts the log entries by the month they were retrieved in.
+
+        Returns:
+            The number of entries for each month, e.g. {'2019-01': 1234}
+        """
+        if self.datetime_storage == DatetimeStorage.EPOCH:
+            month = "strftime('%Y-%m', {}, 'unixepoch')"
+        else:
+            month = 'substr({}, 1, 7)'
+
+        counts: Dict[str, int] = {}
+        with self.read_engine.connect() as connection:
+            queries: List[Tuple[str, Tuple[Any, ...]]] = [
+                (f'select {month.format("date_retrieved")}, count(*) from {self.LOGS_TABLE} group by 1', ())
+            ]
+            if self.logs_layout == LogsLayout.DELTA:
+                # Every revision has a delta for its date_retrieved.
+                column_names = [row['name'] for row in connection.execute(f'pragma table_info({self.LOGS_TABLE})')]
+                queries.append((
+                    f'select {month.format("value")}, count(*) from {self.DELTAS_TABLE} where column_id = ? group by 1',
+                    (column_names.index('date_retrieved'),)
+                ))
+            for query, params in queries:
+                for entries_month, count in connection.execute(query, params):
+                    counts[entries_month] = counts.get(entries_month, 0) + count
+        return counts
+
+    def read_entries_retrieved_between(self, start: datetime, end: datetime) -> pd.DataFrame:
+        """
+        Queries the log entries retrieved in a date/time range,
+        ordered by the date they were retrieved, then by trip name.
+
+        Args:
+            start: The beginning of the range, inclusive.
+            end: The end of the range, exclusive.
+        """
+        encoded_start = self._encode_date(start)
+        encoded_end = self._encode_date(end)
+        if self.logs_layout == LogsLayout.FULL:
+            return self._read_entries(self.read_engine, (
+                f'select * from {self.LOGS_TABLE} where date_retrieved >= ? and date_retrieved < ? '
+                'order by date_retrieved, Viagem'
+            ), (encoded_start, encoded_end))
+
+        # Only the trips that were being updated in the range have entries in it.
+        with self.read_engine.connect() as connection:
+            column_names = [row['name'] for row in connection.execute(f'pragma table_info({self.LOGS_TABLE})')]
+            date_retrieved_id = column_names.index('date_retrieved')
+            trip_names = [
+                x for (x,) in connection.execute((
+                    f'select Viagem from {self.LOGS_TABLE} where date_retrieved < ? '
+                    f'and Viagem in (select Viagem from {self.LATEST_TABLE} where date_retrieved >= ?)'
+                ), (encoded_end, encoded_start))
+            ]
+            rows = [
+                row
+                for chunk in self._chunk_trip_names(trip_names)
+                for trip_rows in self._reconstruct_rows(connection, chunk).values()
+                for row in trip_rows
+                if encoded_start <= row[date_retrieved_id] < encoded_end
+            ]
+
+        df = self._decode_dates(pd.DataFrame.from_records(rows, columns=column_names, coerce_float=True))
+        df = df.drop(columns=[x for x in DERIVED_DATE_COLUMNS if x in df.columns])
+        return df.sort_values(['date_retrieved', 'Viagem']).reset_index(drop=True)
+
+    @cached_read
+    def read_latest_entries(self, trip_names: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """
+        Queries the latest log entry for each of the given trips, or for every trip.
+
+        Args:
+            trip_names: e.g. ['MCBF124', 'MCBF125']. All the trips if None.
+
+        Returns:
+            A dataframe with at most one entry per trip. Trips that are not found are left out.
+        """
+        if trip_names is None:
+            return self._read_entries(self.read_engine, f'select * from {self.LATEST_TABLE}')
+        return self._read_latest_entries_for_trips(self.read_engine, trip_names)
+
+    @cached_read
     def read_latest_entry_for_trip(self, trip_name: str) -> Optional[pd.Series]:
         """
         Queries the latest log entry for the given trip name.
@@ -111,10 +1028,16 @@ class LogKeeper:
         Returns:
             The entry, or None if the trip is not found.
         """
-        entries = self.read_entries_for_trip(trip_name)
-        return None if entries is None else entries.iloc[0]
+        entries = self._read_latest_entries_for_trips(self.read_engine, [trip_name])
+        return None if entries.empty else entries.iloc[0]
 
-    def read_ships_at_port(self, arrives_before: datetime, sails_after: datetime) -> pd.DataFrame:
+    @cached_read
+    def read_ships_at_port(
+        self,
+        arrives_before: datetime,
+        sails_after: datetime,
+        as_of: Optional[datetime] = None
+    ) -> pd.DataFrame:
         """
         Queries the ships present at the port in a given date/time range.
         Includes, ships that have arrived, berthed, or recently sailed (left).
@@ -124,6 +1047,8 @@ class LogKeeper:
                             e.g. include ships that arrived since X.
             sails_after: Minimum threshold for the sailing date/time.
                          e.g. include ships that will be in the port until X.
+            as_of: Use the information as it was known at this date/time, i.e. the entries retrieved
+                   up to it, instead of the latest entries.
 
         Returns:
             A dataframe contaiing the latest log entries for the relevant ships.
@@ -138,27 +1063,128 @@ class LogKeeper:
                 TB_is_predicted: indicates if TB is actual (confirmed time), or an estimation.
                 TS_is_predicted: indicates if TS is actual (confirmed time), or an estimation.
         """
-        date_dict = {x: DATABASE_DATETIME_FORMAT for x in ['TA', 'TB', 'TS']}
+        if as_of is None:
+            return self._read_ships_at_port(self.read_engine, self.LATEST_TABLE, arrives_before, sails_after)
+
+        if self.logs_layout == LogsLayout.FULL:
+            # Trips without entries after the date are the same as they are now.
+            # For the others, the entry as of the date is found with a lookup in the (Viagem, date_retrieved) index.
+            encoded_as_of = self._encode_date(as_of)
+            entries_as_of = (
+                "(\n"
+                f"   select * from {self.LATEST_TABLE} where date_retrieved <= ?\n"
+                "   union all\n"
+                f"   select * from {self.LOGS_TABLE} where rowid in (\n"
+                "      select (\n"
+                f"         select rowid from {self.LOGS_TABLE} as revisions\n"
+                "         where revisions.Viagem = trips.Viagem and revisions.date_retrieved <= ?\n"
+                "         order by revisions.date_retrieved desc limit 1\n"
+                f"      ) from {self.LATEST_TABLE} as trips where trips.date_retrieved > ?\n"
+                "   )\n"
+                f") as {self.AS_OF_TABLE}"
+            )
+            return self._read_ships_at_port(
+                self.read_engine, entries_as_of, arrives_before, sails_after,
+                (encoded_as_of, encoded_as_of, encoded_as_of), self.AS_OF_TABLE
+            )
 
-        max_arrival = arrives_before.strftime(DATABASE_DATETIME_FORMAT)
-        min_sailing = sails_after.strftime(DATABASE_DATETIME_FORMAT)
+        # The delta layout has to put the entries back together first.
+        # They go in a temporary table, so that the same query can be used.
+        with self.read_engine.connect() as connection:
+            self._create_entries_as_of_table(connection, as_of)
+            try:
+                return self._read_ships_at_port(connection, self.AS_OF_TABLE, arrives_before, sails_after)
+            finally:
+                connection.execute(f'drop table temp.{self.AS_OF_TABLE}')
 
-        return pd.read_sql((
+    def _read_ships_at_port(
+        self,
+        connectable: Connectable,
+        source: str,
+        arrives_before: datetime,
+        sails_after: datetime,
+        source_params: Sequence = (),
+        source_name: Optional[str] = None
+    ) -> pd.DataFrame:
+        """
+        Queries the ships present at the port from a set of entries. See read_ships_at_port.
+
+        Args:
+            connectable: Where to run the query.
+            source: What to select from: a table, or a subquery, with at most one entry per trip.
+            arrives_before: See read_ships_at_port.
+            sails_after: See read_ships_at_port.
+            source_params: The parameters of the subquery.
+            source_name: The alias of the subquery. Defaults to the source itself, i.e. a table name.
+        """
+        source_name = source_name or source
+        params: Tuple[Any, Any]
+        if self.datetime_storage == DatetimeStorage.EPOCH:
+            # The stored microseconds make a text date equal to the threshold compare as greater.
+            # The epoch storage has to exclude that case explicitly to give the same results.
+            selected_dates = 'TA, TB, TS'
+            conditions = 'TA < ? and TS >= ?'
+            params = (
+                get_epoch_seconds_from_naive_datetime(arrives_before),
+                get_epoch_seconds_from_naive_datetime(sails_after)
+            )
+        else:
+            selected_dates = 'ifnull(ETA, ATA) as TA, ifnull(ATB, ETB) as TB, ifnull(ATS, ETS) as TS'
+            # Spelled out as in the indexes, so that they can be used.
+            # 'TS = NULL' was never true, so that condition was dropped.
+            conditions = 'ifnull(ETA, ATA) <= datetime(?) and ifnull(ATS, ETS) >= datetime(?)'
+            params = (
+                arrives_before.strftime(DATABASE_DATETIME_FORMAT),
+                sails_after.strftime(DATABASE_DATETIME_FORMAT)
+            )
+
+        return self._read_sql(connectable, (
             "select\n"
-            "   Berço, Navio, Viagem, ifnull(ETA, ATA) as TA, ifnull(ATB, ETB) as TB, ifnull(ATS, ETS) as TS,\n"
+            f"   Berço, Navio, Viagem, {selected_dates},\n"
             "   ATA is NULL as TA_is_predicted, ATB is NULL as TB_is_predicted, ATS is NULL as TS_is_predicted\n"
             "from\n"
-            f"   {self.LOGS_TABLE}\n"
+            f"   {source}\n"
             "where\n"
-            "   TA <= datetime(?)\n"
-            "   and (TS >= datetime(?) or TS = NULL)\n"
-            "group by\n"
-            "   Viagem\n"
-            "having\n"
-            "   date_retrieved = max(date_retrieved)\n"
+            f"   {conditions}\n"
             "order by\n"
-            "   TA, TB, TS, logs.Navio, logs.Viagem"),
-            con=self.engine,
-            params=(max_arrival, min_sailing),
-            parse_dates=date_dict
-        )
+            f"   TA, TB, TS, {source_name}.Navio, {source_name}.Viagem"
+        ), tuple(source_params) + params)
+
+    def _create_entries_as_of_table(self, connection: Connection, as_of: datetime) -> None:
+        """
+        Fills a temporary table with the entry of each trip as it was known at the given date/time,
+        in the delta layout. The table only exists for the given connection.
+        """
+        encoded_as_of = self._encode_date(as_of)
+        # Trips without entries after the date are the same as they are now.
+        connection.execute((
+            f'create temp table {self.AS_OF_TABLE} as '
+            f'select * from {self.LATEST_TABLE} where date_retrieved <= ?'
+        ), (encoded_as_of,))
+
+        # The others are put back together, up to the last entry before the date.
+        trip_names = [
+            x for (x,) in connection.execute((
+                f'select Viagem from {self.LOGS_TABLE} where date_retrieved <= ? '
+                f'and Viagem in (select Viagem from {self.LATEST_TABLE} where date_retrieved > ?)'
+            ), (encoded_as_of, encoded_as_of))
+        ]
+        column_names = [row['name'] for row in connection.execute(f'pragma table_info({self.LOGS_TABLE})')]
+        date_retrieved_id = column_names.index('date_retrieved')
+        placeholders = ', '.join('?' * len(column_names))
+        for chunk in self._chunk_trip_names(trip_names):
+            rows_as_of = [
+                [x for x in rows if x[date_retrieved_id] <= encoded_as_of][-1]
+                for rows in self._reconstruct_rows(connection, chunk).values()
+            ]
+            connection.execute(f'insert into temp.{self.AS_OF_TABLE} values ({placeholders})', rows_as_of)
+        self._update_derived_columns(connection, f'temp.{self.AS_OF_TABLE}')
+
+    def _encode_date(self, date: datetime) -> Any:
+        """
+        Converts a date to the way it is stored, according to the datetime storage,
+        so it can be compared to the stored dates.
+        """
+        if self.datetime_storage == DatetimeStorage.EPOCH:
+            return get_epoch_seconds_from_naive_datetime(date)
+        return date.strftime(DATABASE_STORED_DATETIME_FORMAT)
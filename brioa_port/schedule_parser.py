@@ -1,6 +1,29 @@
+import logging
+import numpy as np
+import os
 import pandas as pd
+import xlrd
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from brioa_port.util.pool import map_in_processes
+
+logger = logging.getLogger(__name__)
+
+# Changes whenever the results of parse_schedule_spreadsheet do, which discards the cached ones.
+PARSER_VERSION = 2
 
 SCHEDULE_DATE_COLUMNS = ['Abertura do Gate', 'Deadline', 'ETA', 'ATA', 'ETB', 'ATB', 'ETS', 'ATS']
+SCHEDULE_DATE_FORMAT = '%d/%m/%Y %H:%M:%S'
+# The other columns with a known type, which doesn't have to be inferred.
+SCHEDULE_FLOAT_COLUMNS = ['Berço']
+SCHEDULE_TEXT_COLUMNS = ['Navio', 'Viagem']
+# The strings that pd.read_excel considers missing values.
+NA_STRINGS = {
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null',
+}
 
 
 def parse_dates(orig_df: pd.DataFrame) -> pd.DataFrame:
@@ -13,13 +36,74 @@ def parse_dates(orig_df: pd.DataFrame) -> pd.DataFrame:
     """
     df = orig_df.copy()
 
-    date_format = '%d/%m/%Y %H:%M:%S'
-    for date_column in SCHEDULE_DATE_COLUMNS:
-        df[date_column] = pd.to_datetime(df[date_column], format=date_format)
+    date_columns = parse_date_columns({x: df[x].values for x in SCHEDULE_DATE_COLUMNS})
+    for date_column, dates in date_columns.items():
+        df[date_column] = dates
 
     return df
 
 
+def parse_date_columns(columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Parses the date columns of the schedule spreadsheet, all together,
+    so that the strings are parsed in a single pass.
+    Cells that are already dates are taken as they are.
+
+    Args:
+        columns: The raw columns, by name, including at least the SCHEDULE_DATE_COLUMNS.
+    Returns:
+        The SCHEDULE_DATE_COLUMNS, as arrays of datetime64[ns].
+    """
+    values = np.concatenate([np.asarray(columns[x], dtype=object) for x in SCHEDULE_DATE_COLUMNS])
+    is_string = np.fromiter((isinstance(x, str) for x in values), dtype=bool, count=len(values))
+    is_other = ~is_string & ~pd.isnull(values)
+
+    dates = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[ns]')
+    dates[is_string] = parse_date_strings(values[is_string])
+    if is_other.any():
+        dates[is_other] = pd.to_datetime(values[is_other]).values
+
+    n_rows = len(values) // len(SCHEDULE_DATE_COLUMNS)
+    return {
+        date_column: dates[i * n_rows:(i + 1) * n_rows]
+        for i, date_column in enumerate(SCHEDULE_DATE_COLUMNS)
+    }
+
+
+def parse_date_strings(date_strings: np.ndarray) -> np.ndarray:
+    """
+    Parses dates in the format that the schedule spreadsheet uses, e.g. '31/01/2019 23:59:00'.
+    The characters are rearranged into ISO 8601, which numpy parses much faster than strptime.
+    If any of the strings doesn't have exactly that format, pd.to_datetime is used instead,
+    so that the results and the errors are the same.
+
+    Returns:
+        An array of datetime64[ns].
+    """
+    chars = date_strings.astype(str)
+    if len(chars) > 0 and chars.dtype == np.dtype('U19'):
+        # The code points of each character. Shorter strings are padded with zeros.
+        codes = chars.view(np.uint32).reshape(-1, 19)
+        digits = codes[:, [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]]
+        is_formatted = (
+            ((digits >= ord('0')) & (digits <= ord('9'))).all()
+            and (codes[:, [2, 5]] == ord('/')).all()
+            and (codes[:, 10] == ord(' ')).all()
+            and (codes[:, [13, 16]] == ord(':')).all()
+        )
+        if is_formatted:
+            # From 'dd/mm/YYYY HH:MM:SS' to 'YYYY-mm-dd HH:MM:SS'.
+            iso_codes = codes[:, [6, 7, 8, 9, 2, 3, 4, 5, 0, 1, 10, 11, 12, 13, 14, 15, 16, 17, 18]]
+            iso_codes[:, [4, 7]] = ord('-')
+            try:
+                return np.ascontiguousarray(iso_codes).view('U19').ravel().astype('datetime64[ns]')
+            except ValueError:
+                # e.g. an invalid day of the month. Left for pd.to_datetime to report.
+                pass
+
+    return pd.to_datetime(date_strings, format=SCHEDULE_DATE_FORMAT).values
+
+
 def normalize_ship_name(ship_name: str) -> str:
     """
     Removes the redundant "trip name" after the ship name.
@@ -34,17 +118,154 @@ def normalize_ship_name(ship_name: str) -> str:
     return ship_name.split(' - ')[0]
 
 
-def parse_schedule_spreadsheet(path: str) -> pd.DataFrame:
+def normalize_ship_names(ship_names: pd.Series) -> pd.Series:
+    """
+    Applies normalize_ship_name to a whole column at once. Missing names are kept missing.
+    """
+    return ship_names.str.split(' - ', n=1).str[0]
+
+
+def read_cells(sheet: xlrd.sheet.Sheet, column_id: int, datemode: int) -> List[Any]:
+    """
+    Reads the cells of a column below the header, converted as pd.read_excel does:
+    numbers without a fractional part become integers, errors and missing values become NaN,
+    and dates become datetime objects.
+    """
+    cells = []
+    for value, cell_type in zip(sheet.col_values(column_id, start_rowx=1), sheet.col_types(column_id, start_rowx=1)):
+        if cell_type == xlrd.XL_CELL_TEXT:
+            cells.append(np.nan if value in NA_STRINGS else value)
+        elif cell_type == xlrd.XL_CELL_NUMBER:
+            cells.append(int(value) if value == int(value) else value)
+        elif cell_type == xlrd.XL_CELL_DATE:
+            date = xlrd.xldate.xldate_as_datetime(value, datemode)
+            # Dates on the epoch are times only.
+            is_time = date.timetuple()[0:3] == ((1904, 1, 1) if datemode == 1 else (1899, 12, 31))
+            cells.append(date.time() if is_time else date)
+        elif cell_type == xlrd.XL_CELL_BOOLEAN:
+            cells.append(bool(value))
+        else:
+            cells.append(np.nan)
+    return cells
+
+
+def read_column_names(sheet: xlrd.sheet.Sheet) -> List[str]:
+    """
+    Reads the header of a sheet, naming the columns as pd.read_excel does:
+    unnamed ones after their position, and repeated names with a suffix, e.g. 'Navio.1'.
+    """
+    names = []
+    counts: Dict[str, int] = {}
+    for column_id, cell in enumerate(sheet.row(0)):
+        if cell.ctype == xlrd.XL_CELL_NUMBER and cell.value == int(cell.value):
+            name = str(int(cell.value))
+        else:
+            name = str(cell.value)
+        if name == '':
+            name = f'Unnamed: {column_id}'
+        if name in counts:
+            counts[name] += 1
+            name = f'{name}.{counts[name]}'
+        else:
+            counts[name] = 0
+        names.append(name)
+    return names
+
+
+def read_schedule_columns(
+    path: Union[str, IO[bytes]],
+    columns: Optional[Sequence[str]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    Reads the first sheet of the schedule spreadsheet, a column at a time, with the same values
+    as pd.read_excel. The columns with a known type are given it directly, instead of having it inferred,
+    and the date columns are left as they are, to be parsed.
+
+    Args:
+        path: Where to read the spreadsheet from, or the open file.
+        columns: Which columns to read. All of them if None.
+    Returns:
+        The columns, by name, in the order they are in the sheet.
+    """
+    if isinstance(path, str):
+        workbook = xlrd.open_workbook(path)
+    else:
+        workbook = xlrd.open_workbook(file_contents=path.read())
+    sheet = workbook.sheet_by_index(0)
+    if sheet.nrows == 0:
+        return {}
+
+    data: Dict[str, np.ndarray] = OrderedDict()
+    for column_id, name in enumerate(read_column_names(sheet)):
+        if columns is not None and name not in columns:
+            continue
+
+        cells = np.array(read_cells(sheet, column_id, workbook.datemode), dtype=object)
+        if name in SCHEDULE_FLOAT_COLUMNS:
+            data[name] = pd.to_numeric(cells, errors='coerce').astype(float)
+        elif name in SCHEDULE_TEXT_COLUMNS or name in SCHEDULE_DATE_COLUMNS:
+            data[name] = cells
+        else:
+            # Numeric if every value can be one, as pd.read_excel infers it.
+            try:
+                data[name] = pd.to_numeric(cells)
+            except (ValueError, TypeError):
+                data[name] = cells
+    return data
+
+
+def parse_schedule_spreadsheet(
+    path: Union[str, IO[bytes]],
+    columns: Optional[Sequence[str]] = None
+) -> pd.DataFrame:
     """
     Applies all the parsing and normalization steps to the raw
     schedule spreadsheet.
 
     Args:
-        path: Where to read the spreadsheet from
+        path: Where to read the spreadsheet from, or the open file
+        columns: Which other columns to read, besides the ship name and the dates,
+                 which are always read. All of them if None.
     Returns:
         A dataframe with the parsed data.
     """
-    df = pd.read_excel(path)
-    df = parse_dates(df)
-    df['Navio'] = df['Navio'].apply(normalize_ship_name)
-    return df
+    if columns is not None:
+        columns = ['Navio', *SCHEDULE_DATE_COLUMNS, *columns]
+
+    data = read_schedule_columns(path, columns)
+    data.update(parse_date_columns(data))
+    data['Navio'] = normalize_ship_names(pd.Series(data['Navio'])).values
+    return pd.DataFrame(data, columns=list(data.keys()))
+
+
+def parse_schedule_spreadsheets(
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    parse: Callable[[str], pd.DataFrame] = parse_schedule_spreadsheet
+) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+    """
+    Parses many spreadsheets in a pool of processes,
+    returning the results in the same order as the given paths.
+    Only a few spreadsheets per worker are parsed ahead of the one being returned,
+    so that the memory usage doesn't depend on the number of spreadsheets.
+
+    Args:
+        paths: Where to read the spreadsheets from.
+        workers: How many processes to use. Defaults to the number of CPUs.
+        parse: How to parse each spreadsheet, e.g. ParsedSpreadsheetCache.parse.
+               Must be picklable, to be sent to the processes.
+
+    Returns:
+        The path and the parsed dataframe, or None if it could not be parsed.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    for path, future in map_in_processes(parse, paths, workers):
+        try:
+            result = future.result()
+        # A broken spreadsheet can fail anywhere in xlrd, with any kind of error.
+        except Exception as e:
+            logger.warning(f"Ignoring spreadsheet at '{path}'. The error was: {e}")
+            result = None
+        yield path, result
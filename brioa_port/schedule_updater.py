@@ -0,0 +1,147 @@
+import hashlib
+import io
+import logging
+import pandas as pd
+
+from datetime import datetime
+from typing import Optional
+
+from brioa_port.log_keeper import LogKeeper, find_new_entries
+from brioa_port.schedule_parser import parse_schedule_spreadsheet
+from brioa_port.spreadsheet_archive import SpreadsheetArchive
+from brioa_port.util.request import fetch_url_if_modified
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_SPREADSHEET_URL = 'http://www.portoitapoa.com.br/excel/'
+
+
+class ScheduleUpdater:
+    """
+    Keeps a logs database up to date with the schedule spreadsheet, over many updates.
+
+    The latest entry of every trip is kept in memory, loaded from the database on the first update,
+    and the spreadsheets are compared against it. The database is only used when there are
+    new entries to write. Those are checked again by the LogKeeper, so a concurrent writer
+    can't cause duplicate or outdated entries, but its entries won't be seen by this updater
+    until it's restarted.
+
+    The spreadsheet is only downloaded if the server reports it has changed since the previous download,
+    and only parsed if its content is different from the previous one.
+    With an archive, every download is recorded in it, before being parsed, so it can be replayed later.
+
+    Attributes:
+        log_keeper: Where the entries are written.
+        spreadsheet_url: Where to download the schedule spreadsheet from.
+        archive: Where to keep the downloaded spreadsheets, if anywhere.
+        latest_entries: The latest entry of each trip, indexed by trip name.
+                        None before the first update, or while the database is empty.
+        n_online_updates: How many times update_online was called.
+        n_unchanged_online_updates: How many of those found the same spreadsheet as the previous one,
+                                    and skipped parsing it.
+    """
+
+    def __init__(
+        self,
+        log_keeper: LogKeeper,
+        spreadsheet_url: str = SCHEDULE_SPREADSHEET_URL,
+        archive: Optional[SpreadsheetArchive] = None
+    ) -> None:
+        self.log_keeper = log_keeper
+        self.spreadsheet_url = spreadsheet_url
+        self.archive = archive
+        self.latest_entries: Optional[pd.DataFrame] = None
+        self.n_online_updates = 0
+        self.n_unchanged_online_updates = 0
+        self._is_loaded = False
+        # About the last spreadsheet that was written.
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        self._content_hash: Optional[str] = None
+
+    def update_online(self) -> int:
+        """
+        Downloads the current schedule spreadsheet and writes its new entries.
+        Nothing is parsed or written if the spreadsheet didn't change since the previous update.
+
+        Returns:
+            The number of new entries which were inserted.
+        """
+        self.n_online_updates += 1
+        response = fetch_url_if_modified(self.spreadsheet_url, self._etag, self._last_modified)
+        date_retrieved = datetime.now()
+
+        content_hash = None if response.content is None else hashlib.sha256(response.content).hexdigest()
+        if self.archive is not None:
+            if response.content is not None:
+                self.archive.add(date_retrieved, response.content)
+            elif self._content_hash is not None:
+                # Not downloaded again, but still the same spreadsheet as the one written.
+                self.archive.add_retrieval(date_retrieved, self._content_hash)
+
+        if response.content is None or content_hash == self._content_hash:
+            self._etag, self._last_modified = response.etag, response.last_modified
+            self.n_unchanged_online_updates += 1
+            logger.info((
+                f'{date_retrieved.strftime("%Y-%m-%d %H:%M:%S")}: unchanged '
+                f'({self.n_unchanged_online_updates} of {self.n_online_updates} updates skipped)'
+            ))
+            return 0
+
+        entries = parse_schedule_spreadsheet(io.BytesIO(response.content))
+        n_new_entries = self.update(date_retrieved, entries)
+        # Only once the entries are written, so that a failed update is tried again.
+        self._etag, self._last_modified, self._content_hash = response.etag, response.last_modified, content_hash
+
+        n_new_entries_str = '1 new entry' if n_new_entries == 1 else f'{n_new_entries} new entries'
+        logger.info(f'{date_retrieved.strftime("%Y-%m-%d %H:%M:%S")}: {n_new_entries_str}')
+        return n_new_entries
+
+    def update(self, date_retrieved: datetime, entries: pd.DataFrame) -> int:
+        """
+        Writes the entries which are new compared to the ones in memory,
+        with the same results as LogKeeper.write_entries.
+
+        Args:
+            date_retrieved: When the entries were retrieved.
+            entries: The parsed spreadsheet.
+
+        Returns:
+            The number of new entries which were inserted.
+        """
+        if not self._is_loaded:
+            self._load_latest_entries()
+
+        if self.latest_entries is None:
+            candidate_entries = entries
+        else:
+            candidate_entries = entries[find_new_entries(date_retrieved, entries, self.latest_entries)]
+            if candidate_entries.empty:
+                return 0
+
+        n_new_entries = self.log_keeper.write_entries(date_retrieved, candidate_entries)
+        if n_new_entries > 0:
+            self._refresh_latest_entries(candidate_entries['Viagem'].unique())
+        return n_new_entries
+
+    def _load_latest_entries(self) -> None:
+        """
+        Reads the latest entry of every trip from the database, if it has any.
+        """
+        if self.log_keeper.has_entries():
+            self.latest_entries = self.log_keeper.read_latest_entries().set_index('Viagem', drop=False)
+        self._is_loaded = True
+
+    def _refresh_latest_entries(self, trip_names: pd.Series) -> None:
+        """
+        Replaces the latest entries of the given trips in memory with the ones in the database.
+        """
+        if self.latest_entries is None:
+            self._load_latest_entries()
+            return
+
+        refreshed_entries = self.log_keeper.read_latest_entries(list(trip_names)).set_index('Viagem', drop=False)
+        self.latest_entries = pd.concat([
+            self.latest_entries.drop(refreshed_entries.index, errors='ignore'),
+            refreshed_entries,
+        ])
@@ -2,20 +2,42 @@
 """BRIOA Schedule Downloader
 
 Usage:
-    brioa_programacao.py update online <database_path> [--period <seconds>]
+    brioa_programacao.py update online <database_path> [--period <seconds>] [--archive-dir <dir>]
+                                       [--datetime-storage <storage>] [--logs-layout <layout>]
     brioa_programacao.py update from_file <file_path> <database_path> [--retrieved-at <date_retrieved>]
-    brioa_programacao.py current <database_path>
+                                          [--cache-dir <dir>] [--datetime-storage <storage>]
+                                          [--logs-layout <layout>]
+    brioa_programacao.py update from_dir <dir_path> <database_path> [--workers <n>] [--cache-dir <dir>]
+                                         [--datetime-storage <storage>] [--logs-layout <layout>]
+    brioa_programacao.py update from_archive <archive_dir> <database_path> [--workers <n>] [--cache-dir <dir>]
+                                             [--datetime-storage <storage>] [--logs-layout <layout>]
+    brioa_programacao.py current <database_path> [--as-of <date>]
     brioa_programacao.py trip <trip_name> <database_path>
+    brioa_programacao.py rebuild <database_path>
+    brioa_programacao.py convert <database_path> [--datetime-storage <storage>] [--logs-layout <layout>]
+    brioa_programacao.py export <database_path> <export_dir>
 
 Options:
+    <trip_name>     One or more trip names, separated by commas, or '-' to read them from stdin.
     --period <seconds>  To constantly update the database, set the update frequency with this option.
+    --archive-dir <dir> Keep every downloaded spreadsheet in this directory, each distinct one stored once,
+                        so the updates can be replayed later with 'update from_archive'.
     --retrieved-at <date_retrieved> The date/time that the information in the file is from.
                                     ISO 8601 Format: 2000-01-01 00:00:00
                                     By default, it's taken from the filename (unix timestamp, local time).
+    --as-of <date>  Show the port as it was known at this date/time, instead of now.
+                    ISO 8601 Format: 2000-01-01 00:00:00
+    --workers <n>   How many processes to parse the spreadsheets with. Defaults to the number of CPUs.
+    --cache-dir <dir>   Keep the parsed spreadsheets in this directory, so that they are not parsed again
+                        when the same files are read later. Requires the 'cache' extra (pyarrow).
+    --datetime-storage <storage>    How dates are stored in the database: 'text' or 'epoch'.
+                                    When updating, only applies to new databases.
+    --logs-layout <layout>  How the revisions of each trip are stored: 'full' rows, or only the changed
+                            columns after the first one, with 'delta'. Smaller, but slower to write.
+                            When updating, only applies to new databases.
 
 """
 
-import functools
 import time
 import pandas as pd
 import schedule
@@ -26,28 +48,33 @@ from docopt import docopt
 from pathlib import Path
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-from typing import Dict, Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 from brioa_port.util.datetime import make_delta_human_readable
-from brioa_port.util.database import create_database_engine
+from brioa_port.util.database import create_database_engine, DatetimeStorage, LogsLayout
 from brioa_port.util.entry import get_ship_status, get_ship_berth_number, ShipStatus
-from brioa_port.util.args import parse_period_arg
-from brioa_port.schedule_parser import parse_schedule_spreadsheet
+from brioa_port.util.args import parse_period_arg, parse_workers_arg
+from brioa_port.schedule_parser import parse_schedule_spreadsheet, parse_schedule_spreadsheets
 from brioa_port.log_keeper import LogKeeper
+from brioa_port.schedule_updater import ScheduleUpdater
+from brioa_port.spreadsheet_archive import SpreadsheetArchive, replay_archive
+from brioa_port.exceptions import UnsupportedDatabaseVersionException, StorageMismatchException
 
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
 
-def determine_entry_status(entry: pd.Series) -> str:
+def determine_entry_status(entry: pd.Series, now: Optional[datetime] = None) -> str:
     """
     Takes the raw data from a ship entry and presents a human readable status.
     Uses the arrival, berthing, and sailing dates to determine the status of the ship.
+    The dates are described relative to the given date/time, or the current one.
     """
     # Use the current date to compare the with the others
     # Store it so that it's consistent over the runtime of the function
-    now = datetime.now()
+    if now is None:
+        now = datetime.now()
 
     status = get_ship_status(entry, now)
 
@@ -83,17 +110,32 @@ def determine_entry_status(entry: pd.Series) -> str:
     return status_desc
 
 
-def update_online_once(database_path: str) -> None:
-    spreadsheet_url = 'http://www.portoitapoa.com.br/excel/'
-    logkeeper = LogKeeper(create_database_engine(database_path))
-
-    new_data = parse_schedule_spreadsheet(spreadsheet_url)
-    date_retrieved = datetime.now()
+def parse_datetime_storage_arg(arg: Optional[str]) -> Optional[DatetimeStorage]:
+    """
+    Makes sure that a datetime storage argument, if given, is valid.
+    Exits otherwise.
+    """
+    if arg is None:
+        return None
+    try:
+        return DatetimeStorage(arg)
+    except ValueError:
+        logger.critical("Error: Datetime storage must be one of: %s", ', '.join(x.value for x in DatetimeStorage))
+        sys.exit(1)
 
-    n_new_entries = logkeeper.write_entries(date_retrieved, new_data)
 
-    n_new_entries_str = '1 new entry' if n_new_entries == 1 else f'{n_new_entries} new entries'
-    logging.info(f'{date_retrieved.strftime("%Y-%m-%d %H:%M:%S")}: {n_new_entries_str}')
+def parse_logs_layout_arg(arg: Optional[str]) -> Optional[LogsLayout]:
+    """
+    Makes sure that a logs layout argument, if given, is valid.
+    Exits otherwise.
+    """
+    if arg is None:
+        return None
+    try:
+        return LogsLayout(arg)
+    except ValueError:
+        logger.critical("Error: Logs layout must be one of: %s", ', '.join(x.value for x in LogsLayout))
+        sys.exit(1)
 
 
 def cmd_update_online(args: Dict[str, str]) -> None:
@@ -101,25 +143,79 @@ def cmd_update_online(args: Dict[str, str]) -> None:
     Updates a given database by downloading the current schedule spreadsheet
     from the website.
     Will run only once, or in a loop, depending on if a period is specified.
+    In a loop, the same database connection and the latest entries in memory
+    are kept between updates.
+    The downloaded spreadsheets can be kept in an archive.
     """
+    datetime_storage = parse_datetime_storage_arg(args['--datetime-storage'])
+    logs_layout = parse_logs_layout_arg(args['--logs-layout'])
+
+    # Handle period option
+    period = None
+    if args['--period'] is not None:
+        try:
+            period = parse_period_arg(args['--period'])
+        except ValueError as e:
+            logger.critical("Error: %s", e)
+            sys.exit(1)
+
+    logkeeper = LogKeeper(
+        create_database_engine(args['<database_path>'], persistent_connection=period is not None, concurrent=True),
+        datetime_storage,
+        logs_layout
+    )
+    archive = None if args['--archive-dir'] is None else SpreadsheetArchive(Path(args['--archive-dir']))
+    updater = ScheduleUpdater(logkeeper, archive=archive)
+
     # No period specified. Do it once.
-    if args['--period'] is None:
-        update_online_once(args['<database_path>'])
+    if period is None:
+        updater.update_online()
         return
 
-    # Handle period option
+    schedule.every(period).seconds.do(updater.update_online)
+    while True:
+        schedule.run_pending()
+        time.sleep(1)
+
+
+def get_date_from_filename(path: Path) -> Optional[datetime]:
+    """
+    Interprets a filename as a unix timestamp, in local time.
+    Returns None if it isn't one.
+    """
+    try:
+        return datetime.fromtimestamp(int(path.stem))
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def get_workers(args: Dict[str, str]) -> Optional[int]:
+    """
+    The number of processes given with the --workers option, if any.
+    Exits if it's invalid.
+    """
+    if args['--workers'] is None:
+        return None
     try:
-        period = parse_period_arg(args['--period'])
+        return parse_workers_arg(args['--workers'])
     except ValueError as e:
         logger.critical("Error: %s", e)
         sys.exit(1)
 
-    schedule.every(period).seconds.do(
-        functools.partial(update_online_once, args['<database_path>'])
-    )
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+
+def get_spreadsheet_parser(cache_dir: Optional[str]) -> Callable[[str], pd.DataFrame]:
+    """
+    Chooses how to parse the spreadsheets: through a cache in the given directory, if any.
+    """
+    if cache_dir is None:
+        return parse_schedule_spreadsheet
+
+    try:
+        from brioa_port.spreadsheet_cache import ParsedSpreadsheetCache
+    except ImportError:
+        logger.critical("Error: The cache requires pyarrow. Install brioa_port with the 'cache' extra.")
+        sys.exit(1)
+    return ParsedSpreadsheetCache(Path(cache_dir)).parse
 
 
 def cmd_update_from_file(args: Dict[str, str]) -> None:
@@ -128,16 +224,17 @@ def cmd_update_from_file(args: Dict[str, str]) -> None:
     The date of retrieval for the information in the spreadsheet can be
     inferred from the filename, or specified from an option.
     """
-    logkeeper = LogKeeper(create_database_engine(args['<database_path>']))
+    logkeeper = LogKeeper(
+        create_database_engine(args['<database_path>'], concurrent=True),
+        parse_datetime_storage_arg(args['--datetime-storage']),
+        parse_logs_layout_arg(args['--logs-layout'])
+    )
 
     spreadsheet_path = Path(args['<file_path>'])
-    new_data = parse_schedule_spreadsheet(str(spreadsheet_path))
+    new_data = get_spreadsheet_parser(args['--cache-dir'])(str(spreadsheet_path))
 
     # Try to parse a date from the filename
-    try:
-        date_from_filename: Optional[datetime] = datetime.fromtimestamp(int(spreadsheet_path.stem))
-    except (ValueError, OverflowError, OSError):
-        date_from_filename = None
+    date_from_filename = get_date_from_filename(spreadsheet_path)
 
     # Try to parse a date from the CLI option
     if args['--retrieved-at'] is not None:
@@ -160,17 +257,96 @@ def cmd_update_from_file(args: Dict[str, str]) -> None:
     logging.info('1 new entry' if n_new_entries == 1 else f'{n_new_entries} new entries')
 
 
+def cmd_update_from_dir(args: Dict[str, str]) -> None:
+    """
+    Updates a given database by reading all the spreadsheet files in a directory.
+    The files must be named with the unix timestamp of their retrieval date.
+    They are parsed in parallel, and written in order of retrieval date,
+    as if each one had been given to the from_file command.
+    """
+    logkeeper = LogKeeper(
+        create_database_engine(args['<database_path>'], concurrent=True),
+        parse_datetime_storage_arg(args['--datetime-storage']),
+        parse_logs_layout_arg(args['--logs-layout'])
+    )
+
+    workers = get_workers(args)
+    parse = get_spreadsheet_parser(args['--cache-dir'])
+
+    dated_paths = []
+    for path in sorted(Path(args['<dir_path>']).iterdir()):
+        date_retrieved = get_date_from_filename(path)
+        if path.is_file() and date_retrieved is not None:
+            dated_paths.append((date_retrieved, path))
+        else:
+            logger.warning(f"Ignoring '{path}'. Its name is not a unix timestamp.")
+    dated_paths.sort()
+    dates_by_path = {str(path): date_retrieved for date_retrieved, path in dated_paths}
+
+    def parsed_entries() -> Iterator[Tuple[datetime, pd.DataFrame]]:
+        for path, new_data in parse_schedule_spreadsheets(dates_by_path.keys(), workers, parse):
+            if new_data is not None:
+                yield dates_by_path[path], new_data
+
+    n_new_entries = logkeeper.write_entries_in_bulk(parsed_entries())
+    logging.info('1 new entry' if n_new_entries == 1 else f'{n_new_entries} new entries')
+
+
+def cmd_update_from_archive(args: Dict[str, str]) -> None:
+    """
+    Updates a given database with the spreadsheets kept in an archive by the online updates,
+    in order of retrieval date, with the same results as those updates.
+    """
+    archive_dir_path = Path(args['<archive_dir>'])
+    if not archive_dir_path.is_dir():
+        logger.critical(f"Error: No archive found at '{archive_dir_path}'")
+        sys.exit(1)
+
+    logkeeper = LogKeeper(
+        create_database_engine(args['<database_path>'], concurrent=True),
+        parse_datetime_storage_arg(args['--datetime-storage']),
+        parse_logs_layout_arg(args['--logs-layout'])
+    )
+    workers = get_workers(args)
+    parse = get_spreadsheet_parser(args['--cache-dir'])
+
+    n_new_entries = replay_archive(SpreadsheetArchive(archive_dir_path), logkeeper, workers, parse)
+    logging.info('1 new entry' if n_new_entries == 1 else f'{n_new_entries} new entries')
+
+
+def open_log_keeper_for_reading(database_path: str) -> LogKeeper:
+    """
+    Opens a database for the commands that only read from it.
+    The reads go through a read-only connection, so they don't have to wait for an update
+    that is running at the same time.
+    """
+    # The other engine creates the database if needed, which the read-only one can't do.
+    return LogKeeper(
+        create_database_engine(database_path),
+        read_engine=create_database_engine(database_path, concurrent=True, read_only=True)
+    )
+
+
 def cmd_current(args: Dict[str, str]) -> None:
     """
     Lists the ships that are currently at the port. Includes the arrived,
     berthed, and recenly sailed ships for the current day.
+    With the --as-of option, does the same for a past date, with the information known then.
     """
-    logkeeper = LogKeeper(create_database_engine(args['<database_path>']))
+    as_of = None
+    if args['--as-of'] is not None:
+        try:
+            as_of = datetime.strptime(args['--as-of'], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            logger.critical("Error: The date must be in the format 2000-01-01 00:00:00")
+            sys.exit(1)
+
+    logkeeper = open_log_keeper_for_reading(args['<database_path>'])
     if not logkeeper.has_entries():
         print("No entries found.")
         return
 
-    now = datetime.now()
+    now = datetime.now() if as_of is None else as_of
     in_a_day = now + relativedelta(days=1)
     start_of_today = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
@@ -178,27 +354,49 @@ def cmd_current(args: Dict[str, str]) -> None:
         # Include ships that have arrived or will arrive in 1 day
         arrives_before=in_a_day,
         # Include ships that won't sail today, i.e. are still at the port
-        sails_after=start_of_today
+        sails_after=start_of_today,
+        as_of=as_of
     )
 
     for index, entry in entries.iterrows():
-        print(f'{entry["Navio"]} ({entry["Viagem"]}): {determine_entry_status(entry)}')
+        print(f'{entry["Navio"]} ({entry["Viagem"]}): {determine_entry_status(entry, now)}')
+
+
+def parse_trip_names_arg(arg: str) -> List[str]:
+    """
+    Parses the trip names given to the trip command: separated by commas,
+    or, with '-', read from stdin, separated by whitespace.
+    """
+    if arg == '-':
+        return sys.stdin.read().split()
+    return [x.strip() for x in arg.split(',') if x.strip() != '']
 
 
 def cmd_trip(args: Dict[str, str]) -> None:
     """
-    Lists all the recorded log entries for the given trip name.
+    Shows the latest information about the given trips, all read at once.
     """
-    logkeeper = LogKeeper(create_database_engine(args['<database_path>']))
+    trip_names = parse_trip_names_arg(args['<trip_name>'])
+
+    logkeeper = open_log_keeper_for_reading(args['<database_path>'])
     if not logkeeper.has_entries():
         logger.error("No entries found.")
         return
 
-    entry = logkeeper.read_latest_entry_for_trip(args['<trip_name>'])
-    if entry is None:
-        logger.error("Trip not found.")
-        return
+    entries = logkeeper.read_latest_entries(trip_names).set_index('Viagem', drop=False)
+    for i, trip_name in enumerate(trip_names):
+        if i > 0:
+            print()
+        if trip_name not in entries.index:
+            logger.error(f"Trip not found: {trip_name}")
+            continue
+        print_trip(entries.loc[trip_name])
+
 
+def print_trip(entry: pd.Series) -> None:
+    """
+    Prints the ship of a trip, and how its arrival, berthing, and sailing went or are expected to go.
+    """
     def desc_event(action: str, date_expected: pd.Timestamp, date_actual: pd.Timestamp) -> str:
         """
         Builds a message representing the relative lateness/earliness of an event
@@ -240,17 +438,72 @@ def cmd_trip(args: Dict[str, str]) -> None:
         print(desc_event('Sail', entry['ETS'], entry['ATS']), 'at', entry['ETS'])
 
 
+def cmd_rebuild(args: Dict[str, str]) -> None:
+    """
+    Rebuilds the table with the latest entry for each trip from the full logs.
+    """
+    logkeeper = LogKeeper(create_database_engine(args['<database_path>']))
+    logkeeper.rebuild_latest_entries()
+
+
+def cmd_convert(args: Dict[str, str]) -> None:
+    """
+    Converts the dates and/or the logs in a database to another kind of storage.
+    """
+    datetime_storage = parse_datetime_storage_arg(args['--datetime-storage'])
+    logs_layout = parse_logs_layout_arg(args['--logs-layout'])
+    logkeeper = LogKeeper(create_database_engine(args['<database_path>']))
+    if datetime_storage is not None:
+        logkeeper.convert_datetime_storage(datetime_storage)
+    if logs_layout is not None:
+        logkeeper.convert_logs_layout(logs_layout)
+
+
+def cmd_export(args: Dict[str, str]) -> None:
+    """
+    Exports the logs as Parquet files, one per month, for analysis.
+    Only the months that changed since the last export are written.
+    """
+    try:
+        from brioa_port.log_export import export_logs
+    except ImportError:
+        logger.critical("Error: Exporting requires pyarrow. Install brioa_port with the 'export' extra.")
+        sys.exit(1)
+
+    logkeeper = LogKeeper(create_database_engine(args['<database_path>']))
+    if not logkeeper.has_entries():
+        logger.error("No entries found.")
+        return
+
+    exported_months = export_logs(logkeeper, Path(args['<export_dir>']))
+    logging.info('1 month exported' if len(exported_months) == 1 else f'{len(exported_months)} months exported')
+
+
 def main() -> None:
     args = docopt(__doc__)
 
-    if args['update'] and args['online']:
-        cmd_update_online(args)
-    if args['update'] and args['from_file']:
-        cmd_update_from_file(args)
-    elif args['current']:
-        cmd_current(args)
-    elif args['trip']:
-        cmd_trip(args)
+    try:
+        if args['update'] and args['online']:
+            cmd_update_online(args)
+        if args['update'] and args['from_file']:
+            cmd_update_from_file(args)
+        elif args['update'] and args['from_dir']:
+            cmd_update_from_dir(args)
+        elif args['update'] and args['from_archive']:
+            cmd_update_from_archive(args)
+        elif args['current']:
+            cmd_current(args)
+        elif args['trip']:
+            cmd_trip(args)
+        elif args['rebuild']:
+            cmd_rebuild(args)
+        elif args['convert']:
+            cmd_convert(args)
+        elif args['export']:
+            cmd_export(args)
+    except (UnsupportedDatabaseVersionException, StorageMismatchException) as e:
+        logger.critical("Error: %s", e)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
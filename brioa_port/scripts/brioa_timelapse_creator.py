@@ -7,42 +7,87 @@ Usage:
     brioa_timelapse_creator --database <database_path>  <output_path>
                             [--image-list-from-file <file_path>]
                             [--output-fps <int>]
+                            [--target-duration <duration> | --stride <n> | --every <interval>]
                             [--output-resolution <name>]
+                            [--resampling <name>]
+                            [--skip-duplicates <bits>]
+                            [--hash-index <file_path>]
+                            [--segment-dir <dir>]
+                            [--workers <n>]
                             [--no-progress]
 
 Options:
     --database <database_path>  Information about the ships in port will be obtained here.
     --image-list-from-file <file_path>  Read the image list from a file instead of the standard input.
     --output-fps <int>  Framerate of the output [default: 30].
+    --target-duration <duration>  Pick images evenly in time, for a video about this long, e.g. 60s or 2m.
+    --stride <n>    Pick one of every n images.
+    --every <interval>  Pick an image every so often, e.g. 30s, 10m, 1h or 1d.
+                        The images are picked by the timestamps in their names, without being opened,
+                        and before the duplicates are left out.
     --output-resolution <name>    Resolution of the output. The valid values are 1080p or 720p [default: 1080p].
+    --resampling <name>   Whether to favor the quality or the speed of scaling the images.
+                          The valid values are quality or speed [default: quality].
+    --skip-duplicates <bits>  Leave out the images that look the same as the last one kept:
+                              their perceptual hashes differ in at most this many of 64 bits.
+    --hash-index <file_path>  Keep the images' hashes in this file, so that they're not computed again.
+    --segment-dir <dir>  Render each day into a video of its own, kept in this directory, and join them.
+                         The videos are in the output's format, by its extension, to be joined as they are.
+                         The days that were rendered before, with the same images, ships and settings, are reused.
+    --workers <n>   How many processes to render the frames with,
+                    or with --segment-dir, how many days to render at once [default: 1].
     --no-progress   Don't show a progress bar.
 
 """
 
+import hashlib
+import json
 import os.path
 import sys
 import logging
+import pandas as pd
 
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
 from docopt import docopt
+from functools import partial
+from itertools import chain
 from PIL import Image
 from subprocess import Popen, PIPE
 from pathlib import Path
-from typing import List, Generator, Iterable, Tuple, Dict, NamedTuple
+from typing import (
+    IO, Callable, List, Generator, Iterable, Iterator, Tuple, Dict, NamedTuple, Optional, Sequence, Union
+)
 from tqdm import tqdm
 
-from brioa_port.timelapse_frame_processor import TimelapseFrameProcessor
+from brioa_port.berth_timeline import BerthTimeline
+from brioa_port.exceptions import VideoEncodingException
+from brioa_port.image_hash_index import compute_image_hash, skip_duplicate_images, HASH_BITS, ImageHashIndex
+from brioa_port.timelapse_frame_processor import Resampling, TimelapseFrameProcessor
+from brioa_port.util.args import parse_interval_arg, parse_stride_arg, parse_workers_arg
 from brioa_port.util.database import create_database_engine
+from brioa_port.util.pool import map_in_processes
 from brioa_port.log_keeper import LogKeeper
 
 
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# How many consecutive images are rendered by a worker at a time.
+# Consecutive frames are likely to share a sidebar, which is only reused within the same worker.
+IMAGES_PER_TASK = 4
 
-def start_ffmpeg_process(output_path: str, image_format: str, fps: int) -> Popen:
+# Changing how the frames are rendered or encoded must change this, so that the segments rendered before aren't reused.
+SEGMENT_VERSION = 1
+
+# A frame, or its pixels in raw RGB, as the worker processes send them back.
+# The pixels are cheaper to send than the image, and are written to FFmpeg as they are.
+Frame = Union[Image.Image, bytes]
+
+
+def start_ffmpeg_process(output_path: str, dimensions: Tuple[int, int], fps: int) -> Popen:
     """
-    Start and FFmpeg process that reads images from stdin in the given format
+    Start and FFmpeg process that reads raw RGB frames of the given dimensions from stdin
     and joins them into a video at the given output path.
     """
     return Popen(
@@ -52,10 +97,11 @@ def start_ffmpeg_process(output_path: str, image_format: str, fps: int) -> Popen
             '-y',
             # Don't output warnings and other information
             '-loglevel', 'error',
-            # Take images from a pipe (duh)
-            '-f', 'image2pipe',
-            # The images will be in this format
-            '-vcodec', image_format,
+            # Take the frames' pixels from a pipe, one frame after the other, with nothing in between
+            '-f', 'rawvideo',
+            # One byte for each of red, green and blue, pixel by pixel, row by row
+            '-pix_fmt', 'rgb24',
+            '-video_size', f'{dimensions[0]}x{dimensions[1]}',
             '-framerate', str(fps),
             # Read from STDIN
             '-i', '-',
@@ -67,49 +113,290 @@ def start_ffmpeg_process(output_path: str, image_format: str, fps: int) -> Popen
     )
 
 
-def make_frames_into_video(frames: Iterable[Image.Image], output_path: Path, fps: int) -> None:
+def write_raw_frame(frame: Frame, f: IO[bytes]) -> None:
+    """
+    Writes the pixels of an RGB frame, with no header.
+    An image's pixels are copied into bytes first, once per frame: Pillow keeps each RGB pixel in four bytes,
+    so there's no buffer of its own to write as it is. Pixels that are already bytes are written as they are.
+    """
+    f.write(frame if isinstance(frame, bytes) else frame.tobytes())
+
+
+def make_frames_into_video(frames: Iterable[Frame], output_path: Path, dimensions: Tuple[int, int], fps: int) -> int:
     """
-    Takes some images and joins them into a video file using FFmpeg.
+    Takes some frames and joins them into a video file using FFmpeg.
+    If there are no frames, no video is made.
 
     Args:
-        frames: The images to join.
+        frames: The frames to join.
         output_path: Where to put the video.
+        dimensions: The dimensions of every frame.
         fps: The framerate of the video.
+
+    Returns:
+        The number of frames in the video.
+
+    Raises:
+        VideoEncodingException: If FFmpeg fails.
     """
-    # Use PPM to pass the images to FFmpeg.
-    # It's faster than, say, JPEG because it has no compression.
-    image_format = 'ppm'
+    frames_iter = iter(frames)
+    first_frame = next(frames_iter, None)
+    if first_frame is None:
+        return 0
 
-    ffmpeg_process = start_ffmpeg_process(str(output_path), image_format, fps)
+    # Pass the bare pixels to FFmpeg, so that nothing has to be encoded or decoded on the way,
+    # not even the header of an image format.
+    ffmpeg_process = start_ffmpeg_process(str(output_path), dimensions, fps)
 
-    for frame in frames:
-        frame.save(ffmpeg_process.stdin, image_format)
+    n_frames = 0
+    for frame in chain([first_frame], frames_iter):
+        write_raw_frame(frame, ffmpeg_process.stdin)
+        n_frames += 1
 
     ffmpeg_process.stdin.close()
-    ffmpeg_process.wait()
+    if ffmpeg_process.wait() != 0:
+        raise VideoEncodingException(f"FFmpeg failed to make the video at '{output_path}'")
+    return n_frames
 
 
-def process_images(
-        image_paths: Iterable[str],
+def concatenate_videos(video_paths: Sequence[Path], output_path: Path, list_dir_path: Path) -> None:
+    """
+    Joins videos with the same encoding settings into one, one after the other, using FFmpeg,
+    without encoding them again.
+
+    Args:
+        video_paths: The videos to join, in order.
+        output_path: Where to put the video.
+        list_dir_path: Where to write the list of videos for FFmpeg to read.
+
+    Raises:
+        VideoEncodingException: If FFmpeg fails.
+    """
+    list_path = list_dir_path / f'concat.{os.getpid()}.txt'
+    with open(list_path, 'wt') as f:
+        for video_path in video_paths:
+            quoted_path = str(video_path.resolve()).replace("'", "'\\''")
+            f.write(f"file '{quoted_path}'\n")
+
+    try:
+        ffmpeg_process = Popen([
+            'ffmpeg',
+            '-y',
+            '-loglevel', 'error',
+            # Read the videos to join from a list
+            '-f', 'concat',
+            # Allow absolute paths in the list
+            '-safe', '0',
+            '-i', str(list_path),
+            # Copy the encoded video as it is
+            '-c', 'copy',
+            str(output_path)
+        ])
+        if ffmpeg_process.wait() != 0:
+            raise VideoEncodingException(f"FFmpeg failed to join the videos into '{output_path}'")
+    finally:
+        list_path.unlink()
+
+
+def process_image(
         frame_processor: TimelapseFrameProcessor,
+        image_path: str,
+        canvas: Optional[Image.Image] = None
+) -> Optional[Image.Image]:
+    """
+    Runs an image through a frame processor, drawing the frame over the given canvas, if any.
+    The date that is required by the processor is taken from the image's filename.
+    Returns None if the frame fails to complete.
+    """
+    date = get_image_date(image_path)
+    if date is None:
+        logger.warning(f"Ignoring image at '{image_path}'. Its name is not a unix timestamp.")
+        return None
+
+    try:
+        with Image.open(image_path) as image:
+            return frame_processor.make_frame(image, date, canvas)
+    except OSError as e:
+        logger.warning(f"Ignoring image at '{image_path}'. The error was: {e}")
+        return None
+
+
+class RenderedImages(NamedTuple):
+    n_images: int
+    frames: List[Frame]
+    sidebar_hits: int
+    sidebar_misses: int
+
+
+def render_images(frame_processor: TimelapseFrameProcessor, image_paths: Iterable[str]) -> Iterator[RenderedImages]:
+    """
+    Runs consecutive images through a frame processor, one at a time, leaving out the frames that fail to complete.
+    Each frame is drawn over the previous one, so it's only valid until the next one is rendered.
+    Also counts whether each frame reused a sidebar.
+    """
+    sidebar_cache = frame_processor.sidebar_cache
+    canvas = None
+    for image_path in image_paths:
+        hits, misses = sidebar_cache.hits, sidebar_cache.misses
+        frame = process_image(frame_processor, image_path, canvas)
+        if frame is not None:
+            canvas = frame
+        frames: List[Frame] = [] if frame is None else [frame]
+        yield RenderedImages(1, frames, sidebar_cache.hits - hits, sidebar_cache.misses - misses)
+
+
+# The frame processor of each worker process.
+_worker_frame_processor: Optional[TimelapseFrameProcessor] = None
+
+
+def _init_worker(create_frame_processor: Callable[[], TimelapseFrameProcessor]) -> None:
+    global _worker_frame_processor
+    _worker_frame_processor = create_frame_processor()
+
+
+def _render_images_in_worker(image_paths: List[str]) -> RenderedImages:
+    assert _worker_frame_processor is not None
+    frames: List[Frame] = []
+    sidebar_hits, sidebar_misses = 0, 0
+    for rendered in render_images(_worker_frame_processor, image_paths):
+        # Copied before the next frame is drawn over it.
+        frames.extend(x.tobytes() for x in rendered.frames)  # type: ignore
+        sidebar_hits += rendered.sidebar_hits
+        sidebar_misses += rendered.sidebar_misses
+    return RenderedImages(len(image_paths), frames, sidebar_hits, sidebar_misses)
+
+
+def render_images_in_parallel(
+        image_paths: Sequence[str],
+        create_frame_processor: Callable[[], TimelapseFrameProcessor],
+        workers: int
+) -> Iterator[RenderedImages]:
+    """
+    Renders the images in a pool of processes, each with its own frame processor,
+    returning the results in the same order as the given paths, with the frames' pixels in raw RGB.
+    Only a few images per worker are rendered ahead of the ones being returned,
+    so that the memory usage doesn't depend on the number of images.
+    """
+    tasks = (
+        list(image_paths[i:i + IMAGES_PER_TASK])
+        for i in range(0, len(image_paths), IMAGES_PER_TASK)
+    )
+    for _, future in map_in_processes(
+        _render_images_in_worker, tasks, workers, initializer=_init_worker, initargs=(create_frame_processor,)
+    ):
+        yield future.result()
+
+
+def process_images(
+        image_paths: Sequence[str],
+        create_frame_processor: Callable[[], TimelapseFrameProcessor],
+        workers: int,
         show_progress: bool
-) -> Generator[Image.Image, None, None]:
+) -> Generator[Frame, None, None]:
     """
     Takes some image paths and runs them through a frame processor,
-    returns the results as each frame is completed.
-    The date that is required by the processor is taken from each image's filename.
+    returns the results in order, as each frame is completed.
+    With one worker, each frame is drawn over the previous one, so it must be used before the next is requested.
+    With more than one worker, the frames are rendered in parallel, in as many processes,
+    and are returned as their pixels in raw RGB.
     Frames that fail to complete are ignored.
     """
-    for image_path in tqdm(image_paths, desc='Processing the images', unit='images', disable=not show_progress):
-        try:
-            with Image.open(image_path) as image:
-                date = datetime.fromtimestamp(int(os.path.basename(image_path)))
-                frame = frame_processor.make_frame(image, date)
-        except OSError as e:
-            logger.warning(f"Ignoring image at '{image_path}'. The error was: {e}")
+    if workers == 1:
+        rendered_images = render_images(create_frame_processor(), image_paths)
+    else:
+        rendered_images = render_images_in_parallel(image_paths, create_frame_processor, workers)
 
-        if frame is not None:
-            yield frame
+    sidebar_hits, sidebar_misses = 0, 0
+    with tqdm(total=len(image_paths), desc='Processing the images', unit='images', disable=not show_progress) as bar:
+        for rendered in rendered_images:
+            yield from rendered.frames
+            bar.update(rendered.n_images)
+            sidebar_hits += rendered.sidebar_hits
+            sidebar_misses += rendered.sidebar_misses
+
+    logger.info(f'{sidebar_hits} of {sidebar_hits + sidebar_misses} frames reused a sidebar')
+
+
+def leave_out_duplicate_images(
+        image_paths: List[str],
+        max_distance: int,
+        hash_index_path: Optional[str],
+        show_progress: bool
+) -> List[str]:
+    """
+    Leaves out the images that look the same as the last one kept, as skip_duplicate_images does,
+    keeping their hashes in the given index, if any.
+    """
+    hash_index = None if hash_index_path is None else ImageHashIndex(Path(hash_index_path))
+    get_hash = compute_image_hash if hash_index is None else hash_index.get_hash
+
+    with tqdm(image_paths, desc='Hashing the images', unit='images', disable=not show_progress) as paths:
+        distinct_image_paths = list(skip_duplicate_images(paths, max_distance, get_hash))
+
+    if hash_index is not None:
+        hash_index.save()
+    logger.info(f'Left out {len(image_paths) - len(distinct_image_paths)} of {len(image_paths)} images as duplicates')
+    return distinct_image_paths
+
+
+def get_image_date(image_path: str) -> Optional[datetime]:
+    """
+    Interprets an image's filename as the unix timestamp at the time it was taken.
+    Returns None if it isn't one.
+    """
+    try:
+        return datetime.fromtimestamp(int(os.path.basename(image_path)))
+    except (ValueError, OverflowError, OSError):
+        return None
+
+
+def sample_images_every(image_paths: Sequence[str], interval: timedelta) -> List[str]:
+    """
+    Picks the first image in each interval of time, counting from the first image,
+    so that the picked images are spread evenly in time, in order of time.
+    The images are picked by their names alone, none of them is opened.
+    Images whose names aren't unix timestamps are left out.
+    """
+    image_dates = [get_image_date(x) for x in image_paths]
+    dated_images = [(date, path) for date, path in zip(image_dates, image_paths) if date is not None]
+    if len(dated_images) < len(image_paths):
+        logger.warning(f'Ignoring {len(image_paths) - len(dated_images)} images. Their names are not unix timestamps.')
+    dated_images.sort(key=lambda x: x[0])
+
+    sampled_image_paths = []
+    last_slot = None
+    for date, path in dated_images:
+        slot = (date - dated_images[0][0]) // interval
+        if slot != last_slot:
+            sampled_image_paths.append(path)
+            last_slot = slot
+    return sampled_image_paths
+
+
+def sample_images_for_duration(image_paths: Sequence[str], duration: timedelta, fps: int) -> List[str]:
+    """
+    Picks images spread evenly in time, as sample_images_every does,
+    as many as there are frames in a video of the given duration, at most.
+    """
+    n_frames = max(1, int(duration.total_seconds() * fps))
+    first_date, last_date = get_image_date_range(image_paths)
+    if n_frames == 1 or first_date is None or last_date is None:
+        interval = timedelta.max
+    else:
+        # With the last image in the last interval. Rounded down, so it's not pushed out of it.
+        interval = (last_date - first_date) // (n_frames - 1)
+    return sample_images_every(image_paths, max(interval, timedelta(microseconds=1)))
+
+
+def get_image_date_range(image_paths: Iterable[str]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Finds the dates of the first and the last images, by their names.
+    Returns None for both if none of the names is a unix timestamp.
+    """
+    image_dates = [x for x in map(get_image_date, image_paths) if x is not None]
+    if len(image_dates) == 0:
+        return None, None
+    return min(image_dates), max(image_dates)
 
 
 def read_lines_from_stdin() -> List[str]:
@@ -130,17 +417,213 @@ def read_lines_from_file(path: str) -> List[str]:
         return lines
 
 
+def create_log_keeper(database_path: str) -> LogKeeper:
+    """
+    Opens the database to read the ships from.
+    """
+    # The reads are read-only, so that the updater can keep writing to the database meanwhile.
+    return LogKeeper(
+        create_database_engine(database_path),
+        read_engine=create_database_engine(database_path, concurrent=True, read_only=True)
+    )
+
+
 class FrameProcessorArgs(NamedTuple):
     dimensions: Tuple[int, int]
     scaler: float
     font_sizes: Dict[str, int]
+    resampling: Resampling = Resampling.QUALITY
+
+
+def create_frame_processor(
+        database_path: str,
+        frame_processor_args: FrameProcessorArgs,
+        first_date: Optional[datetime],
+        last_date: Optional[datetime]
+) -> TimelapseFrameProcessor:
+    """
+    Opens the database, and sets up a frame processor with the ships for the given dates preloaded.
+    Each worker process creates its own.
+    """
+    frame_processor = TimelapseFrameProcessor(
+        create_log_keeper(database_path),
+        dimensions=frame_processor_args.dimensions,
+        scaler_value=frame_processor_args.scaler,
+        font_sizes=frame_processor_args.font_sizes,
+        resampling=frame_processor_args.resampling
+    )
+
+    # The ships for all the frames are read at once.
+    if first_date is not None and last_date is not None:
+        frame_processor.preload_berth_timeline(first_date, last_date)
+
+    return frame_processor
+
+
+def split_into_days(image_paths: Iterable[str]) -> List[List[str]]:
+    """
+    Splits the images into segments of consecutive images taken in the same day, by their names.
+    Images whose names aren't unix timestamps stay in the segment of the images before them.
+    """
+    segments: List[List[str]] = []
+    segment_day = None
+    for image_path in image_paths:
+        date = get_image_date(image_path)
+        day = None if date is None else date.date()
+        if len(segments) == 0 or (day is not None and segment_day is not None and day != segment_day):
+            segments.append([])
+        if day is not None:
+            segment_day = day
+        segments[-1].append(image_path)
+    return segments
+
+
+def get_segment_key(
+        image_paths: Sequence[str],
+        berthed_ships: pd.DataFrame,
+        frame_processor_args: FrameProcessorArgs,
+        fps: int
+) -> str:
+    """
+    Identifies a segment by everything its video depends on: the images, by their paths, sizes, and modification times,
+    the ships berthed while they were taken, and the settings it's rendered with.
+    """
+    key = hashlib.sha256()
+    key.update(json.dumps([
+        SEGMENT_VERSION,
+        fps,
+        frame_processor_args.dimensions,
+        frame_processor_args.scaler,
+        sorted(frame_processor_args.font_sizes.items()),
+        frame_processor_args.resampling.value,
+    ]).encode())
+
+    for image_path in image_paths:
+        try:
+            stat = os.stat(image_path)
+            key.update(f'{os.path.abspath(image_path)}\t{stat.st_size}\t{stat.st_mtime_ns}\n'.encode())
+        except OSError:
+            key.update(f'{os.path.abspath(image_path)}\n'.encode())
+
+    # What get_berthed_ships decides with, and what the sidebars show.
+    columns = ['Navio', 'Berço', 'TA', 'TB', 'TS']
+    key.update(pd.util.hash_pandas_object(berthed_ships[columns], index=False).values.tobytes())
+    return key.hexdigest()
+
+
+def render_segment(
+        image_paths: List[str],
+        segment_path: Path,
+        create_frame_processor: Callable[[Optional[datetime], Optional[datetime]], TimelapseFrameProcessor],
+        dimensions: Tuple[int, int],
+        fps: int
+) -> int:
+    """
+    Renders a segment of the timelapse into a video of its own, with the ships of its dates preloaded.
+    The video only appears at the given path once it's complete, so an interrupted render leaves nothing to reuse.
+
+    Returns:
+        The number of frames in the video. With none, no video is made.
+    """
+    first_date, last_date = get_image_date_range(image_paths)
+    frames = process_images(
+        image_paths,
+        partial(create_frame_processor, first_date, last_date),
+        workers=1,
+        show_progress=False
+    )
+
+    # Named like the video, for FFmpeg to know its format.
+    temporary_path = segment_path.with_name(f'{segment_path.stem}.{os.getpid()}.tmp{segment_path.suffix}')
+    try:
+        n_frames = make_frames_into_video(frames, temporary_path, dimensions, fps)
+    except BaseException:
+        if temporary_path.exists():
+            temporary_path.unlink()
+        raise
+
+    if n_frames > 0:
+        os.replace(str(temporary_path), str(segment_path))
+    return n_frames
+
+
+def make_video_from_segments(
+        image_paths: Sequence[str],
+        output_path: Path,
+        segment_dir_path: Path,
+        database_path: str,
+        frame_processor_args: FrameProcessorArgs,
+        fps: int,
+        workers: int,
+        show_progress: bool
+) -> None:
+    """
+    Renders the timelapse one day at a time, each into a video of its own, kept in the given directory,
+    and joins them into the output without encoding them again.
+    The segments are in the same format as the output, by its extension.
+    The segments are kept by everything they depend on, as get_segment_key identifies them,
+    so that an interrupted render resumes where it stopped, and overlapping timelapses share their days.
+    With more than one worker, as many segments are rendered at once, each in its own process.
+
+    Raises:
+        VideoEncodingException: If FFmpeg fails.
+    """
+    segment_dir_path.mkdir(parents=True, exist_ok=True)
+    segments = split_into_days(image_paths)
+
+    first_date, last_date = get_image_date_range(image_paths)
+    berth_timeline = None
+    if first_date is not None and last_date is not None:
+        berth_timeline = BerthTimeline(create_log_keeper(database_path), first_date, last_date)
+
+    segment_paths = []
+    for segment in segments:
+        segment_first_date, segment_last_date = get_image_date_range(segment)
+        if berth_timeline is None or segment_first_date is None or segment_last_date is None:
+            name = 'undated'
+            berthed_ships = pd.DataFrame(columns=['Navio', 'Berço', 'TA', 'TB', 'TS'])
+        else:
+            name = segment_first_date.strftime('%Y-%m-%d')
+            berthed_ships = berth_timeline.get_ships_berthed_between(
+                segment_first_date, segment_last_date + timedelta(microseconds=1)
+            )
+        key = get_segment_key(segment, berthed_ships, frame_processor_args, fps)
+        # In the output's format, which FFmpeg picks by the extension, so that they can be joined without encoding.
+        segment_paths.append(segment_dir_path / f'{name}_{key[:16]}{output_path.suffix}')
+
+    missing_segments = [(x, y) for x, y in zip(segments, segment_paths) if not y.exists()]
+    logger.info(f'Reusing {len(segments) - len(missing_segments)} of {len(segments)} segments')
+
+    render = partial(
+        render_segment,
+        create_frame_processor=partial(create_frame_processor, database_path, frame_processor_args),
+        dimensions=frame_processor_args.dimensions,
+        fps=fps
+    )
+    n_images = sum(len(x) for x, _ in missing_segments)
+    with tqdm(total=n_images, desc='Rendering the segments', unit='images', disable=not show_progress) as bar:
+        if workers == 1:
+            for segment, segment_path in missing_segments:
+                render(segment, segment_path)
+                bar.update(len(segment))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(render, x, y): x for x, y in missing_segments}
+                for future in as_completed(futures):
+                    future.result()
+                    bar.update(len(futures[future]))
+
+    # Segments without any frame have no video.
+    rendered_segment_paths = [x for x in segment_paths if x.exists()]
+    if len(rendered_segment_paths) == 0:
+        logger.warning('None of the images were made into frames')
+        return
+    concatenate_videos(rendered_segment_paths, output_path, segment_dir_path)
 
 
 def main() -> None:
     args = docopt(__doc__)
 
-    log_keeper = LogKeeper(create_database_engine(args['--database']))
-
     frame_processor_args = {
         '1080p': FrameProcessorArgs(
             dimensions=(1920, 1080),
@@ -168,20 +651,85 @@ def main() -> None:
         logging.critical('Invalid resolution.')
         sys.exit(1)
 
-    frame_processor = TimelapseFrameProcessor(
-        log_keeper,
-        dimensions=frame_processor_args.dimensions,
-        scaler_value=frame_processor_args.scaler,
-        font_sizes=frame_processor_args.font_sizes
-    )
+    try:
+        frame_processor_args = frame_processor_args._replace(resampling=Resampling(args['--resampling']))
+    except ValueError:
+        logger.critical("Error: Resampling must be one of: %s", ', '.join(x.value for x in Resampling))
+        sys.exit(1)
+
+    try:
+        workers = parse_workers_arg(args['--workers'])
+    except ValueError as e:
+        logger.critical("Error: %s", e)
+        sys.exit(1)
+
+    max_hash_distance = None
+    if args['--skip-duplicates'] is not None:
+        try:
+            max_hash_distance = int(args['--skip-duplicates'])
+            if not 0 <= max_hash_distance <= HASH_BITS:
+                raise ValueError()
+        except ValueError:
+            logger.critical("Error: The bits to skip duplicates by must be an integer from 0 to %d", HASH_BITS)
+            sys.exit(1)
+
+    try:
+        stride = None if args['--stride'] is None else parse_stride_arg(args['--stride'])
+        interval = None if args['--every'] is None else parse_interval_arg(args['--every'])
+        duration = None if args['--target-duration'] is None else parse_interval_arg(args['--target-duration'])
+    except ValueError as e:
+        logger.critical("Error: %s", e)
+        sys.exit(1)
 
     if args['--image-list-from-file'] is None:
         image_paths = read_lines_from_stdin()
     else:
         image_paths = read_lines_from_file(args['--image-list-from-file'])
 
-    frames = process_images(image_paths, frame_processor, show_progress=not args['--no-progress'])
-    make_frames_into_video(frames, Path(args['<output_path>']), int(args['--output-fps']))
+    if stride is not None:
+        image_paths = image_paths[::stride]
+    elif interval is not None:
+        image_paths = sample_images_every(image_paths, interval)
+    elif duration is not None:
+        image_paths = sample_images_for_duration(image_paths, duration, int(args['--output-fps']))
+
+    if max_hash_distance is not None:
+        image_paths = leave_out_duplicate_images(
+            image_paths,
+            max_hash_distance,
+            args['--hash-index'],
+            show_progress=not args['--no-progress']
+        )
+
+    try:
+        if args['--segment-dir'] is None:
+            first_date, last_date = get_image_date_range(image_paths)
+            frames = process_images(
+                image_paths,
+                partial(create_frame_processor, args['--database'], frame_processor_args, first_date, last_date),
+                workers,
+                show_progress=not args['--no-progress']
+            )
+            make_frames_into_video(
+                frames,
+                Path(args['<output_path>']),
+                frame_processor_args.dimensions,
+                int(args['--output-fps'])
+            )
+        else:
+            make_video_from_segments(
+                image_paths,
+                Path(args['<output_path>']),
+                Path(args['--segment-dir']),
+                args['--database'],
+                frame_processor_args,
+                int(args['--output-fps']),
+                workers,
+                show_progress=not args['--no-progress']
+            )
+    except VideoEncodingException as e:
+        logger.critical("Error: %s", e)
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import pandas as pd
+
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.schedule_parser import parse_schedule_spreadsheet, parse_schedule_spreadsheets
+
+logger = logging.getLogger(__name__)
+
+# With microseconds, so that a replay writes the same dates as the original updates.
+ARCHIVE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class SpreadsheetArchive:
+    """
+    Keeps the raw schedule spreadsheets that were downloaded. Each distinct content is stored once,
+    named after its SHA-256 hash, and an index records which content was retrieved when.
+    Downloading the same spreadsheet again only adds a line to the index.
+
+    Attributes:
+        archive_dir_path: Where the spreadsheets and the index are kept.
+    """
+    INDEX_FILENAME = 'index.tsv'
+    OBJECTS_DIRNAME = 'objects'
+
+    def __init__(self, archive_dir_path: Path) -> None:
+        self.archive_dir_path = archive_dir_path
+        (self.archive_dir_path / self.OBJECTS_DIRNAME).mkdir(parents=True, exist_ok=True)
+
+    def get_path(self, content_hash: str) -> Path:
+        """
+        Where the spreadsheet with the given content hash is stored.
+        """
+        return self.archive_dir_path / self.OBJECTS_DIRNAME / content_hash[:2] / f'{content_hash}.xls'
+
+    def add(self, date_retrieved: datetime, content: bytes) -> str:
+        """
+        Stores a spreadsheet, unless one with the same content is already stored,
+        and records that it was retrieved at the given date.
+
+        Returns:
+            The content hash.
+        """
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self.get_path(content_hash)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            temporary_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+            with open(temporary_path, 'wb') as f:
+                f.write(content)
+            os.replace(str(temporary_path), str(path))
+
+        self.add_retrieval(date_retrieved, content_hash)
+        return content_hash
+
+    def add_retrieval(self, date_retrieved: datetime, content_hash: str) -> None:
+        """
+        Records that a spreadsheet which is already stored was retrieved (again) at the given date.
+        """
+        line = f'{date_retrieved.strftime(ARCHIVE_DATETIME_FORMAT)}\t{content_hash}\n'.encode()
+        with open(self.archive_dir_path / self.INDEX_FILENAME, 'a+b') as f:
+            # After a line left incomplete, e.g. by a crash, so that this one isn't lost with it.
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+
+    def read_index(self) -> List[Tuple[datetime, str]]:
+        """
+        Reads when each spreadsheet was retrieved, ordered by date, and then by the order they were added.
+        Lines which can't be read, e.g. one left incomplete by a crash, are skipped.
+
+        Returns:
+            The date each spreadsheet was retrieved at, and its content hash.
+        """
+        try:
+            with open(self.archive_dir_path / self.INDEX_FILENAME, 'rt') as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+
+        retrievals = []
+        for line in lines:
+            try:
+                date_str, content_hash = line.split('\t')
+                retrievals.append((datetime.strptime(date_str, ARCHIVE_DATETIME_FORMAT), content_hash))
+            except ValueError:
+                logger.warning(f"Ignoring invalid line in the archive index: '{line}'")
+        retrievals.sort(key=lambda x: x[0])
+        return retrievals
+
+
+def replay_archive(
+    archive: SpreadsheetArchive,
+    log_keeper: LogKeeper,
+    workers: Optional[int] = None,
+    parse: Callable[[str], pd.DataFrame] = parse_schedule_spreadsheet
+) -> int:
+    """
+    Writes the archived spreadsheets to the logs, in the order they were retrieved,
+    with the same results as the online updates which retrieved them.
+    A spreadsheet retrieved again right after itself is skipped, since it can't have new entries.
+
+    Args:
+        archive: Where the spreadsheets are.
+        log_keeper: Where to write the entries.
+        workers: How many processes to parse the spreadsheets with. Defaults to the number of CPUs.
+        parse: How to parse each spreadsheet, as in parse_schedule_spreadsheets.
+
+    Returns:
+        The number of new entries which were inserted.
+    """
+    retrievals: List[Tuple[datetime, str]] = []
+    for date_retrieved, content_hash in archive.read_index():
+        if len(retrievals) == 0 or retrievals[-1][1] != content_hash:
+            retrievals.append((date_retrieved, content_hash))
+
+    def parsed_entries() -> Iterator[Tuple[datetime, pd.DataFrame]]:
+        paths = (str(archive.get_path(content_hash)) for _, content_hash in retrievals)
+        for (date_retrieved, _), (_, entries) in zip(retrievals, parse_schedule_spreadsheets(paths, workers, parse)):
+            if entries is not None:
+                yield date_retrieved, entries
+
+    return log_keeper.write_entries_in_bulk(parsed_entries())
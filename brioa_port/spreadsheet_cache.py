@@ -0,0 +1,88 @@
+import hashlib
+import io
+import os
+import re
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+from pathlib import Path
+
+from brioa_port.schedule_parser import parse_schedule_spreadsheet, PARSER_VERSION
+
+
+class ParsedSpreadsheetCache:
+    """
+    Keeps the parsed schedule spreadsheets on disk, as Feather files, so that each file is only parsed once.
+
+    The results are found by the hash of the spreadsheet's content, so renamed or copied files
+    are found too, and by the version of the parser. The results of other versions of the parser
+    are deleted when the cache is opened. They are all kept in a 'parsed' subdirectory,
+    which is the only thing in the cache directory that the cache touches.
+
+    Attributes:
+        cache_dir_path: Where the parsed spreadsheets are kept.
+        hits: How many spreadsheets were found in the cache, in this process.
+        misses: How many spreadsheets had to be parsed, in this process.
+    """
+
+    def __init__(self, cache_dir_path: Path) -> None:
+        self.cache_dir_path = cache_dir_path
+        self.hits = 0
+        self.misses = 0
+
+        self._version_dir_path.mkdir(parents=True, exist_ok=True)
+        for path in self._parsed_dir_path.iterdir():
+            if path.is_dir() and re.fullmatch(r'v\d+', path.name) and path != self._version_dir_path:
+                shutil.rmtree(str(path), ignore_errors=True)
+
+    @property
+    def _parsed_dir_path(self) -> Path:
+        return self.cache_dir_path / 'parsed'
+
+    @property
+    def _version_dir_path(self) -> Path:
+        return self._parsed_dir_path / f'v{PARSER_VERSION}'
+
+    def parse(self, path: str) -> pd.DataFrame:
+        """
+        Returns the same as parse_schedule_spreadsheet, from the cache if possible.
+        Spreadsheets that are parsed are added to the cache.
+        """
+        with open(path, 'rb') as f:
+            content = f.read()
+        cached_path = self._version_dir_path / (hashlib.sha256(content).hexdigest() + '.feather')
+
+        try:
+            df = feather.read_feather(str(cached_path))
+        except (OSError, pa.ArrowException):
+            df = None
+        if df is not None:
+            self.hits += 1
+            # Missing text is read back as None, instead of NaN like the parser returns.
+            for column in df.columns[df.dtypes == object]:
+                values = df[column].values
+                values[pd.isnull(values)] = np.nan
+            return df
+
+        self.misses += 1
+        df = parse_schedule_spreadsheet(io.BytesIO(content))
+        self._write(cached_path, df)
+        return df
+
+    def _write(self, cached_path: Path, df: pd.DataFrame) -> None:
+        """
+        Adds a parsed spreadsheet to the cache, if it can be stored.
+        The file only appears once it's complete, even with many processes writing to the cache.
+        """
+        temporary_path = cached_path.with_name(f'{cached_path.name}.{os.getpid()}.tmp')
+        try:
+            feather.write_feather(df, str(temporary_path))
+        except pa.ArrowException:
+            # e.g. a column with both text and numbers. Parsed every time, then.
+            if temporary_path.exists():
+                temporary_path.unlink()
+            return
+        os.replace(str(temporary_path), str(cached_path))
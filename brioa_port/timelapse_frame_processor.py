@@ -1,14 +1,60 @@
 import pandas as pd
 
-from dateutil.relativedelta import relativedelta
 from datetime import datetime
+from enum import Enum
 from PIL import Image, ImageDraw, ImageFont
 from babel.dates import format_date, format_time
-from typing import Tuple, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+from brioa_port.berth_timeline import BerthTimeline
 from brioa_port.log_keeper import LogKeeper
-from brioa_port.util.entry import get_ship_status, get_ship_berth_number, \
-                                  ShipStatus
+from brioa_port.util.cache import LRUCache
+from brioa_port.util.entry import get_ship_berth_number
+
+# The fonts that were loaded, by path or name and size, shared by all the processors.
+# Loading one reads the whole file.
+_font_cache: LRUCache[ImageFont.FreeTypeFont] = LRUCache(64)
+
+
+class Resampling(Enum):
+    """
+    How the webcam images are scaled to the frame.
+    A JPEG can be decoded at 1/2, 1/4 or 1/8 of its size, for a fraction of the work, before being resized.
+
+    QUALITY: Decoded to at least the size it's shown at, and resized bicubically.
+    SPEED: Decoded to as little as half the size it's shown at, and resized bilinearly.
+    """
+    QUALITY = 'quality'
+    SPEED = 'speed'
+
+
+# The image, the mask to paste it with, and the lines of text to draw beyond it.
+Sidebar = Tuple[Image.Image, Image.Image, List[Tuple[Tuple[float, float], str, Dict[str, Any]]]]
+
+
+class _TextRecordingDraw(ImageDraw.ImageDraw):
+    """
+    Draws like ImageDraw.Draw, and keeps the arguments of each line of text that was drawn,
+    so that it can be drawn again elsewhere.
+    """
+
+    def __init__(self, image: Image.Image) -> None:
+        super().__init__(image)
+        self.text_calls: List[Tuple[Tuple[float, float], str, Dict[str, Any]]] = []
+
+    def text(  # type: ignore
+        self,
+        xy: Tuple[float, float],
+        text: str,
+        fill: Any = None,
+        font: Optional[ImageFont.FreeTypeFont] = None,
+        anchor: Any = None,
+        **kwargs: Any
+    ) -> None:
+        # Multiple lines are drawn by calling this again for each one.
+        if '\n' not in text:
+            self.text_calls.append((xy, text, dict(fill=fill, font=font, anchor=anchor, **kwargs)))
+        super().text(xy, text, fill, font, anchor, **kwargs)
 
 
 class TimelapseFrameProcessor:
@@ -22,6 +68,9 @@ class TimelapseFrameProcessor:
         font_sizes: Specify the font sizes that work best for the resolution.
                     The following keys are required: 'huge', 'large', 'medium', and 'small'.
         font_path_or_name: From where to load the font. Will search system directories.
+        sidebar_cache: The sidebars drawn recently, which are reused by the frames with the same
+                       minute and berthed ships. Its hits are how many frames reused one.
+        resampling: Whether to favor quality or speed when scaling the webcam images.
 
     """
 
@@ -31,11 +80,19 @@ class TimelapseFrameProcessor:
         dimensions: Tuple[int, int] = (1920, 1080),
         scaler_value: float = 1,
         font_sizes: Optional[Dict[str, int]] = None,
-        font_path_or_name: str = 'DejaVuSans'
+        font_path_or_name: str = 'DejaVuSans',
+        sidebar_cache_size: int = 16,
+        resampling: Resampling = Resampling.QUALITY
     ) -> None:
         self.log_keeper = log_keeper
         self.dimensions = dimensions
+        self._berth_timeline: Optional[BerthTimeline] = None
         self.scaler_value = scaler_value
+        self.resampling = resampling
+        self.sidebar_cache: LRUCache[Sidebar] = LRUCache(sidebar_cache_size)
+        # The names, dates, and berths repeat from one sidebar to the next.
+        self._text_size_cache: LRUCache[Tuple[int, int]] = LRUCache(1024)
+        self._name_font_cache: LRUCache[ImageFont.FreeTypeFont] = LRUCache(256)
 
         default_font_sizes = {
             'huge':   64,
@@ -67,12 +124,28 @@ class TimelapseFrameProcessor:
 
     def _load_font(self, font_path_or_name: str, size: int) -> ImageFont.FreeTypeFont:
         """
-        Loads a font file from the system.
+        Loads a font file from the system, or from the fonts that were already loaded.
         """
-        try:
-            return ImageFont.truetype(font_path_or_name, size)
-        except IOError:
-            raise ValueError(f"Could not load font at '{self.font_path}'")
+        def read_font() -> ImageFont.FreeTypeFont:
+            try:
+                return ImageFont.truetype(font_path_or_name, size)
+            except IOError:
+                raise ValueError(f"Could not load font at '{font_path_or_name}'")
+
+        return _font_cache.get_or_compute((font_path_or_name, size), read_font)
+
+    def _get_name_font(self, name: str, width: int) -> ImageFont.FreeTypeFont:
+        """
+        Finds the largest font, up to the 'large' size, in which a ship name fits a box of the given width.
+        Long names are shrunk down to a minimum size, and may not fit even then.
+        """
+        def fit_name_font() -> ImageFont.FreeTypeFont:
+            name_font = self.fonts['large']
+            while (name_font.size > 12) and (self._get_text_size(name, name_font)[0] > (width - 30)):
+                name_font = self._load_font(self.font_path, max(1, name_font.size - 1))
+            return name_font
+
+        return self._name_font_cache.get_or_compute((name, width), fit_name_font)
 
     def _make_canvas(self) -> Image.Image:
         """
@@ -80,23 +153,21 @@ class TimelapseFrameProcessor:
         """
         return Image.new('RGB', self.dimensions, self.colors['background'])
 
-    def _get_berthed_ships(self, date: datetime) -> pd.DataFrame:
+    def preload_berth_timeline(self, first_date: datetime, last_date: datetime) -> None:
         """
-        Queries the LogKeeper instance to obtain a list of the ships berthed
-        to the port at the given date.
+        Reads the ships at the port for all the days from the first to the last date, at once,
+        so that the frames of those days don't have to query the LogKeeper.
         """
-        start_of_today = date.replace(hour=0, minute=0, second=0, microsecond=0)
-        ships_at_port = self.log_keeper.read_ships_at_port(
-            start_of_today + relativedelta(days=1),
-            start_of_today
-        )
+        self._berth_timeline = BerthTimeline(self.log_keeper, first_date, last_date)
 
-        return ships_at_port[
-            ships_at_port.apply(
-                lambda ship: get_ship_status(ship, date) == ShipStatus.BERTHED,
-                axis=1
-            )
-        ].reset_index(drop=True)
+    def _get_berthed_ships(self, date: datetime) -> pd.DataFrame:
+        """
+        Obtains a list of the ships berthed to the port at the given date,
+        from the preloaded timeline, or else from the ships at the port in that day.
+        """
+        if self._berth_timeline is None or not self._berth_timeline.covers(date):
+            self._berth_timeline = BerthTimeline(self.log_keeper, date, date)
+        return self._berth_timeline.get_berthed_ships(date)
 
     def _draw_date_box(self, draw: ImageDraw.Draw, top_left_corner: Tuple[int, int], width: int, date: datetime) -> int:
         """
@@ -113,11 +184,11 @@ class TimelapseFrameProcessor:
         """
         time_str = format_time(date, 'HH:mm', locale='pt_BR')
         time_font = self.fonts['huge']
-        time_font_height = time_font.getsize('X')[1]
+        time_font_height = self._get_text_size('X', time_font)[1]
 
         date_str = format_date(date, "EEEE\ndd 'de' MMM 'de' yyyy", locale='pt_BR').capitalize()
         date_font = self.fonts['large']
-        date_font_height = date_font.getsize('X')[1]
+        date_font_height = self._get_text_size('X', date_font)[1]
 
         margin = 20 * self.scaler_value
 
@@ -176,15 +247,12 @@ class TimelapseFrameProcessor:
             background_color = self.colors['berthed_ship_box_background_odd']
 
         name_str = ship['Navio']
-        name_font = self.fonts['large']
-        # Resize the font until the name fits within the specified width.
-        while (name_font.size > 12) and (name_font.getsize(name_str)[0] > (width - 30)):
-            name_font = self._load_font(self.font_path, max(1, name_font.size - 1))
-        name_font_height = name_font.getsize('X')[1]
+        name_font = self._get_name_font(name_str, width)
+        name_font_height = self._get_text_size('X', name_font)[1]
 
         berco_str = 'Berço ' + str(berco)
         berco_font = self.fonts['medium']
-        berco_font_height = berco_font.getsize('X')[1]
+        berco_font_height = self._get_text_size('X', berco_font)[1]
 
         margin = (20 * self.scaler_value)
 
@@ -217,18 +285,87 @@ class TimelapseFrameProcessor:
 
         return bottom_y
 
-    def make_frame(self, image: Image.Image, date: datetime) -> Image.Image:
+    def _get_sidebar(
+        self,
+        width: int,
+        date: datetime,
+        ships_berthed: pd.DataFrame
+    ) -> Sidebar:
+        """
+        Obtains the sidebar for a frame, from the cache if the same one was drawn recently.
+        It only changes with the displayed minute, and with the names and berths of the ships.
+        """
+        key = (
+            date.replace(second=0, microsecond=0),
+            tuple(
+                (name, None if pd.isnull(berth) else int(berth))
+                for name, berth in zip(ships_berthed['Navio'], ships_berthed['Berço'])
+            ),
+            width,
+        )
+        return self.sidebar_cache.get_or_compute(key, lambda: self._draw_sidebar(width, date, ships_berthed))
+
+    def _draw_sidebar(
+        self,
+        width: int,
+        date: datetime,
+        ships_berthed: pd.DataFrame
+    ) -> Sidebar:
+        """
+        Draws the clock and the berthed ships onto a sidebar of the given width.
+
+        Returns:
+            The sidebar, the mask to paste it onto the frame with, and the lines of text which go past it.
+            The boxes end one pixel past the width, over the webcam image, which the mask includes.
+            The text that goes further has to be drawn over each frame's image.
+        """
+        sidebar = Image.new('RGB', (width + 1, self.dimensions[1]), self.colors['background'])
+        draw = _TextRecordingDraw(sidebar)
+
+        date_bottom_y = self._draw_date_box(draw, (0, 0), width, date)
+
+        bottom_y = date_bottom_y
+        ship_box_height = 0
+        for index, ship in ships_berthed.iterrows():
+            ship_box_top_y = date_bottom_y + (index * ship_box_height)
+            bottom_y = self._draw_berthed_ship_box(draw, (0, ship_box_top_y), width, ship)
+            ship_box_height = bottom_y - ship_box_top_y
+
+        mask = Image.new('L', sidebar.size, 0)
+        mask_draw = ImageDraw.Draw(mask)
+        mask_draw.rectangle((0, 0, width - 1, sidebar.height - 1), fill=255)
+        mask_draw.rectangle((width, 0, width, bottom_y), fill=255)
+
+        overflowing_text_calls = [
+            (xy, text, kwargs) for xy, text, kwargs in draw.text_calls
+            if xy[0] + self._get_text_size(text, kwargs['font'])[0] > width
+        ]
+
+        return sidebar, mask, overflowing_text_calls
+
+    def _get_text_size(self, text: str, font: ImageFont.FreeTypeFont) -> Tuple[int, int]:
+        """
+        How far a line of text goes to the right of and below where it's drawn.
+        """
+        return self._text_size_cache.get_or_compute((font.path, font.size, text), lambda: font.getsize(text))
+
+    def make_frame(self, image: Image.Image, date: datetime, canvas: Optional[Image.Image] = None) -> Image.Image:
         """
         Processes a webcam image into a timelapse frame.
 
         Args:
             image: The raw image. Will be resized and pasted onto the final frame.
+                   If it's a JPEG that wasn't loaded yet, it's decoded at a reduced size, when possible.
             date: The time that the image was taken. Used to correlating other information.
+            canvas: An RGB image with the frame's dimensions to draw over, such as the previous frame.
+                    Saves allocating and clearing a whole new image for each frame.
 
         Returns:
-            The processed frame, in the form of a new image.
+            The processed frame, in the form of a new image, or the given canvas.
         """
-        canvas = self._make_canvas()
+        reuse_canvas = canvas is not None
+        if canvas is None:
+            canvas = self._make_canvas()
 
         try:
             # Correct for SDTV 480i pixel aspect ratio
@@ -249,24 +386,33 @@ class TimelapseFrameProcessor:
                 new_image_height = canvas.height
                 new_image_width = int(new_image_height * image_aspect_ratio)
 
+            if self.resampling == Resampling.QUALITY:
+                decoded_size = (new_image_width, new_image_height)
+                resample_filter = Image.BICUBIC
+            else:
+                decoded_size = (max(1, new_image_width // 2), max(1, new_image_height // 2))
+                resample_filter = Image.BILINEAR
+            # Does nothing unless the image can still be decoded at a smaller scale that covers the size.
+            image.draft(image.mode, decoded_size)
+
             image = image.resize(
                 (new_image_width, new_image_height),
-                Image.BICUBIC
+                resample_filter
             )
             image_x = canvas.width - image.width
+            # The sidebar covers everything to the left of the image, but not below it.
+            if reuse_canvas and image.height < canvas.height:
+                canvas.paste(self.colors['background'], (image_x, image.height, canvas.width, canvas.height))
             canvas.paste(image, (image_x, 0))
-            draw = ImageDraw.Draw(canvas)
         except OSError:
             return None
 
-        date_bottom_y = self._draw_date_box(draw, (0, 0), image_x, date)
-
         ships_berthed = self._get_berthed_ships(date)
-
-        ship_box_height = 0
-        for index, ship in ships_berthed.iterrows():
-            ship_box_top_y = date_bottom_y + (index * ship_box_height)
-            ship_box_bottom_y = self._draw_berthed_ship_box(draw, (0, ship_box_top_y), image_x, ship)
-            ship_box_height = ship_box_bottom_y - ship_box_top_y
+        sidebar, sidebar_mask, overflowing_text_calls = self._get_sidebar(image_x, date, ships_berthed)
+        # Drawn as a whole, and then covered by the sidebar, up to where it ends.
+        draw = ImageDraw.Draw(canvas)
+        for xy, text, kwargs in overflowing_text_calls:
+            draw.text(xy, text, **kwargs)
+        canvas.paste(sidebar, (0, 0), sidebar_mask)
 
         return canvas
@@ -1,3 +1,10 @@
+import math
+
+from datetime import timedelta
+
+# How many seconds each unit of an interval argument is.
+INTERVAL_UNIT_SECONDS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
 
 def parse_period_arg(arg: str) -> int:
     """
@@ -10,3 +17,45 @@ def parse_period_arg(arg: str) -> int:
     if period < 0:
         raise ValueError("Period cannot be negative")
     return period
+
+
+def parse_workers_arg(arg: str) -> int:
+    """
+    Makes sure that a number of worker processes is a valid positive integer.
+    """
+    try:
+        workers = int(arg)
+    except ValueError:
+        raise ValueError("The number of workers must be an integer")
+    if workers < 1:
+        raise ValueError("The number of workers must be positive")
+    return workers
+
+
+def parse_stride_arg(arg: str) -> int:
+    """
+    Makes sure that a stride argument is a valid positive integer.
+    """
+    try:
+        stride = int(arg)
+    except ValueError:
+        raise ValueError("Stride must be an integer")
+    if stride < 1:
+        raise ValueError("Stride must be positive")
+    return stride
+
+
+def parse_interval_arg(arg: str) -> timedelta:
+    """
+    Makes sure that an interval argument is a positive number of seconds, minutes, hours or days,
+    e.g. '90s', '10m', '1.5h' or '1d'. Without a unit, it's in seconds.
+    """
+    unit = arg[-1:] if arg[-1:] in INTERVAL_UNIT_SECONDS else 's'
+    number = arg[:-1] if arg[-1:] in INTERVAL_UNIT_SECONDS else arg
+    try:
+        value = float(number)
+    except ValueError:
+        raise ValueError("Interval must be a number, optionally followed by s, m, h or d")
+    if not (value > 0 and math.isfinite(value)):
+        raise ValueError("Interval must be positive")
+    return timedelta(seconds=value * INTERVAL_UNIT_SECONDS[unit])
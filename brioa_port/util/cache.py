@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, TypeVar
+
+T = TypeVar('T')
+
+
+class LRUCache(Generic[T]):
+    """
+    Keeps up to max_size values, discarding the least recently used one when full.
+
+    Attributes:
+        max_size: How many values to keep.
+        hits: How many times a value was found in the cache.
+        misses: How many times a value had to be computed.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._values: 'OrderedDict[Hashable, T]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], T]) -> T:
+        """
+        Returns the value for the key, computing and storing it if it's not in the cache.
+        """
+        if key in self._values:
+            self.hits += 1
+            self._values.move_to_end(key)
+            return self._values[key]
+
+        self.misses += 1
+        value = compute()
+        self._values[key] = value
+        if len(self._values) > self.max_size:
+            self._values.popitem(last=False)
+        return value
+
+    def clear(self) -> None:
+        """
+        Discards all the values, keeping the counters.
+        """
+        self._values.clear()
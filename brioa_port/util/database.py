@@ -1,11 +1,95 @@
+import os
 import sqlalchemy
+import sqlite3
+
+from enum import Enum
+from sqlalchemy import event
+from sqlalchemy.pool import SingletonThreadPool
+from typing import Any, Dict
+from urllib.request import pathname2url
 
 DATABASE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# As SQLAlchemy writes dates.
+DATABASE_STORED_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# How many seconds to wait for a lock, by default (as in the sqlite3 module),
+# and with the concurrent setup.
+DEFAULT_BUSY_TIMEOUT = 5.0
+BUSY_TIMEOUT = 30.0
+
+
+class DatetimeStorage(Enum):
+    """
+    How dates are stored in the database.
 
+    TEXT: Strings, as SQLAlchemy writes them, e.g. '2010-01-01 00:00:00.000000'.
+    EPOCH: Integer seconds since 1970-01-01 00:00:00, in the same (naive, local) time as the dates.
+    """
+    TEXT = 'text'
+    EPOCH = 'epoch'
+
+
+class LogsLayout(Enum):
+    """
+    How the revisions of each trip are stored in the database.
 
-def create_database_engine(path: str) -> sqlalchemy.engine.Engine:
+    FULL: Every revision is a complete row.
+    DELTA: Only the first revision is a complete row, the following ones
+        store just the columns which changed, plus the date they were retrieved.
+    """
+    FULL = 'full'
+    DELTA = 'delta'
+
+
+def create_database_engine(
+    path: str,
+    persistent_connection: bool = False,
+    concurrent: bool = False,
+    read_only: bool = False
+) -> sqlalchemy.engine.Engine:
     """
     Creates an SQLAlchemy database engine for the SQLite database
     at the given path.
+
+    The engine starts the transactions itself, instead of leaving it to the
+    sqlite3 module, which would only do so before data modifying statements.
+    That way schema changes and reads are also covered by transactions.
+
+    Args:
+        path: Where the database file is.
+        persistent_connection: Keep the connection open between uses (one per thread),
+                               instead of opening a new one every time. For long-running processes.
+        concurrent: Set up the connections for a database that is used by many processes at once.
+                    Readers and the writer don't block each other, thanks to write-ahead logging,
+                    and wait for the locks they need for up to BUSY_TIMEOUT seconds, instead of failing.
+                    Transactions take the write lock when they start, because a transaction that reads
+                    and then writes can't wait for it in the middle.
+        read_only: Open the database in read-only mode, so that reading never takes a write lock.
+                   The database must already exist.
     """
-    return sqlalchemy.create_engine('sqlite:///' + path)
+    timeout = BUSY_TIMEOUT if concurrent else DEFAULT_BUSY_TIMEOUT
+    engine_args: Dict[str, Any] = {}
+    if persistent_connection:
+        engine_args['poolclass'] = SingletonThreadPool
+    if read_only:
+        # This version of SQLAlchemy can't pass URI filenames on to sqlite3, so it connects by itself.
+        uri = 'file:' + pathname2url(os.path.abspath(path)) + '?mode=ro'
+        engine_args['creator'] = lambda: sqlite3.connect(uri, uri=True, timeout=timeout)
+    else:
+        engine_args['connect_args'] = {'timeout': timeout}
+    engine = sqlalchemy.create_engine('sqlite:///' + path, **engine_args)
+
+    @event.listens_for(engine, 'connect')
+    def disable_implicit_transactions(dbapi_connection, connection_record):  # type: ignore
+        dbapi_connection.isolation_level = None
+        if concurrent and not read_only:
+            # Persisted in the database file, so it's only changed once.
+            dbapi_connection.execute('pragma journal_mode = wal')
+            # Safe with write-ahead logging. Only a power loss can undo the last commits.
+            dbapi_connection.execute('pragma synchronous = normal')
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(connection):  # type: ignore
+        connection.execute('begin immediate' if concurrent and not read_only else 'begin')
+
+    return engine
@@ -1,3 +1,4 @@
+import calendar
 import time
 
 from datetime import datetime
@@ -11,6 +12,14 @@ def get_unix_timestamp_from_local_datetime(date: datetime) -> int:
     return int(time.mktime(date.timetuple()))
 
 
+def get_epoch_seconds_from_naive_datetime(date: datetime) -> int:
+    """
+    Turns a datetime object into the number of seconds since 1970-01-01 00:00:00,
+    without considering timezones, i.e. as if both were in the same timezone.
+    """
+    return calendar.timegm(date.timetuple())
+
+
 def make_delta_human_readable(start_date: datetime, end_date: datetime, absolute: bool = False) -> str:
     """
     Humanizes a timespan (difference between two datetime objects).
@@ -0,0 +1,50 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import Any, Callable, Deque, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def map_in_processes(
+    function: Callable[[T], R],
+    items: Iterable[T],
+    workers: int,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple[Any, ...] = ()
+) -> Iterator[Tuple[T, 'Future[R]']]:
+    """
+    Calls a function on each of some items in a pool of processes,
+    returning the results in the same order as the given items.
+    Only a few items per worker are submitted ahead of the one being returned,
+    so that the memory usage doesn't depend on the number of items.
+
+    Args:
+        function: What to call on each item. Must be picklable, to be sent to the processes, as must the items.
+        items: The items, in order. Only read as they are submitted.
+        workers: How many processes to use.
+        initializer: What to call in each process, before any item, e.g. to set up its state.
+        initargs: The arguments to the initializer.
+
+    Returns:
+        Each item and the future of its call. Its result waits for the call, and raises its error, if any,
+        so that each caller decides which errors to ignore.
+    """
+    max_pending = 2 * workers
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        items_iter = iter(items)
+        pending: Deque[Tuple[T, 'Future[R]']] = deque()
+
+        while True:
+            while len(pending) < max_pending:
+                try:
+                    item = next(items_iter)
+                except StopIteration:
+                    break
+                pending.append((item, executor.submit(function, item)))
+
+            if len(pending) == 0:
+                return
+
+            yield pending.popleft()
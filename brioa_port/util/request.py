@@ -1,5 +1,6 @@
 import email.utils
 import shutil
+import urllib.error
 import urllib.request
 
 from datetime import datetime
@@ -87,3 +88,51 @@ def parse_last_modified_date(last_modified_header: Union[Header, str]) -> Option
         return email.utils.parsedate_to_datetime(last_modified_str).astimezone(tz.tzlocal())
     except (TypeError, ValueError, IndexError):
         return None
+
+
+class ConditionalResponse(NamedTuple):
+    content: Optional[bytes]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+def fetch_url_if_modified(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> ConditionalResponse:
+    """
+    Downloads a file, unless the server reports that it hasn't changed since
+    the previous download (HTTP 304), as identified by the validators it returned then.
+
+    Args:
+        url: Where to download from.
+        etag: The ETag header of the previous download, if any.
+        last_modified: The Last-Modified header of the previous download, if any.
+
+    Returns:
+        The content, or None if it wasn't modified, and the validators to send in the next request.
+        When not modified, the given validators are returned.
+    """
+    request = urllib.request.Request(url)
+    if etag is not None:
+        request.add_header('If-None-Match', etag)
+    if last_modified is not None:
+        request.add_header('If-Modified-Since', last_modified)
+
+    try:
+        response = cast(HTTPResponse, urllib.request.urlopen(request))
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return ConditionalResponse(None, etag, last_modified)
+        raise
+
+    with response:
+        content = response.read()
+        headers = response.info()
+    # The header values can be email.header.Header objects, for non-ASCII values.
+    new_etag, new_last_modified = [
+        str(value) if value is not None else None
+        for value in (headers.get('ETag', None), headers.get('Last-Modified', None))
+    ]
+    return ConditionalResponse(content, new_etag, new_last_modified)
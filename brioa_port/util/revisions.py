@@ -0,0 +1,103 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+from datetime import datetime
+from typing import Any, Iterable, List, Sequence, Set, Tuple
+
+from brioa_port.util.database import DATABASE_STORED_DATETIME_FORMAT
+
+# A change to one of the columns of a trip's entry: (revision, column_id, value)
+Delta = Tuple[int, int, Any]
+
+
+def values_are_equal(a: Any, b: Any) -> bool:
+    """
+    Compares two values of an entry, with nulls being equal to each other.
+    """
+    if pd.isnull(a) or pd.isnull(b):
+        return bool(pd.isnull(a) and pd.isnull(b))
+    return bool(a == b)
+
+
+def to_sql_value(value: Any) -> Any:
+    """
+    Converts a value from a dataframe into one that can be stored by sqlite3,
+    the same way pandas would store it.
+    """
+    if pd.isnull(value):
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(DATABASE_STORED_DATETIME_FORMAT)
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def apply_deltas(base_row: Sequence[Any], deltas: Iterable[Delta]) -> List[Tuple[Any, ...]]:
+    """
+    Rebuilds the full rows of a trip from its first row and the changes after it.
+
+    Args:
+        base_row: The values of the first entry.
+        deltas: The changes, ordered by revision.
+
+    Returns:
+        The first row followed by one row for each revision.
+    """
+    rows = [tuple(base_row)]
+    current_row = list(base_row)
+    for _, revision_deltas in itertools.groupby(deltas, key=lambda x: x[0]):
+        for _, column_id, value in revision_deltas:
+            current_row[column_id] = value
+        rows.append(tuple(current_row))
+    return rows
+
+
+def find_deltas(
+    rows: Sequence[Sequence[Any]],
+    trip_column_id: int,
+    always_included_column_ids: Set[int],
+    excluded_column_ids: Set[int]
+) -> Tuple[List[Sequence[Any]], List[Tuple[Any, int, int, Any]]]:
+    """
+    Splits full rows into the first row of each trip and the changes after it.
+    The inverse of apply_deltas.
+
+    Args:
+        rows: The stored values of the entries, grouped by trip, and in order within each trip.
+        trip_column_id: Which column has the trip name.
+        always_included_column_ids: Columns which are part of every revision, even if unchanged.
+        excluded_column_ids: Columns which are never part of the changes.
+
+    Returns:
+        The first row of each trip, and the changes as (trip name, revision, column_id, value).
+    """
+    if len(rows) == 0:
+        return [], []
+
+    values = np.empty((len(rows), len(rows[0])), dtype=object)
+    values[:] = rows
+    trip_names = values[:, trip_column_id]
+
+    is_first = np.ones(len(rows), dtype=bool)
+    is_first[1:] = trip_names[1:] != trip_names[:-1]
+    positions = np.arange(len(rows))
+    revisions = positions - np.maximum.accumulate(np.where(is_first, positions, 0))
+
+    deltas = []
+    for column_id in range(values.shape[1]):
+        if column_id in excluded_column_ids:
+            continue
+        current_values = values[1:, column_id]
+        previous_values = values[:-1, column_id]
+        if column_id in always_included_column_ids:
+            changed = np.ones(len(rows) - 1, dtype=bool)
+        else:
+            changed = ~((current_values == previous_values)
+                        | (pd.isnull(current_values) & pd.isnull(previous_values)))
+        changed &= ~is_first[1:]
+        for i in np.flatnonzero(changed) + 1:
+            deltas.append((trip_names[i], int(revisions[i]), column_id, values[i, column_id]))
+
+    return [rows[i] for i in np.flatnonzero(is_first)], deltas
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from pandas.testing import assert_frame_equal
+
+from brioa_port.berth_timeline import BerthTimeline
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.util.database import create_database_engine, DatetimeStorage
+from brioa_port.util.entry import get_ship_status, ShipStatus
+
+
+def get_berthed_ships_per_frame(log_keeper: LogKeeper, date: datetime) -> pd.DataFrame:
+    """
+    How the berthed ships were found before, with a query for each frame.
+    """
+    start_of_today = date.replace(hour=0, minute=0, second=0, microsecond=0)
+    ships_at_port = log_keeper.read_ships_at_port(start_of_today + relativedelta(days=1), start_of_today)
+    return ships_at_port[
+        ships_at_port.apply(lambda ship: get_ship_status(ship, date) == ShipStatus.BERTHED, axis=1)
+    ].reset_index(drop=True)
+
+
+def make_random_entries(n_trips: int, seed: int) -> pd.DataFrame:
+    """
+    Builds trips spread over a few days, with some of the dates missing.
+    """
+    random = np.random.RandomState(seed)
+    start = datetime(2010, 1, 1)
+
+    def random_dates(offset_hours: np.ndarray) -> pd.Series:
+        dates = pd.Series([start + timedelta(hours=int(x)) for x in offset_hours])
+        dates[random.rand(n_trips) < 0.2] = pd.NaT
+        return pd.to_datetime(dates)
+
+    arrival_hours = random.randint(0, 24 * 5, n_trips)
+    berthing_hours = arrival_hours + random.randint(0, 12, n_trips)
+    sailing_hours = berthing_hours + random.randint(1, 36, n_trips)
+    trip_names = [f'T{i}' for i in range(n_trips)]
+    df = pd.DataFrame({
+        'Berço': random.choice([1.0, 2.0, 3.0, np.nan], n_trips),
+        'Navio': ['SHIP ' + x for x in trip_names],
+        'Viagem': trip_names,
+        'Abertura do Gate': pd.NaT,
+        'Deadline': pd.NaT,
+        'ETA': random_dates(arrival_hours),
+        'ATA': random_dates(arrival_hours + 1),
+        'ETB': random_dates(berthing_hours),
+        'ATB': random_dates(berthing_hours + 1),
+        'ETS': random_dates(sailing_hours),
+        'ATS': random_dates(sailing_hours + 1),
+    })
+    for column in ['Abertura do Gate', 'Deadline']:
+        df[column] = pd.to_datetime(df[column])
+    return df
+
+
+@pytest.mark.parametrize('datetime_storage', list(DatetimeStorage))
+def test_same_results_as_per_frame_queries(tmp_path, datetime_storage: DatetimeStorage) -> None:
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'logs.db')), datetime_storage)
+    log_keeper.write_entries(datetime(2010, 1, 1), make_random_entries(60, seed=1))
+
+    # Every hour and a half, so half of them are exactly on the hours, which the dates in the entries are on.
+    dates = [datetime(2010, 1, 1) + timedelta(minutes=90 * i) for i in range(16 * 7)]
+    timeline = BerthTimeline(log_keeper, dates[0], dates[-1])
+    n_berthed = 0
+    for date in dates:
+        assert timeline.covers(date)
+        expected = get_berthed_ships_per_frame(log_keeper, date)
+        assert_frame_equal(timeline.get_berthed_ships(date), expected)
+        n_berthed += len(expected)
+    assert n_berthed > 0
+    assert not timeline.covers(dates[-1] + timedelta(days=1))
+
+
+def test_ships_berthed_between_dates(tmp_path) -> None:
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'logs.db')))
+    log_keeper.write_entries(datetime(2010, 1, 1), make_random_entries(60, seed=2))
+    timeline = BerthTimeline(log_keeper, datetime(2010, 1, 1), datetime(2010, 1, 7))
+
+    for start in [datetime(2010, 1, x) for x in range(1, 7)]:
+        end = start + timedelta(days=1)
+        ships = timeline.get_ships_berthed_between(start, end)
+        trips = set(ships['Viagem'])
+        berthed_trips = set()
+        for date in [start + timedelta(minutes=30 * i) for i in range(48)]:
+            berthed_trips.update(timeline.get_berthed_ships(date)['Viagem'])
+        # The dates in the entries are on the hours, so every half an hour sees all the ships.
+        assert trips == berthed_trips
+        assert list(ships['Viagem']) == [x for x in timeline.ships['Viagem'] if x in trips]
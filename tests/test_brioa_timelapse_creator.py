@@ -0,0 +1,191 @@
+import io
+import numpy as np
+import os
+import pytest
+import sys
+
+from datetime import datetime, timedelta
+from functools import partial
+from pathlib import Path
+from PIL import Image
+from typing import Iterable, List
+
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.scripts.brioa_timelapse_creator import (
+    create_frame_processor, get_image_date, make_video_from_segments, process_images, sample_images_every,
+    sample_images_for_duration, write_raw_frame, Frame, FrameProcessorArgs
+)
+from brioa_port.util.database import create_database_engine
+from brioa_port.util.datetime import get_unix_timestamp_from_local_datetime
+from tests.test_log_keeper import make_entries
+
+FRAME_PROCESSOR_ARGS = FrameProcessorArgs((320, 180), 0.2, {'huge': 12, 'large': 8, 'medium': 6, 'small': 4})
+
+# Writes the raw frames it reads to the output as they are, or joins the files in a concat list.
+# Logs the format it read each time.
+FAKE_FFMPEG = """#!{python}
+import sys
+args = sys.argv[1:]
+with open({log_path!r}, 'a') as f:
+    f.write(args[args.index('-f') + 1] + '\\n')
+if 'concat' in args:
+    with open(args[args.index('-i') + 1]) as f:
+        paths = [line.strip()[len("file '"):-1] for line in f]
+    content = b''.join(open(path, 'rb').read() for path in paths)
+else:
+    content = sys.stdin.buffer.read()
+with open(args[-1], 'wb') as f:
+    f.write(content)
+"""
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch) -> Path:
+    """
+    Puts a fake FFmpeg first in the PATH, and returns where it logs to.
+    """
+    (tmp_path / 'bin').mkdir()
+    log_path = tmp_path / 'ffmpeg.log'
+    ffmpeg_path = tmp_path / 'bin' / 'ffmpeg'
+    ffmpeg_path.write_text(FAKE_FFMPEG.format(python=sys.executable, log_path=str(log_path)))
+    ffmpeg_path.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{tmp_path / 'bin'}{os.pathsep}{os.environ['PATH']}")
+    return log_path
+
+
+def write_images(dir_path: Path, dates: List[datetime], seed: int = 0) -> List[str]:
+    """
+    Writes a random JPEG for each date, named by its unix timestamp.
+    """
+    dir_path.mkdir(exist_ok=True)
+    random = np.random.RandomState(seed)
+    image_paths = []
+    for date in dates:
+        path = dir_path / str(get_unix_timestamp_from_local_datetime(date))
+        Image.fromarray(random.randint(0, 255, (48, 64, 3), dtype=np.uint8)).save(str(path), 'JPEG')
+        image_paths.append(str(path))
+    return image_paths
+
+
+def read_raw_frames(frames: Iterable[Frame]) -> List[bytes]:
+    """
+    Copies the pixels of each frame as it's returned, before the next one is drawn over it.
+    """
+    raw_frames = []
+    for frame in frames:
+        f = io.BytesIO()
+        write_raw_frame(frame, f)
+        raw_frames.append(f.getvalue())
+    return raw_frames
+
+
+def test_parallel_rendering_keeps_the_order(tmp_path) -> None:
+    database_path = str(tmp_path / 'logs.db')
+    LogKeeper(create_database_engine(database_path)).write_entries(
+        datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 1, 14, 0, 0)})
+    )
+
+    dates = [datetime(2010, 1, 1, 13, 58, 0) + timedelta(seconds=20 * i) for i in range(11)]
+    image_paths = write_images(tmp_path, dates)
+    # Neither is rendered.
+    (tmp_path / 'broken').write_bytes(b'')
+    image_paths.insert(3, str(tmp_path / 'broken'))
+    image_paths.insert(7, str(tmp_path / '0'))
+
+    create = partial(create_frame_processor, database_path, FRAME_PROCESSOR_ARGS, dates[0], dates[-1])
+    serial_frames = read_raw_frames(process_images(image_paths, create, workers=1, show_progress=False))
+    parallel_frames = read_raw_frames(process_images(image_paths, create, workers=3, show_progress=False))
+
+    assert len(serial_frames) == len(dates)
+    assert len(set(serial_frames)) == len(dates)
+    assert parallel_frames == serial_frames
+
+
+def test_raw_frames_are_the_bare_pixels() -> None:
+    frame = Image.fromarray(np.random.RandomState(0).randint(0, 255, (180, 320, 3), dtype=np.uint8))
+    expected = np.asarray(frame).tobytes()
+    assert len(expected) == 180 * 320 * 3
+
+    # Both as an image, and as the bytes the workers return.
+    f = io.BytesIO()
+    write_raw_frame(frame, f)
+    write_raw_frame(frame.tobytes(), f)
+    assert f.getvalue() == expected * 2
+
+
+def test_images_are_sampled_evenly_in_time() -> None:
+    # Every 20 seconds, for an hour, but none from 00:20 to 00:40. The images don't exist, they're not opened.
+    dates = [datetime(2010, 1, 1) + timedelta(seconds=20 * i) for i in range(180)]
+    dates = [x for x in dates if not datetime(2010, 1, 1, 0, 20) <= x < datetime(2010, 1, 1, 0, 40)]
+    image_paths = [str(get_unix_timestamp_from_local_datetime(x)) for x in dates]
+    shuffled_image_paths = list(np.random.RandomState(0).permutation(image_paths)) + ['not_a_timestamp']
+
+    def sampled_dates(sampled_image_paths: List[str]) -> List[datetime]:
+        return [get_image_date(x) for x in sampled_image_paths]
+
+    every_ten_minutes = sample_images_every(shuffled_image_paths, timedelta(minutes=10))
+    assert sampled_dates(every_ten_minutes) == [datetime(2010, 1, 1, 0, x) for x in [0, 10, 40, 50]]
+    assert sample_images_every(image_paths, timedelta(seconds=1)) == image_paths
+
+    # 7 frames: one about every 10 minutes, up to the last image, but for the missing ones.
+    seven_frames = sample_images_for_duration(shuffled_image_paths, timedelta(seconds=7), fps=1)
+    assert sampled_dates(seven_frames) == [datetime(2010, 1, 1, 0, x) for x in [0, 10, 40, 50]] + [dates[-1]]
+    assert sample_images_for_duration(image_paths, timedelta(seconds=1), fps=1) == image_paths[:1]
+    assert sample_images_for_duration(image_paths, timedelta(minutes=10), fps=1) == image_paths
+
+
+def test_segments_are_rendered_once(tmp_path, fake_ffmpeg: Path) -> None:
+    database_path = str(tmp_path / 'logs.db')
+    log_keeper = LogKeeper(create_database_engine(database_path))
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2, 0, 1, 0)}))
+
+    # Across midnight, so in two segments.
+    dates = [datetime(2010, 1, 1, 23, 58, 0) + timedelta(seconds=20 * i) for i in range(12)]
+    image_paths = write_images(tmp_path / 'images', dates)
+
+    def make_video(workers: int) -> List[str]:
+        """
+        Returns the format FFmpeg read each time it ran.
+        """
+        fake_ffmpeg.write_text('')
+        make_video_from_segments(
+            image_paths, tmp_path / 'out.mp4', tmp_path / 'segments',
+            database_path, FRAME_PROCESSOR_ARGS, 30, workers, show_progress=False
+        )
+        create = partial(create_frame_processor, database_path, FRAME_PROCESSOR_ARGS, dates[0], dates[-1])
+        expected = b''.join(read_raw_frames(process_images(image_paths, create, workers=1, show_progress=False)))
+        assert (tmp_path / 'out.mp4').read_bytes() == expected
+        return fake_ffmpeg.read_text().split()
+
+    assert make_video(workers=2) == ['rawvideo', 'rawvideo', 'concat']
+    assert len(list((tmp_path / 'segments').iterdir())) == 2
+    assert make_video(workers=1) == ['concat']
+
+    # Another image in the second day.
+    write_images(tmp_path / 'images', dates[-1:], seed=1)
+    assert make_video(workers=1) == ['rawvideo', 'concat']
+
+    # Another ship berthed in the first day only.
+    log_keeper.write_entries(
+        datetime(2010, 1, 1, 1), make_entries({'A1': datetime(2010, 1, 2, 0, 1, 0), 'B1': datetime(2010, 1, 1, 23, 59)})
+    )
+    assert make_video(workers=1) == ['rawvideo', 'concat']
+    assert len(list((tmp_path / 'segments').iterdir())) == 4
+
+
+def test_segments_are_in_the_format_of_the_output(tmp_path, fake_ffmpeg: Path) -> None:
+    database_path = str(tmp_path / 'logs.db')
+    LogKeeper(create_database_engine(database_path)).write_entries(
+        datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2, 0, 1, 0)})
+    )
+    dates = [datetime(2010, 1, 1, 23, 59, 0), datetime(2010, 1, 2, 0, 1, 0)]
+    image_paths = write_images(tmp_path / 'images', dates)
+
+    for output_name in ['out.webm', 'out.mp4']:
+        make_video_from_segments(
+            image_paths, tmp_path / output_name, tmp_path / 'segments',
+            database_path, FRAME_PROCESSOR_ARGS, 30, 1, show_progress=False
+        )
+    assert (tmp_path / 'out.webm').read_bytes() == (tmp_path / 'out.mp4').read_bytes()
+    assert sorted(x.suffix for x in (tmp_path / 'segments').iterdir()) == ['.mp4', '.mp4', '.webm', '.webm']
+    assert fake_ffmpeg.read_text().split() == ['rawvideo', 'rawvideo', 'concat'] * 2
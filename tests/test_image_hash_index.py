@@ -0,0 +1,83 @@
+import numpy as np
+import os
+
+from PIL import Image
+from typing import List
+
+from brioa_port.image_hash_index import (
+    compute_image_hash, get_hash_distance, skip_duplicate_images, ImageHashIndex
+)
+
+
+def write_scenes(tmp_path, n_scenes: int) -> None:
+    """
+    Writes a JPEG of each of some unrelated scenes, and of the same scene with a bit of noise.
+    """
+    random = np.random.RandomState(0)
+    for i in range(n_scenes):
+        # Smooth, but not flat.
+        pattern = Image.fromarray(random.randint(0, 255, (6, 9, 3), dtype=np.uint8))
+        scene = pattern.resize((704, 480), Image.BICUBIC)
+        noise = random.randint(-3, 4, (480, 704, 3))
+        noisy_scene = np.clip(np.asarray(scene, dtype=int) + noise, 0, 255).astype(np.uint8)
+        scene.save(str(tmp_path / f'{i}.jpg'))
+        Image.fromarray(noisy_scene).save(str(tmp_path / f'{i}_noisy.jpg'))
+
+
+def test_similar_images_have_similar_hashes(tmp_path) -> None:
+    write_scenes(tmp_path, 2)
+    (tmp_path / 'broken.jpg').write_bytes(b'')
+
+    a = compute_image_hash(str(tmp_path / '0.jpg'))
+    assert a is not None
+    assert get_hash_distance(a, compute_image_hash(str(tmp_path / '0_noisy.jpg'))) <= 4
+    assert get_hash_distance(a, compute_image_hash(str(tmp_path / '1.jpg'))) > 16
+    assert compute_image_hash(str(tmp_path / 'broken.jpg')) is None
+    assert compute_image_hash(str(tmp_path / 'missing.jpg')) is None
+
+
+def test_runs_of_duplicates_are_collapsed() -> None:
+    hashes = {'a': 0b0000, 'a1': 0b0001, 'a2': 0b0011, 'a3': 0b0111, 'b': 0b1111_0000, 'broken': None}
+
+    def skip(image_paths: List[str], max_distance: int) -> List[str]:
+        return list(skip_duplicate_images(image_paths, max_distance, hashes.get))
+
+    assert skip(['a', 'a', 'b', 'b', 'a'], 0) == ['a', 'b', 'a']
+    assert skip(['a', 'a1', 'a', 'broken', 'a1'], 0) == ['a', 'a1', 'a', 'broken', 'a1']
+    assert skip(['a', 'a1', 'a', 'broken', 'a1'], 1) == ['a', 'broken']
+    # Compared to the last image kept, so a slow change is noticed eventually.
+    assert skip(['a', 'a1', 'a2', 'a3', 'b'], 1) == ['a', 'a2', 'b']
+
+
+def test_hashes_are_kept_in_the_index(tmp_path) -> None:
+    write_scenes(tmp_path, 2)
+    paths = [str(tmp_path / x) for x in ['0.jpg', '0_noisy.jpg', '1.jpg']]
+    expected = [compute_image_hash(x) for x in paths]
+
+    index = ImageHashIndex(tmp_path / 'hashes.tsv')
+    assert [index.get_hash(x) for x in paths] == expected
+    index.save()
+    assert (index.hits, index.misses) == (0, 3)
+
+    index = ImageHashIndex(tmp_path / 'hashes.tsv')
+    assert [index.get_hash(x) for x in paths] == expected
+    assert (index.hits, index.misses) == (3, 0)
+
+    # Changed since it was hashed.
+    os.replace(paths[2], paths[0])
+    assert index.get_hash(paths[0]) == expected[2]
+    assert (index.hits, index.misses) == (3, 1)
+
+
+def test_hashes_of_other_versions_are_discarded(tmp_path, mocker) -> None:
+    write_scenes(tmp_path, 1)
+    index = ImageHashIndex(tmp_path / 'hashes.tsv')
+    index.get_hash(str(tmp_path / '0.jpg'))
+    index.save()
+
+    mocker.patch('brioa_port.image_hash_index.HASH_VERSION', 1000)
+    index = ImageHashIndex(tmp_path / 'hashes.tsv')
+    index.get_hash(str(tmp_path / '0.jpg'))
+    assert (index.hits, index.misses) == (0, 1)
+    index.save()
+    assert (tmp_path / 'hashes.tsv').read_text().splitlines()[0] == 'v1000'
@@ -0,0 +1,34 @@
+import pytest
+
+from datetime import datetime
+from pandas.testing import assert_frame_equal
+
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.util.database import create_database_engine, LogsLayout
+from tests.test_log_keeper import make_entries
+
+pytest.importorskip('pyarrow')
+
+from brioa_port.log_export import export_logs, read_exported_logs  # noqa: E402
+
+
+@pytest.mark.parametrize('logs_layout', list(LogsLayout))
+def test_export_and_read(tmp_path, logs_layout: LogsLayout) -> None:
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'logs.db')), logs_layout=logs_layout)
+    log_keeper.write_entries(datetime(2010, 1, 31), make_entries({'A1': datetime(2010, 2, 2)}))
+    log_keeper.write_entries(datetime(2010, 2, 1), make_entries({'A1': datetime(2010, 2, 3)}))
+    assert export_logs(log_keeper, tmp_path / 'export') == ['2010-01', '2010-02']
+
+    entries = read_exported_logs(tmp_path / 'export')
+    assert list(entries['date_retrieved']) == [datetime(2010, 1, 31), datetime(2010, 2, 1)]
+    assert entries['Viagem'].dtype.name == 'category'
+
+    # Only the month that changed is written again.
+    log_keeper.write_entries(datetime(2010, 2, 2), make_entries({'A1': datetime(2010, 2, 4)}))
+    assert export_logs(log_keeper, tmp_path / 'export') == ['2010-02']
+    assert export_logs(log_keeper, tmp_path / 'export') == []
+
+    entries = read_exported_logs(tmp_path / 'export', ['ETS'], retrieved_from=datetime(2010, 2, 1, 12, 0, 0))
+    assert_frame_equal(entries, log_keeper.read_entries_retrieved_between(
+        datetime(2010, 2, 1, 12, 0, 0), datetime(2010, 3, 1)
+    )[['ETS']])
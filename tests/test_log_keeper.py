@@ -0,0 +1,370 @@
+import itertools
+import pandas as pd
+import pytest
+import threading
+import time
+
+from datetime import datetime, timedelta
+from pandas.testing import assert_frame_equal
+from typing import Dict, List
+
+from brioa_port.exceptions import UnsupportedDatabaseVersionException, StorageMismatchException
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.util.database import create_database_engine, DatetimeStorage, LogsLayout
+
+
+def make_entries(ets_by_trip: Dict[str, datetime]) -> pd.DataFrame:
+    """
+    Builds a minimal schedule dataframe, with one entry per trip,
+    varying only the sailing date.
+    """
+    trip_names = sorted(ets_by_trip.keys())
+    df = pd.DataFrame({
+        'Berço': [1.0] * len(trip_names),
+        'Navio': ['SHIP ' + x for x in trip_names],
+        'Viagem': trip_names,
+        'Abertura do Gate': pd.NaT,
+        'Deadline': pd.NaT,
+        'ETA': datetime(2010, 1, 1, 10, 0, 0),
+        'ATA': datetime(2010, 1, 1, 11, 0, 0),
+        'ETB': datetime(2010, 1, 1, 12, 0, 0),
+        'ATB': pd.NaT,
+        'ETS': [ets_by_trip[x] for x in trip_names],
+        'ATS': pd.NaT,
+    })
+    for column in ['Abertura do Gate', 'Deadline', 'ATB', 'ATS']:
+        df[column] = pd.to_datetime(df[column])
+    df['Berço'] = df['Berço'].astype(float)
+    return df
+
+
+@pytest.fixture
+def log_keeper(tmp_path) -> LogKeeper:
+    return LogKeeper(create_database_engine(str(tmp_path / 'logs.db')))
+
+
+def test_first_write_inserts_everything(log_keeper: LogKeeper) -> None:
+    entries = make_entries({'A1': datetime(2010, 1, 2), 'B1': datetime(2010, 1, 3)})
+    assert not log_keeper.has_entries()
+    assert log_keeper.write_entries(datetime(2010, 1, 1), entries) == 2
+    assert log_keeper.has_entries()
+
+
+def test_unchanged_entries_are_not_inserted(log_keeper: LogKeeper) -> None:
+    entries = make_entries({'A1': datetime(2010, 1, 2), 'B1': datetime(2010, 1, 3)})
+    log_keeper.write_entries(datetime(2010, 1, 1), entries)
+    assert log_keeper.write_entries(datetime(2010, 1, 2), entries) == 0
+
+
+def test_changed_and_new_entries_are_inserted(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({
+        'A1': datetime(2010, 1, 2),
+        'B1': datetime(2010, 1, 3),
+    }))
+    n_new_entries = log_keeper.write_entries(datetime(2010, 1, 2), make_entries({
+        'A1': datetime(2010, 1, 2),
+        'B1': datetime(2010, 1, 4),
+        'C1': datetime(2010, 1, 5),
+    }))
+    assert n_new_entries == 2
+
+    entries = log_keeper.read_entries_for_trip('B1')
+    assert len(entries) == 2
+    assert entries.iloc[0]['ETS'] == datetime(2010, 1, 4)
+    assert entries.iloc[0]['date_retrieved'] == datetime(2010, 1, 2)
+
+
+def test_older_entries_are_not_inserted(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 2)}))
+    assert log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 3)})) == 0
+    assert log_keeper.read_latest_entry_for_trip('A1')['ETS'] == datetime(2010, 1, 2)
+
+
+def test_unknown_trip(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+    assert log_keeper.read_entries_for_trip('Z9') is None
+    assert log_keeper.read_latest_entry_for_trip('Z9') is None
+    assert pd.isnull(log_keeper.read_latest_entry_for_trip('A1')['ATB'])
+
+
+def test_latest_entry_follows_writes(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 3)}))
+    log_keeper.write_entries(datetime(2010, 1, 3), make_entries({'A1': datetime(2010, 1, 3)}))
+    latest_entry = log_keeper.read_latest_entry_for_trip('A1')
+    assert latest_entry['ETS'] == datetime(2010, 1, 3)
+    assert latest_entry['date_retrieved'] == datetime(2010, 1, 2)
+
+
+def test_ships_at_port_uses_latest_entries(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({
+        'A1': datetime(2010, 1, 2),
+        'B1': datetime(2010, 1, 3),
+    }))
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({
+        'A1': datetime(2010, 1, 1, 20, 0, 0),
+        'B1': datetime(2010, 1, 3),
+    }))
+    ships = log_keeper.read_ships_at_port(datetime(2010, 1, 2), datetime(2010, 1, 1, 22, 0, 0))
+    assert list(ships['Viagem']) == ['B1']
+    assert ships.iloc[0]['TS'] == datetime(2010, 1, 3)
+    assert not ships.iloc[0]['TA_is_predicted']
+
+
+def test_rebuild_latest_entries(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 3)}))
+    log_keeper.engine.execute(f'delete from {LogKeeper.LATEST_TABLE}')
+    assert log_keeper.read_latest_entry_for_trip('A1') is None
+
+    log_keeper.rebuild_latest_entries()
+    assert log_keeper.read_latest_entry_for_trip('A1')['ETS'] == datetime(2010, 1, 3)
+
+
+def test_migrate_unmanaged_database(tmp_path) -> None:
+    engine = create_database_engine(str(tmp_path / 'logs.db'))
+    # Databases used to be created by pandas, with only the date_retrieved index.
+    for day in [1, 2]:
+        entries = make_entries({'A1': datetime(2010, 1, day + 1), 'B1': datetime(2010, 1, 4)})
+        date_retrieved = datetime(2010, 1, day)
+        entries['date_retrieved'] = date_retrieved
+        entries.set_index('date_retrieved').to_sql(LogKeeper.LOGS_TABLE, con=engine, if_exists='append')
+
+    log_keeper = LogKeeper(engine)
+    assert engine.execute('pragma user_version').scalar() == LogKeeper.SCHEMA_VERSION
+    assert len(log_keeper.read_entries_for_trip('A1')) == 2
+    assert log_keeper.read_latest_entry_for_trip('A1')['ETS'] == datetime(2010, 1, 3)
+    index_names = {x for (x,) in engine.execute("select name from sqlite_master where type = 'index'")}
+    assert 'ix_logs_Viagem_date_retrieved' in index_names
+
+    # Opening it again doesn't do anything.
+    LogKeeper(engine)
+    assert len(log_keeper.read_entries_for_trip('A1')) == 2
+
+
+def test_newer_database_is_rejected(tmp_path) -> None:
+    engine = create_database_engine(str(tmp_path / 'logs.db'))
+    engine.execute(f'pragma user_version = {LogKeeper.SCHEMA_VERSION + 1}')
+    with pytest.raises(UnsupportedDatabaseVersionException):
+        LogKeeper(engine)
+
+
+def test_epoch_datetime_storage(tmp_path) -> None:
+    text_log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'text.db')))
+    epoch_log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'epoch.db')), DatetimeStorage.EPOCH)
+    for log_keeper in [text_log_keeper, epoch_log_keeper]:
+        log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+        log_keeper.write_entries(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 3)}))
+        assert log_keeper.write_entries(datetime(2010, 1, 3), make_entries({'A1': datetime(2010, 1, 3)})) == 0
+
+    assert_frame_equal(
+        text_log_keeper.read_entries_for_trip('A1'),
+        epoch_log_keeper.read_entries_for_trip('A1'),
+        check_dtype=False
+    )
+    for sails_after in [datetime(2010, 1, 1), datetime(2010, 1, 3), datetime(2010, 1, 3, 0, 0, 1)]:
+        assert_frame_equal(
+            text_log_keeper.read_ships_at_port(datetime(2010, 1, 1, 11, 0, 0), sails_after),
+            epoch_log_keeper.read_ships_at_port(datetime(2010, 1, 1, 11, 0, 0), sails_after),
+            check_dtype=False
+        )
+
+
+def test_convert_datetime_storage(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 3)}))
+    entries = log_keeper.read_entries_for_trip('A1')
+
+    log_keeper.convert_datetime_storage(DatetimeStorage.EPOCH)
+    assert log_keeper.engine.execute(f'select typeof(ETS) from {LogKeeper.LOGS_TABLE}').scalar() == 'integer'
+    assert_frame_equal(entries, log_keeper.read_entries_for_trip('A1'), check_dtype=False)
+
+    with pytest.raises(StorageMismatchException):
+        LogKeeper(log_keeper.engine, DatetimeStorage.TEXT)
+
+    log_keeper.convert_datetime_storage(DatetimeStorage.TEXT)
+    assert_frame_equal(entries, log_keeper.read_entries_for_trip('A1'), check_dtype=False)
+
+
+def test_write_entries_in_bulk(tmp_path) -> None:
+    entries_by_date = [
+        (datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2), 'B1': datetime(2010, 1, 3)})),
+        (datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 2), 'B1': datetime(2010, 1, 4)})),
+        (datetime(2010, 1, 3), make_entries({'A1': datetime(2010, 1, 5), 'B1': datetime(2010, 1, 4)})),
+    ]
+    sequential_log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'sequential.db')))
+    n_sequential = sum(sequential_log_keeper.write_entries(*x) for x in entries_by_date)
+    bulk_log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'bulk.db')))
+    n_bulk = bulk_log_keeper.write_entries_in_bulk(entries_by_date, batch_size=2)
+
+    assert n_bulk == n_sequential == 4
+    for trip_name in ['A1', 'B1']:
+        assert_frame_equal(
+            sequential_log_keeper.read_entries_for_trip(trip_name),
+            bulk_log_keeper.read_entries_for_trip(trip_name)
+        )
+
+
+def test_delta_logs_layout(tmp_path) -> None:
+    full_log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'full.db')))
+    delta_log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'delta.db')), logs_layout=LogsLayout.DELTA)
+    for log_keeper in [full_log_keeper, delta_log_keeper]:
+        log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+        log_keeper.write_entries(datetime(2010, 1, 2), make_entries({
+            'A1': datetime(2010, 1, 3),
+            'B1': datetime(2010, 1, 4),
+        }))
+        log_keeper.write_entries(datetime(2010, 1, 3), make_entries({
+            'A1': datetime(2010, 1, 2),
+            'B1': datetime(2010, 1, 4),
+        }))
+
+    # Only the first entry of each trip is a full row.
+    assert delta_log_keeper.engine.execute(f'select count(*) from {LogKeeper.LOGS_TABLE}').scalar() == 2
+    for trip_name in ['A1', 'B1']:
+        assert_frame_equal(
+            full_log_keeper.read_entries_for_trip(trip_name),
+            delta_log_keeper.read_entries_for_trip(trip_name)
+        )
+    assert delta_log_keeper.read_entries_for_trip('Z9') is None
+
+    delta_log_keeper.rebuild_latest_entries()
+    assert_frame_equal(
+        full_log_keeper.read_ships_at_port(datetime(2010, 1, 2), datetime(2010, 1, 1)),
+        delta_log_keeper.read_ships_at_port(datetime(2010, 1, 2), datetime(2010, 1, 1))
+    )
+
+
+def test_convert_logs_layout(log_keeper: LogKeeper) -> None:
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 3)}))
+    entries = log_keeper.read_entries_for_trip('A1')
+
+    log_keeper.convert_logs_layout(LogsLayout.DELTA)
+    assert log_keeper.engine.execute(f'select count(*) from {LogKeeper.DELTAS_TABLE}').scalar() == 2
+    assert_frame_equal(entries, log_keeper.read_entries_for_trip('A1'))
+
+    with pytest.raises(StorageMismatchException):
+        LogKeeper(log_keeper.engine, logs_layout=LogsLayout.FULL)
+
+    log_keeper.convert_datetime_storage(DatetimeStorage.EPOCH)
+    assert log_keeper.logs_layout == LogsLayout.DELTA
+    assert_frame_equal(entries, log_keeper.read_entries_for_trip('A1'), check_dtype=False)
+
+    log_keeper.convert_logs_layout(LogsLayout.FULL)
+    assert not log_keeper.engine.dialect.has_table(log_keeper.engine, LogKeeper.DELTAS_TABLE)
+    assert_frame_equal(entries, log_keeper.read_entries_for_trip('A1'), check_dtype=False)
+
+
+def test_read_cache(tmp_path) -> None:
+    engine = create_database_engine(str(tmp_path / 'logs.db'))
+    log_keeper = LogKeeper(engine, cache_size=4)
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+
+    entries = log_keeper.read_entries_for_trip('A1')
+    entries.loc[0, 'Navio'] = 'CHANGED BY THE CALLER'
+    assert_frame_equal(log_keeper.read_entries_for_trip('A1'), log_keeper.read_entries_for_trip('A1'))
+    assert log_keeper.read_entries_for_trip('A1').iloc[0]['Navio'] == 'SHIP A1'
+    assert (log_keeper.read_cache.hits, log_keeper.read_cache.misses) == (3, 1)
+
+    # Writes from another instance (e.g. another process) invalidate the cache.
+    LogKeeper(engine).write_entries(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 3)}))
+    assert len(log_keeper.read_entries_for_trip('A1')) == 2
+    assert log_keeper.read_latest_entries(['A1']).iloc[0]['ETS'] == datetime(2010, 1, 3)
+    assert log_keeper.read_cache.misses == 3
+
+
+@pytest.mark.parametrize('logs_layout', list(LogsLayout))
+def test_read_entries_for_trips(tmp_path, logs_layout: LogsLayout) -> None:
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'logs.db')), logs_layout=logs_layout)
+    log_keeper.MAX_QUERY_PARAMETERS = 2
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({x: datetime(2010, 1, 2) for x in ['A1', 'B1', 'C1']}))
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({x: datetime(2010, 1, 3) for x in ['A1', 'C1']}))
+
+    entries = log_keeper.read_entries_for_trips(['C1', 'X1', 'A1', 'B1', 'C1'])
+    assert list(entries['Viagem']) == ['C1', 'C1', 'A1', 'A1', 'B1']
+    assert list(entries['date_retrieved']) == [datetime(2010, 1, 2), datetime(2010, 1, 1)] * 2 + [datetime(2010, 1, 1)]
+    for trip_name in ['A1', 'B1', 'C1']:
+        assert_frame_equal(
+            entries[entries['Viagem'] == trip_name].reset_index(drop=True),
+            log_keeper.read_entries_for_trip(trip_name)
+        )
+    assert log_keeper.read_entries_for_trips(['X1']).empty
+    assert log_keeper.read_entries_for_trips([]).empty
+
+
+@pytest.mark.parametrize('logs_layout', list(LogsLayout))
+def test_ships_at_port_as_of(tmp_path, logs_layout: LogsLayout) -> None:
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'logs.db')), logs_layout=logs_layout)
+    log_keeper.write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 3)}))
+    log_keeper.write_entries(datetime(2010, 1, 2), make_entries({
+        'A1': datetime(2010, 1, 1, 20, 0, 0),
+        'B1': datetime(2010, 1, 3),
+    }))
+
+    def read_trip_names(as_of: datetime) -> List[str]:
+        ships = log_keeper.read_ships_at_port(datetime(2010, 1, 2), datetime(2010, 1, 1, 22, 0, 0), as_of=as_of)
+        return list(ships['Viagem'])
+
+    assert read_trip_names(datetime(2009, 12, 31)) == []
+    assert read_trip_names(datetime(2010, 1, 1)) == ['A1']
+    assert read_trip_names(datetime(2010, 1, 1, 12, 0, 0)) == ['A1']
+    assert read_trip_names(datetime(2010, 1, 2)) == ['B1']
+
+
+@pytest.mark.parametrize('logs_layout', list(LogsLayout))
+def test_concurrent_readers_and_writer(tmp_path, logs_layout: LogsLayout) -> None:
+    path = str(tmp_path / 'logs.db')
+    writer = LogKeeper(create_database_engine(path, concurrent=True), logs_layout=logs_layout)
+    writer.write_entries(datetime(2010, 1, 1), make_entries({f'A{i}': datetime(2010, 1, 2) for i in range(50)}))
+
+    errors: List[Exception] = []
+    read_durations: List[float] = []
+    writes: List[int] = []
+    is_writing = threading.Event()
+    is_writing.set()
+
+    def write_continuously() -> None:
+        for second in itertools.count(1):
+            if not is_writing.is_set():
+                return
+            try:
+                # Always later than the previous write, and different from it.
+                writer.write_entries(datetime(2010, 1, 1) + timedelta(seconds=second), make_entries({
+                    f'A{i}': datetime(2010, 1, 2) + timedelta(minutes=i, seconds=second) for i in range(50)
+                }))
+            except Exception as e:
+                errors.append(e)
+                return
+            writes.append(second)
+
+    def read_continuously() -> None:
+        reader = LogKeeper(
+            create_database_engine(path),
+            read_engine=create_database_engine(path, concurrent=True, read_only=True)
+        )
+        while is_writing.is_set():
+            start = time.monotonic()
+            try:
+                assert len(reader.read_ships_at_port(datetime(2010, 1, 2), datetime(2010, 1, 1))) == 50
+                assert reader.read_entries_for_trip('A0') is not None
+            except Exception as e:
+                errors.append(e)
+                return
+            read_durations.append(time.monotonic() - start)
+
+    threads = [threading.Thread(target=write_continuously)]
+    threads += [threading.Thread(target=read_continuously) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(2)
+    is_writing.clear()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(read_durations) > 0
+    # No reader had to wait for the writer's transactions to end.
+    assert max(read_durations) < 1
+    assert len(writes) > 2
+    assert len(writer.read_entries_for_trip('A0')) == 1 + len(writes)
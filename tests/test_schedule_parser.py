@@ -0,0 +1,96 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+import xlwt
+
+from datetime import datetime
+from pandas.testing import assert_frame_equal
+from pathlib import Path
+
+from brioa_port.schedule_parser import (
+    parse_date_strings, parse_schedule_spreadsheet, parse_schedule_spreadsheets,
+    SCHEDULE_DATE_COLUMNS, SCHEDULE_DATE_FORMAT
+)
+
+
+def write_spreadsheet(path: Path, rows: list) -> None:
+    workbook = xlwt.Workbook()
+    sheet = workbook.add_sheet('Programação')
+    date_style = xlwt.easyxf(num_format_str='DD/MM/YYYY HH:MM:SS')
+    for i, row in enumerate(rows):
+        for j, value in enumerate(row):
+            sheet.write(i, j, value, date_style if isinstance(value, datetime) else xlwt.Style.default_style)
+    workbook.save(str(path))
+
+
+def parse_with_read_excel(path: Path) -> pd.DataFrame:
+    """
+    How the spreadsheet was parsed before, with the generic pd.read_excel.
+    """
+    df = pd.read_excel(str(path))
+    for date_column in SCHEDULE_DATE_COLUMNS:
+        df[date_column] = pd.to_datetime(df[date_column], format=SCHEDULE_DATE_FORMAT)
+    df['Navio'] = df['Navio'].apply(lambda x: x.split(' - ')[0])
+    df['Berço'] = df['Berço'].astype(float)
+    return df
+
+
+@pytest.fixture
+def spreadsheet_path(tmp_path) -> Path:
+    header = ['Berço', 'Navio', 'Viagem', *SCHEDULE_DATE_COLUMNS, 'Armador', 'Comprimento(m)', 'Obs', 'Obs', '']
+    rows = [
+        [1, 'SHIP A - A1', 'A1', *['01/01/2010 10:00:00'] * 8, 'MSC', 300, 'x', 1, ''],
+        ['', 'SHIP B', 'B1', *['02/01/2010 10:00:00', ''] * 4, 'N/A', 250.5, '', 2, 'y'],
+        [2, 'SHIP - C - C1', 'C1', *['31/12/2009 23:59:59'] * 8, '', 200, 'z', 3, ''],
+    ]
+    # Cells formatted as dates, instead of text.
+    for i, row in enumerate(rows):
+        row[5] = datetime(2010, 1, 3, 12, i)
+    path = tmp_path / 'schedule.xls'
+    write_spreadsheet(path, [header, *rows])
+    return path
+
+
+def test_same_results_as_read_excel(spreadsheet_path: Path) -> None:
+    df = parse_schedule_spreadsheet(str(spreadsheet_path))
+    assert_frame_equal(df, parse_with_read_excel(spreadsheet_path))
+    assert list(df['Navio']) == ['SHIP A', 'SHIP B', 'SHIP']
+    assert list(df.columns[-3:]) == ['Obs', 'Obs.1', 'Unnamed: 15']
+
+    with open(spreadsheet_path, 'rb') as f:
+        assert_frame_equal(parse_schedule_spreadsheet(io.BytesIO(f.read())), df)
+
+
+def test_column_projection(spreadsheet_path: Path) -> None:
+    df = parse_schedule_spreadsheet(str(spreadsheet_path), columns=['Viagem'])
+    assert list(df.columns) == ['Navio', 'Viagem', *SCHEDULE_DATE_COLUMNS]
+    assert_frame_equal(df, parse_with_read_excel(spreadsheet_path)[df.columns])
+
+
+def test_broken_spreadsheets_are_ignored(spreadsheet_path: Path) -> None:
+    contents = spreadsheet_path.read_bytes()
+    # Fails in xlrd.compdoc, with an error that isn't an XLRDError.
+    (spreadsheet_path.parent / 'corrupt.xls').write_bytes(contents[:512] + bytes(len(contents) - 512))
+    # Fails with an IndexError.
+    (spreadsheet_path.parent / 'truncated.xls').write_bytes(contents[:len(contents) // 2])
+    paths = [str(spreadsheet_path.parent / x) for x in ['corrupt.xls', 'schedule.xls', 'truncated.xls', 'missing.xls']]
+
+    results = list(parse_schedule_spreadsheets(paths, workers=2))
+    assert [path for path, _ in results] == paths
+    assert [df is None for _, df in results] == [True, False, True, True]
+    assert_frame_equal(results[1][1], parse_schedule_spreadsheet(str(spreadsheet_path)))
+
+
+def test_parse_date_strings() -> None:
+    date_strings = np.array(['31/01/2019 23:59:00', '01/12/2018 00:00:01'], dtype=object)
+    assert list(parse_date_strings(date_strings)) == [
+        np.datetime64('2019-01-31T23:59:00'), np.datetime64('2018-12-01T00:00:01')
+    ]
+    # Not exactly in the format, so it's left to pd.to_datetime.
+    assert list(parse_date_strings(np.array(['1/2/2019 23:59:00'], dtype=object))) == [
+        np.datetime64('2019-02-01T23:59:00')
+    ]
+    for invalid_date_string in ['31/02/2019 23:59:00', '31/01/2019 24:00:00', '2019-01-31 23:59:00']:
+        with pytest.raises(ValueError):
+            parse_date_strings(np.array([invalid_date_string], dtype=object))
@@ -0,0 +1,72 @@
+from datetime import datetime
+from pandas.testing import assert_frame_equal
+
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.schedule_updater import ScheduleUpdater
+from brioa_port.util.database import create_database_engine
+from brioa_port.util.request import ConditionalResponse
+from tests.test_log_keeper import make_entries
+
+
+def test_same_results_as_log_keeper(tmp_path) -> None:
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'log_keeper.db')))
+    updater = ScheduleUpdater(LogKeeper(create_database_engine(str(tmp_path / 'updater.db'))))
+    entries_by_date = [
+        (datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)})),
+        (datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 2), 'B1': datetime(2010, 1, 4)})),
+        (datetime(2010, 1, 3), make_entries({'A1': datetime(2010, 1, 3), 'B1': datetime(2010, 1, 4)})),
+        (datetime(2010, 1, 4), make_entries({'A1': datetime(2010, 1, 3)})),
+        (datetime(2010, 1, 5), make_entries({'A1': datetime(2010, 1, 3), 'B1': datetime(2010, 1, 5)})),
+    ]
+    for date_retrieved, entries in entries_by_date:
+        assert updater.update(date_retrieved, entries) == log_keeper.write_entries(date_retrieved, entries)
+
+    for trip_name in ['A1', 'B1']:
+        assert_frame_equal(
+            log_keeper.read_entries_for_trip(trip_name),
+            updater.log_keeper.read_entries_for_trip(trip_name)
+        )
+
+
+def test_unchanged_entries_skip_the_database(tmp_path, mocker) -> None:
+    engine = create_database_engine(str(tmp_path / 'logs.db'))
+    LogKeeper(engine).write_entries(datetime(2010, 1, 1), make_entries({'A1': datetime(2010, 1, 2)}))
+
+    updater = ScheduleUpdater(LogKeeper(engine))
+    read_latest_entries = mocker.spy(updater.log_keeper, 'read_latest_entries')
+    write_entries = mocker.spy(updater.log_keeper, 'write_entries')
+
+    assert updater.update(datetime(2010, 1, 2), make_entries({'A1': datetime(2010, 1, 2)})) == 0
+    assert updater.update(datetime(2010, 1, 3), make_entries({'A1': datetime(2010, 1, 2)})) == 0
+    # Loaded once, on the first update.
+    assert read_latest_entries.call_count == 1
+    assert write_entries.call_count == 0
+
+    assert updater.update(datetime(2010, 1, 4), make_entries({'A1': datetime(2010, 1, 3)})) == 1
+    assert updater.update(datetime(2010, 1, 5), make_entries({'A1': datetime(2010, 1, 3)})) == 0
+    assert write_entries.call_count == 1
+    assert updater.latest_entries.loc['A1', 'ETS'] == datetime(2010, 1, 3)
+
+
+def test_unchanged_spreadsheets_are_not_parsed(tmp_path, mocker) -> None:
+    updater = ScheduleUpdater(LogKeeper(create_database_engine(str(tmp_path / 'logs.db'))))
+    responses = [
+        ConditionalResponse(b'first', '"v1"', None),
+        ConditionalResponse(None, '"v1"', None),
+        # Same content, but the server didn't recognize it.
+        ConditionalResponse(b'first', '"v2"', None),
+        ConditionalResponse(b'second', '"v3"', None),
+    ]
+    fetch_url_if_modified = mocker.patch(
+        'brioa_port.schedule_updater.fetch_url_if_modified', side_effect=responses
+    )
+    parse_schedule_spreadsheet = mocker.patch(
+        'brioa_port.schedule_updater.parse_schedule_spreadsheet',
+        side_effect=[make_entries({'A1': datetime(2010, 1, 2)}), make_entries({'A1': datetime(2010, 1, 3)})]
+    )
+
+    assert [updater.update_online() for _ in responses] == [1, 0, 0, 1]
+    assert parse_schedule_spreadsheet.call_count == 2
+    assert (updater.n_online_updates, updater.n_unchanged_online_updates) == (4, 2)
+    # The validators of the latest response are sent.
+    assert [x[0][1] for x in fetch_url_if_modified.call_args_list] == [None, '"v1"', '"v1"', '"v2"']
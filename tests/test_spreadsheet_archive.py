@@ -0,0 +1,72 @@
+from datetime import datetime
+from pandas.testing import assert_frame_equal
+from pathlib import Path
+
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.schedule_parser import SCHEDULE_DATE_COLUMNS
+from brioa_port.schedule_updater import ScheduleUpdater
+from brioa_port.spreadsheet_archive import SpreadsheetArchive, replay_archive
+from brioa_port.util.database import create_database_engine
+from brioa_port.util.request import ConditionalResponse
+from tests.test_schedule_parser import write_spreadsheet
+
+
+def make_spreadsheet_content(tmp_path: Path, ets: str) -> bytes:
+    path = tmp_path / f'{len(list(tmp_path.iterdir()))}.xls'
+    header = ['Berço', 'Navio', 'Viagem', *SCHEDULE_DATE_COLUMNS]
+    write_spreadsheet(path, [header, [1, 'SHIP A - A1', 'A1', *['01/01/2010 10:00:00'] * 6, ets, '']])
+    return path.read_bytes()
+
+
+def test_identical_spreadsheets_are_stored_once(tmp_path) -> None:
+    archive = SpreadsheetArchive(tmp_path / 'archive')
+    first_hash = archive.add(datetime(2010, 1, 1), b'first')
+    assert archive.add(datetime(2010, 1, 2), b'first') == first_hash
+    second_hash = archive.add(datetime(2010, 1, 3), b'second')
+    archive.add_retrieval(datetime(2010, 1, 4), second_hash)
+
+    assert len(list((tmp_path / 'archive' / 'objects').glob('*/*.xls'))) == 2
+    assert archive.get_path(first_hash).read_bytes() == b'first'
+    assert archive.read_index() == [
+        (datetime(2010, 1, 1), first_hash),
+        (datetime(2010, 1, 2), first_hash),
+        (datetime(2010, 1, 3), second_hash),
+        (datetime(2010, 1, 4), second_hash),
+    ]
+
+
+def test_invalid_index_lines_are_ignored(tmp_path) -> None:
+    archive = SpreadsheetArchive(tmp_path)
+    content_hash = archive.add(datetime(2010, 1, 2, 0, 0, 0, 123), b'first')
+    with open(tmp_path / SpreadsheetArchive.INDEX_FILENAME, 'at') as f:
+        # Left incomplete, e.g. by a crash.
+        f.write('2010-01-03 00:00:00.0')
+    archive.add(datetime(2010, 1, 1), b'first')
+
+    assert archive.read_index() == [
+        (datetime(2010, 1, 1), content_hash),
+        (datetime(2010, 1, 2, 0, 0, 0, 123), content_hash),
+    ]
+
+
+def test_replay_has_the_same_results_as_the_online_updates(tmp_path, mocker) -> None:
+    first = make_spreadsheet_content(tmp_path, '02/01/2010 10:00:00')
+    second = make_spreadsheet_content(tmp_path, '03/01/2010 10:00:00')
+    mocker.patch('brioa_port.schedule_updater.fetch_url_if_modified', side_effect=[
+        ConditionalResponse(first, '"v1"', None),
+        ConditionalResponse(None, '"v1"', None),
+        ConditionalResponse(second, '"v2"', None),
+        ConditionalResponse(second, '"v3"', None),
+        ConditionalResponse(first, '"v4"', None),
+    ])
+    archive = SpreadsheetArchive(tmp_path / 'archive')
+    updater = ScheduleUpdater(LogKeeper(create_database_engine(str(tmp_path / 'online.db'))), archive=archive)
+    assert [updater.update_online() for _ in range(5)] == [1, 0, 1, 0, 1]
+    assert len(archive.read_index()) == 5
+
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'replayed.db')))
+    assert replay_archive(archive, log_keeper, workers=1) == 3
+    assert_frame_equal(
+        log_keeper.read_entries_for_trip('A1'),
+        updater.log_keeper.read_entries_for_trip('A1')
+    )
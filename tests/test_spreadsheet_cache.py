@@ -0,0 +1,55 @@
+import pytest
+import shutil
+
+from pandas.testing import assert_frame_equal
+
+from brioa_port.schedule_parser import parse_schedule_spreadsheet, SCHEDULE_DATE_COLUMNS
+from tests.test_schedule_parser import write_spreadsheet
+
+pytest.importorskip('pyarrow')
+from brioa_port.spreadsheet_cache import ParsedSpreadsheetCache  # noqa: E402
+
+
+def write_schedule(path, extra_values) -> None:
+    write_spreadsheet(path, [
+        ['Berço', 'Navio', 'Viagem', *SCHEDULE_DATE_COLUMNS, 'Armador', 'Extra'],
+        [1, 'SHIP A - A1', 'A1', *['01/01/2010 10:00:00', ''] * 4, 'MSC', extra_values[0]],
+        ['', 'SHIP B', 'B1', *['02/01/2010 10:00:00'] * 8, '', extra_values[1]],
+    ])
+
+
+def test_cached_results_are_the_same(tmp_path) -> None:
+    write_schedule(tmp_path / 'a.xls', [300, 250.5])
+    cache = ParsedSpreadsheetCache(tmp_path / 'cache')
+
+    expected = parse_schedule_spreadsheet(str(tmp_path / 'a.xls'))
+    assert_frame_equal(cache.parse(str(tmp_path / 'a.xls')), expected)
+    assert_frame_equal(cache.parse(str(tmp_path / 'a.xls')), expected)
+    # Found by content, not by name.
+    shutil.copy(str(tmp_path / 'a.xls'), str(tmp_path / 'b.xls'))
+    assert_frame_equal(cache.parse(str(tmp_path / 'b.xls')), expected)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_parser_version_change_invalidates_the_cache(tmp_path, mocker) -> None:
+    write_schedule(tmp_path / 'a.xls', [300, 250.5])
+    ParsedSpreadsheetCache(tmp_path / 'cache').parse(str(tmp_path / 'a.xls'))
+    # Not created by the cache, so never deleted by it.
+    for unrelated_path in [tmp_path / 'cache' / 'v1', tmp_path / 'cache' / 'parsed' / 'old']:
+        unrelated_path.mkdir()
+
+    mocker.patch('brioa_port.spreadsheet_cache.PARSER_VERSION', 1000)
+    cache = ParsedSpreadsheetCache(tmp_path / 'cache')
+    assert sorted(x.name for x in (tmp_path / 'cache').iterdir()) == ['parsed', 'v1']
+    assert sorted(x.name for x in (tmp_path / 'cache' / 'parsed').iterdir()) == ['old', 'v1000']
+    cache.parse(str(tmp_path / 'a.xls'))
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_unstorable_results_are_parsed_every_time(tmp_path) -> None:
+    write_schedule(tmp_path / 'a.xls', ['text', 1])
+    cache = ParsedSpreadsheetCache(tmp_path / 'cache')
+
+    for _ in range(2):
+        assert_frame_equal(cache.parse(str(tmp_path / 'a.xls')), parse_schedule_spreadsheet(str(tmp_path / 'a.xls')))
+    assert (cache.hits, cache.misses) == (0, 2)
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from datetime import datetime, timedelta
+from PIL import Image, ImageFont
+
+from brioa_port.log_keeper import LogKeeper
+from brioa_port.timelapse_frame_processor import Resampling, TimelapseFrameProcessor
+from brioa_port.util.database import create_database_engine
+from tests.test_log_keeper import make_entries
+
+
+LONG_NAME = 'A SHIP WITH A VERY, VERY, VERY, VERY, VERY LONG NAME'
+
+
+@pytest.fixture
+def log_keeper(tmp_path) -> LogKeeper:
+    log_keeper = LogKeeper(create_database_engine(str(tmp_path / 'logs.db')))
+    entries = make_entries({'A1': datetime(2010, 1, 1, 14, 0, 0), 'B1': datetime(2010, 1, 1, 16, 0, 0)})
+    # Too long to fit in the sidebar, even with the smallest font.
+    entries.loc[entries['Viagem'] == 'B1', 'Navio'] = LONG_NAME
+    log_keeper.write_entries(datetime(2010, 1, 1), entries)
+    return log_keeper
+
+
+@pytest.mark.parametrize('dimensions', [(1920, 1080), (1280, 720)])
+def test_cached_sidebars_make_the_same_frames(log_keeper: LogKeeper, dimensions) -> None:
+    cached = TimelapseFrameProcessor(log_keeper, dimensions)
+    uncached = TimelapseFrameProcessor(log_keeper, dimensions, sidebar_cache_size=0)
+
+    random = np.random.RandomState(0)
+    images = [Image.fromarray(random.randint(0, 255, (480, 704, 3), dtype=np.uint8)) for _ in range(2)]
+    # Before and after each ship sails, three frames a minute.
+    dates = [datetime(2010, 1, 1, 13, 59, 0) + timedelta(seconds=20 * i) for i in range(6)]
+    dates += [datetime(2010, 1, 1, 15, 59, 0) + timedelta(seconds=20 * i) for i in range(6)]
+    for i, date in enumerate(dates):
+        frame = cached.make_frame(images[i % 2], date)
+        assert np.array_equal(np.asarray(frame), np.asarray(uncached.make_frame(images[i % 2], date)))
+
+    # One sidebar for each minute and set of ships. The ships sail at the start of a minute,
+    # so the first frame of that minute has a sidebar of its own.
+    assert (cached.sidebar_cache.hits, cached.sidebar_cache.misses) == (6, 6)
+
+
+@pytest.mark.parametrize('dimensions', [(1920, 1080), (1280, 720)])
+def test_reused_canvases_make_the_same_frames(log_keeper: LogKeeper, dimensions) -> None:
+    processor = TimelapseFrameProcessor(log_keeper, dimensions)
+
+    random = np.random.RandomState(0)
+    # The wide one leaves some of the canvas below it, which the sidebar doesn't cover.
+    images = [
+        Image.fromarray(random.randint(0, 255, (480, 704, 3), dtype=np.uint8)),
+        Image.fromarray(random.randint(0, 255, (300, 1000, 3), dtype=np.uint8)),
+    ]
+    canvas = None
+    for i, date in enumerate([datetime(2010, 1, 1, 14, 0, 0), datetime(2010, 1, 1, 16, 0, 0)] * 2):
+        expected = processor.make_frame(images[i % 2], date)
+        frame = processor.make_frame(images[i % 2], date, canvas)
+        if canvas is not None:
+            assert frame is canvas
+        assert np.array_equal(np.asarray(frame), np.asarray(expected))
+        # Drawn over next time.
+        canvas = Image.fromarray(255 - np.asarray(frame))
+
+
+@pytest.mark.parametrize('resampling, decoded_size', [
+    (Resampling.QUALITY, (1000, 750)),
+    (Resampling.SPEED, (500, 375)),
+])
+def test_jpegs_are_decoded_at_a_reduced_size(log_keeper: LogKeeper, tmp_path, resampling, decoded_size) -> None:
+    # Shown at 960x720, in a 720p frame.
+    x, y = np.meshgrid(np.linspace(0, 255, 2000), np.linspace(0, 255, 1500))
+    pixels = np.stack([x, y, 255 - x], axis=-1).astype(np.uint8)
+    Image.fromarray(pixels).save(str(tmp_path / 'large.jpg'))
+    Image.fromarray(pixels[:480, :704]).save(str(tmp_path / 'small.jpg'))
+
+    processor = TimelapseFrameProcessor(log_keeper, (1280, 720), resampling=resampling)
+    date = datetime(2010, 1, 1, 14, 0, 0)
+    with Image.open(str(tmp_path / 'large.jpg')) as image:
+        frame = processor.make_frame(image, date)
+        assert image.size == decoded_size
+    with Image.open(str(tmp_path / 'large.jpg')) as image:
+        image.load()
+        fully_decoded_frame = processor.make_frame(image, date)
+    difference = np.abs(np.asarray(frame, dtype=int) - np.asarray(fully_decoded_frame, dtype=int))
+    assert difference.mean() < 1
+
+    # Smaller than it's shown at, so decoded fully.
+    with Image.open(str(tmp_path / 'small.jpg')) as image:
+        processor.make_frame(image, date)
+        assert image.size == (704, 480)
+
+
+def test_fonts_are_loaded_once(log_keeper: LogKeeper, mocker) -> None:
+    image = Image.new('RGB', (704, 480))
+    processor = TimelapseFrameProcessor(log_keeper)
+    processor.make_frame(image, datetime(2010, 1, 1, 13, 0, 0))
+
+    truetype = mocker.spy(ImageFont, 'truetype')
+    # Another minute, so the sidebar is drawn again, with the long name shrunk again.
+    processor.make_frame(image, datetime(2010, 1, 1, 13, 1, 0))
+    TimelapseFrameProcessor(log_keeper).make_frame(image, datetime(2010, 1, 1, 13, 2, 0))
+    assert truetype.call_count == 0
+
+    name_font = processor._get_name_font(LONG_NAME, 300)
+    assert name_font.size == 12
+    assert name_font.path == processor.fonts['large'].path
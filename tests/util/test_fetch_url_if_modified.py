@@ -0,0 +1,61 @@
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+
+from brioa_port.util.request import fetch_url_if_modified
+
+
+def test_modified(mocker):
+    mocker.patch('urllib.request.urlopen')
+    urlopen_return_mock = MagicMock()
+    urlopen_return_mock.read.return_value = b'content'
+    urlopen_return_mock.info.return_value = {
+        'ETag': '"v2"',
+        'Last-Modified': 'Mon, 21 Oct 2015 23:29:00 GMT'
+    }
+    urllib.request.urlopen.return_value = urlopen_return_mock
+
+    response = fetch_url_if_modified('http://example.com', '"v1"', 'Sun, 20 Oct 2015 23:29:00 GMT')
+    assert response.content == b'content'
+    assert response.etag == '"v2"'
+    assert response.last_modified == 'Mon, 21 Oct 2015 23:29:00 GMT'
+
+    request = urllib.request.urlopen.call_args[0][0]
+    assert request.get_header('If-none-match') == '"v1"'
+    assert request.get_header('If-modified-since') == 'Sun, 20 Oct 2015 23:29:00 GMT'
+
+
+def test_not_modified(mocker):
+    mocker.patch('urllib.request.urlopen')
+    urllib.request.urlopen.side_effect = urllib.error.HTTPError('http://example.com', 304, 'Not Modified', {}, None)
+
+    response = fetch_url_if_modified('http://example.com', '"v1"', None)
+    assert response.content is None
+    assert response.etag == '"v1"'
+    assert response.last_modified is None
+
+
+def test_first_request_is_not_conditional(mocker):
+    mocker.patch('urllib.request.urlopen')
+    urlopen_return_mock = MagicMock()
+    urlopen_return_mock.read.return_value = b'content'
+    urlopen_return_mock.info.return_value = {}
+    urllib.request.urlopen.return_value = urlopen_return_mock
+
+    response = fetch_url_if_modified('http://example.com')
+    assert response.content == b'content'
+    assert response.etag is None
+
+    request = urllib.request.urlopen.call_args[0][0]
+    assert not request.has_header('If-none-match')
+    assert not request.has_header('If-modified-since')
+
+
+def test_other_errors_are_raised(mocker):
+    mocker.patch('urllib.request.urlopen')
+    urllib.request.urlopen.side_effect = urllib.error.HTTPError('http://example.com', 500, 'Error', {}, None)
+
+    with pytest.raises(urllib.error.HTTPError):
+        fetch_url_if_modified('http://example.com', '"v1"')
@@ -0,0 +1,38 @@
+from brioa_port.util.revisions import apply_deltas, find_deltas
+
+
+ROWS = [
+    # date_retrieved, Viagem, ETS, ATS
+    ('2010-01-01', 'A1', '2010-01-05', None),
+    ('2010-01-02', 'A1', '2010-01-06', None),
+    ('2010-01-03', 'A1', '2010-01-06', '2010-01-06'),
+    ('2010-01-01', 'B1', '2010-01-07', None),
+]
+
+
+def test_first_rows_and_changes() -> None:
+    base_rows, deltas = find_deltas(ROWS, 1, {0}, set())
+    assert base_rows == [ROWS[0], ROWS[3]]
+    assert deltas == [
+        ('A1', 1, 0, '2010-01-02'),
+        ('A1', 2, 0, '2010-01-03'),
+        ('A1', 1, 2, '2010-01-06'),
+        ('A1', 2, 3, '2010-01-06'),
+    ]
+
+
+def test_excluded_columns() -> None:
+    _, deltas = find_deltas(ROWS, 1, set(), {0, 2, 3})
+    assert deltas == []
+
+
+def test_apply_deltas_restores_rows() -> None:
+    base_rows, deltas = find_deltas(ROWS, 1, {0}, set())
+    trip_deltas = sorted((revision, column_id, value) for trip_name, revision, column_id, value in deltas
+                         if trip_name == 'A1')
+    assert apply_deltas(base_rows[0], trip_deltas) == ROWS[:3]
+    assert apply_deltas(base_rows[1], []) == ROWS[3:]
+
+
+def test_no_rows() -> None:
+    assert find_deltas([], 1, {0}, set()) == ([], [])
@@ -0,0 +1,15 @@
+from datetime import datetime
+
+from brioa_port.util.datetime import get_epoch_seconds_from_naive_datetime
+
+
+def test_epoch() -> None:
+    assert get_epoch_seconds_from_naive_datetime(datetime(1970, 1, 1, 0, 0, 0)) == 0
+
+
+def test_date() -> None:
+    assert get_epoch_seconds_from_naive_datetime(datetime(2015, 10, 21, 23, 29, 0)) == 1445470140
+
+
+def test_microseconds_are_dropped() -> None:
+    assert get_epoch_seconds_from_naive_datetime(datetime(2015, 10, 21, 23, 29, 0, 999999)) == 1445470140
@@ -0,0 +1,28 @@
+from brioa_port.util.cache import LRUCache
+
+
+def test_hits_and_misses() -> None:
+    cache: LRUCache[int] = LRUCache(2)
+    assert cache.get_or_compute('a', lambda: 1) == 1
+    assert cache.get_or_compute('a', lambda: 2) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_is_discarded() -> None:
+    cache: LRUCache[int] = LRUCache(2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.get_or_compute('b', lambda: 2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.get_or_compute('c', lambda: 3)
+    assert len(cache) == 2
+    assert cache.get_or_compute('a', lambda: 4) == 1
+    assert cache.get_or_compute('b', lambda: 5) == 5
+
+
+def test_clear_keeps_counters() -> None:
+    cache: LRUCache[int] = LRUCache(2)
+    cache.get_or_compute('a', lambda: 1)
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.get_or_compute('a', lambda: 2) == 2
+    assert (cache.hits, cache.misses) == (0, 2)
@@ -0,0 +1,51 @@
+import pytest
+
+from typing import Iterator, List
+
+from brioa_port.util.pool import map_in_processes
+
+_offset = 0
+
+
+def _set_offset(offset: int) -> None:
+    global _offset
+    _offset = offset
+
+
+def _add_offset(x: int) -> int:
+    if x < 0:
+        raise ValueError(f'{x} is negative')
+    return x + _offset
+
+
+def test_results_are_in_order() -> None:
+    results = [(x, f.result()) for x, f in map_in_processes(_add_offset, range(20), 3)]
+    assert results == [(x, x) for x in range(20)]
+
+
+def test_initializer_runs_in_each_process() -> None:
+    results = [f.result() for _, f in map_in_processes(_add_offset, range(5), 2, _set_offset, (100,))]
+    assert results == [100, 101, 102, 103, 104]
+
+
+def test_errors_are_left_to_the_caller() -> None:
+    futures = [f for _, f in map_in_processes(_add_offset, [1, -1, 2], 2)]
+    assert futures[0].result() == 1
+    with pytest.raises(ValueError):
+        futures[1].result()
+    assert futures[2].result() == 2
+
+
+def test_only_a_few_items_are_submitted_ahead() -> None:
+    read: List[int] = []
+
+    def items() -> Iterator[int]:
+        for x in range(100):
+            read.append(x)
+            yield x
+
+    for x, future in map_in_processes(_add_offset, items(), 2):
+        # Two per worker, counting the one being returned.
+        assert len(read) <= x + 4
+        future.result()
+    assert len(read) == 100
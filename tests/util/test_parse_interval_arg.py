@@ -0,0 +1,25 @@
+import pytest
+
+from datetime import timedelta
+
+from brioa_port.util.args import parse_interval_arg
+
+
+def test_valid_intervals() -> None:
+    assert parse_interval_arg('90') == timedelta(seconds=90)
+    assert parse_interval_arg('90s') == timedelta(seconds=90)
+    assert parse_interval_arg('10m') == timedelta(minutes=10)
+    assert parse_interval_arg('1.5h') == timedelta(minutes=90)
+    assert parse_interval_arg('1d') == timedelta(days=1)
+
+
+def test_non_positive_intervals() -> None:
+    for arg in ['0', '-1m', 'nan', 'inf']:
+        with pytest.raises(ValueError):
+            assert parse_interval_arg(arg)
+
+
+def test_invalid_intervals() -> None:
+    for arg in ['', 'm', '10 minutes', '1w']:
+        with pytest.raises(ValueError):
+            assert parse_interval_arg(arg)
@@ -0,0 +1,17 @@
+import pytest
+
+from brioa_port.util.args import parse_stride_arg
+
+
+def test_valid_stride() -> None:
+    assert parse_stride_arg('10') == 10
+
+
+def test_non_positive_stride() -> None:
+    with pytest.raises(ValueError):
+        assert parse_stride_arg('0')
+
+
+def test_non_numeric_stride() -> None:
+    with pytest.raises(ValueError):
+        assert parse_stride_arg('2.5')
@@ -0,0 +1,17 @@
+import pytest
+
+from brioa_port.util.args import parse_workers_arg
+
+
+def test_valid_workers() -> None:
+    assert parse_workers_arg('16') == 16
+
+
+def test_no_workers() -> None:
+    with pytest.raises(ValueError):
+        assert parse_workers_arg('0')
+
+
+def test_non_numeric_workers() -> None:
+    with pytest.raises(ValueError):
+        assert parse_workers_arg('all')